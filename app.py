@@ -3,41 +3,19 @@ from database import db
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from apscheduler.schedulers.background import BackgroundScheduler
 import os
+import signal
 import sys
 
 
 import logging
-from logging.handlers import RotatingFileHandler
+from logging_config import configure_logging
 
-# Configure logging with rotation
-# Remove any existing handlers
-logging.getLogger().handlers = []
-
-# Create formatters
-file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_formatter = logging.Formatter('%(levelname)s: %(message)s')
-
-# App log handler (INFO and above) - 10MB max, 5 backups
-app_handler = RotatingFileHandler('app.log', maxBytes=10*1024*1024, backupCount=5)
-app_handler.setLevel(logging.INFO)
-app_handler.setFormatter(file_formatter)
-
-# Error log handler (ERROR only) - 10MB max, 5 backups
-error_handler = RotatingFileHandler('error.log', maxBytes=10*1024*1024, backupCount=5)
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(file_formatter)
-
-# Console handler for development
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(console_formatter)
-
-# Configure root logger
-logging.basicConfig(level=logging.INFO, handlers=[app_handler, error_handler, console_handler])
+# Configure logging with rotation (LOG_FORMAT / LOG_QUEUE select JSON lines and
+# the background writer thread)
+log_listener = configure_logging()
 
 app = Flask(__name__)
-app.logger.addHandler(app_handler)
-app.logger.addHandler(error_handler)
+# app.logger propagates to the root handlers configured above
 app.logger.setLevel(logging.INFO)
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'INSECURE-CHANGE-ME-IN-PRODUCTION')
@@ -105,8 +83,13 @@ def restart_server():
         # Exit with code 0 (clean exit) to ensure Docker restart policy works
         # Docker will restart the container with restart policies like 'unless-stopped' or 'always'
         # On bare metal, you'll need to use a process manager like systemd or supervisor
+        master_pid = app.config.get('SERVER_MASTER_PID')
         def shutdown():
-            os._exit(0)
+            if master_pid:
+                # gunicorn would only replace this worker: stop the whole server instead
+                os.kill(master_pid, signal.SIGTERM)
+            else:
+                os._exit(0)
         
         # Schedule shutdown after response is sent
         from threading import Timer
@@ -117,79 +100,201 @@ def restart_server():
         flash(f'Error restarting server: {str(e)}', 'error')
         return redirect(url_for('settings'))
 
-scheduler = BackgroundScheduler()
+# The access check job is kept in the database so that its next run time
+# survives restarts: runs missed while the app was down are made up once at
+# start (coalesced) if they are no later than SCHEDULER_MISFIRE_GRACE_TIME.
+# Jobs rebuilt on every start (transitions, settings sync) stay in memory.
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+import scheduler_jobs
+SCHEDULER_MISFIRE_GRACE_TIME = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_TIME', 24 * 3600))
+scheduler = BackgroundScheduler(
+    jobstores={
+        'default': SQLAlchemyJobStore(url=app.config['SQLALCHEMY_DATABASE_URI'], tablename='apscheduler_jobs'),
+        'memory': MemoryJobStore(),
+    },
+    job_defaults={
+        'misfire_grace_time': SCHEDULER_MISFIRE_GRACE_TIME,
+        'coalesce': True,
+        'max_instances': 1,
+    },
+)
+
+from jobs import JobRunner
+job_runner = JobRunner(app)
+from transitions import TransitionScheduler
+transitions = TransitionScheduler(scheduler, app, job_runner)
+# With several worker processes only the one holding scheduler.lock runs the
+# scheduler; the others keep retrying in case it exits
+from scheduler_leader import FileLock, SchedulerLeader
+SCHEDULER_SETTINGS_POLL = int(os.environ.get('SCHEDULER_SETTINGS_POLL', 30))
+applied_scheduler_settings = None
 
 def run_schedule():
     with app.app_context():
-        from plex_service import check_schedules
-        check_schedules()
+        # Through the job queue, so it never overlaps a manual run
+        job, _ = job_runner.enqueue('check_schedules', created_by='scheduler')
+        job_id = job.id
+    job_runner.wait(job_id)
+
+scheduler_jobs.register('run_schedule', run_schedule)
 
 def get_scheduler_settings():
     """Get scheduler settings from database with defaults"""
     with app.app_context():
-        from models import Settings
-        
-        scheduler_type = Settings.query.filter_by(key='scheduler_type').first()
-        interval_minutes = Settings.query.filter_by(key='scheduler_interval_minutes').first()
-        daily_time = Settings.query.filter_by(key='scheduler_daily_time').first()
-        
         return {
-            'type': scheduler_type.value if scheduler_type else 'interval',
-            'interval_minutes': int(interval_minutes.value) if interval_minutes else 60,
-            'daily_time': daily_time.value if daily_time else '03:00'
+            'type': get_setting('scheduler_type', 'interval'),
+            'interval_minutes': int(get_setting('scheduler_interval_minutes', 60)),
+            'daily_time': get_setting('scheduler_daily_time', '03:00')
         }
 
 def configure_scheduler():
     """Configure scheduler based on database settings"""
+    global applied_scheduler_settings
     settings = get_scheduler_settings()
-    
-    # Remove existing job if it exists
-    if scheduler.get_job('access_check_job'):
-        scheduler.remove_job('access_check_job')
+    applied_scheduler_settings = settings
     
     # Add job based on type
+    if settings['type'] == 'event':
+        # Reconcile once to catch up on anything missed while stopped, then
+        # only run when a share actually starts or expires
+        scheduler.add_job(
+            func='scheduler_jobs:run_schedule',
+            trigger='date',
+            id='access_check_job',
+            replace_existing=True,
+            misfire_grace_time=None
+        )
+        transitions.start()
+        app.logger.info("Scheduler configured for event-driven execution on share start/expiration dates")
+        return
+    
+    transitions.stop()
     if settings['type'] == 'daily':
         # Parse time string (HH:MM)
         hour, minute = map(int, settings['daily_time'].split(':'))
-        scheduler.add_job(
-            func=run_schedule,
-            trigger='cron',
-            hour=hour,
-            minute=minute,
-            id='access_check_job'
-        )
-        app.logger.info(f"Scheduler configured for daily execution at {settings['daily_time']}")
+        trigger = CronTrigger(hour=hour, minute=minute)
+        description = f"daily execution at {settings['daily_time']}"
     else:
         # Interval mode
+        trigger = IntervalTrigger(minutes=settings['interval_minutes'])
+        description = f"interval execution every {settings['interval_minutes']} minutes"
+    
+    job = scheduler.get_job('access_check_job')
+    if job and str(job.trigger) == str(trigger):
+        # Keep the stored next run time, so a run that was due while the
+        # app was stopped still happens
+        app.logger.info(f"Scheduler keeps {description}, next run at {job.next_run_time}")
+        return
+    scheduler.add_job(
+        func='scheduler_jobs:run_schedule',
+        trigger=trigger,
+        id='access_check_job',
+        replace_existing=True
+    )
+    app.logger.info(f"Scheduler configured for {description}")
+
+def get_next_run():
+    """Next scheduled reconciliation, also known to workers that do not run the scheduler"""
+    if scheduler.running:
+        job = scheduler.get_job('access_check_job') or scheduler.get_job(TransitionScheduler.JOB_ID)
+        return job.next_run_time if job else None
+    from datetime import datetime
+    value = get_setting('scheduler_next_run')
+    return datetime.fromisoformat(value) if value else None
+
+def publish_next_run():
+    next_run = get_next_run()
+    value = next_run.isoformat() if next_run else ''
+    if get_setting('scheduler_next_run', '') != value:
+        update_setting('scheduler_next_run', value)
+
+def sync_scheduler_state():
+    """Pick up changes saved by other workers: scheduler settings and edited shares"""
+    with app.app_context():
+        if get_scheduler_settings() != applied_scheduler_settings:
+            app.logger.info("Scheduler settings changed, reconfiguring")
+            configure_scheduler()
+        else:
+            transitions.refresh()
+        publish_next_run()
+
+def start_scheduler():
+    """Start the scheduler in this process (called once it is elected leader)"""
+    # Paused until configured: configure_scheduler needs the stored jobs, and
+    # due runs must not start before the access check job is up to date
+    scheduler.start(paused=True)
+    try:
+        configure_scheduler()
         scheduler.add_job(
-            func=run_schedule,
+            func=sync_scheduler_state,
             trigger='interval',
-            minutes=settings['interval_minutes'],
-            id='access_check_job'
+            seconds=SCHEDULER_SETTINGS_POLL,
+            id='scheduler_sync_job',
+            jobstore='memory',
+            replace_existing=True
         )
-        app.logger.info(f"Scheduler configured for interval execution every {settings['interval_minutes']} minutes")
-
-# Initialize scheduler with settings
-# configure_scheduler()
-# scheduler.start()
-
-from models import User, Settings, PlexUser, Library, Share
-
-def get_setting(key, default=None):
-    """Get a setting value from the database"""
-    setting = Settings.query.filter_by(key=key).first()
-    if setting:
-        return setting.value
-    return default
-
-def update_setting(key, value):
-    """Update or create a setting in the database"""
-    setting = Settings.query.filter_by(key=key).first()
-    if not setting:
-        setting = Settings(key=key)
-        db.session.add(setting)
-    setting.value = value
-    db.session.commit()
+        scheduler.resume()
+        with app.app_context():
+            publish_next_run()
+    except Exception:
+        # The leader lock is released next: another worker (or a retry here)
+        # must be able to start the only running scheduler
+        scheduler.shutdown(wait=False)
+        raise
+
+scheduler_leader = SchedulerLeader(os.path.join(os.path.dirname(db_path), 'scheduler.lock'), start_scheduler)
+
+# Metrics (see metrics.py). Each worker records its own; wsgi.py starts the
+# store that lets /metrics add up every worker's values
+import time
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import (DB_QUERIES, REQUEST_DB_QUERIES, REQUEST_LATENCY, SCHEDULER_LAG,
+                     SCHEDULER_MISSED, MetricsStore)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+metrics_store = MetricsStore()
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint,
+                                method=request.method, status=response.status_code)
+        REQUEST_DB_QUERIES.observe(g.get('db_queries', 0), endpoint=endpoint)
+    return response
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_db_query(conn, cursor, statement, parameters, context, executemany):
+    words = statement.split(None, 1)
+    DB_QUERIES.inc(operation=words[0].upper() if words else '')
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+
+def record_scheduler_event(scheduler_event):
+    """Lag between a job's scheduled time and its submission to the executor"""
+    if scheduler_event.code == EVENT_JOB_MISSED:
+        SCHEDULER_MISSED.inc(job=scheduler_event.job_id)
+        return
+    from datetime import datetime, timezone
+    lag = (datetime.now(timezone.utc) - scheduler_event.scheduled_run_times[0]).total_seconds()
+    SCHEDULER_LAG.observe(max(lag, 0.0), job=scheduler_event.job_id)
+
+scheduler.add_listener(record_scheduler_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+
+from models import User, PlexUser, Library, Share, Job
+# Settings are served from a write-through in-process cache
+from settings_store import get_setting, update_setting, update_settings
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -228,13 +333,56 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    users = PlexUser.query.all()
-    libraries = Library.query.all()
+    from user_search import search_plex_users
     
-    job = scheduler.get_job('access_check_job')
-    next_run = job.next_run_time if job else None
+    listing = get_user_listing_args()
+    pagination = search_plex_users(**listing)
+    # Libraries for the bulk access panel
+    libraries = Library.query.order_by(Library.title).all() if current_user.can_edit_libraries() else []
+    
+    return render_template('dashboard.html', users=pagination.items, pagination=pagination,
+                           listing=listing, libraries=libraries, next_run=get_next_run())
+
+@app.route('/api/plex_users/search', methods=['GET'])
+@auditor_required
+def api_plex_users_search():
+    """Typeahead API endpoint matching the start of username or email words"""
+    from flask import jsonify
+    from user_search import TYPEAHEAD_LIMIT, plex_user_to_dict, typeahead_plex_users
+    
+    term = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), 1), 50)
+    return jsonify({'users': [plex_user_to_dict(user) for user in typeahead_plex_users(term, limit)]})
+
+def get_user_listing_args():
+    """Search, sort and page parameters for the Plex user listing"""
+    from user_search import DEFAULT_PER_PAGE
+    
+    return {
+        'search': request.args.get('q', '').strip(),
+        'sort': request.args.get('sort', 'username'),
+        'order': 'desc' if request.args.get('order') == 'desc' else 'asc',
+        'page': max(request.args.get('page', 1, type=int), 1),
+        'per_page': request.args.get('per_page', DEFAULT_PER_PAGE, type=int),
+    }
+
+@app.route('/api/plex_users', methods=['GET'])
+@auditor_required
+def api_plex_users():
+    """API endpoint returning one page of Plex users (same parameters as the dashboard)"""
+    from flask import jsonify
+    from user_search import plex_user_to_dict, search_plex_users
     
-    return render_template('dashboard.html', users=users, libraries=libraries, next_run=next_run)
+    listing = get_user_listing_args()
+    pagination = search_plex_users(**listing)
+    return jsonify({
+        'users': [plex_user_to_dict(user) for user in pagination.items],
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'has_next': pagination.has_next,
+    })
 
 def update_server_settings():
     try:
@@ -242,9 +390,12 @@ def update_server_settings():
         https_enabled = 'https_enabled' in request.form
         ssl_type = request.form.get('ssl_type')
         
-        update_setting('server_port', server_port)
-        update_setting('https_enabled', 'true' if https_enabled else 'false')
-        update_setting('ssl_type', ssl_type)
+        # Collected and saved in one transaction at the end
+        values = {
+            'server_port': server_port,
+            'https_enabled': 'true' if https_enabled else 'false',
+            'ssl_type': ssl_type,
+        }
         
         if https_enabled:
             cert_dir = os.path.join(app.root_path, 'certs')
@@ -257,12 +408,12 @@ def update_server_settings():
                 if cert_file and cert_file.filename:
                     cert_path = os.path.join(cert_dir, 'custom.crt')
                     cert_file.save(cert_path)
-                    update_setting('ssl_cert_path', cert_path)
+                    values['ssl_cert_path'] = cert_path
                     
                 if key_file and key_file.filename:
                     key_path = os.path.join(cert_dir, 'custom.key')
                     key_file.save(key_path)
-                    update_setting('ssl_key_path', key_path)
+                    values['ssl_key_path'] = key_path
             else:
                 # Generate self-signed if needed
                 cert_path = os.path.join(cert_dir, 'selfsigned.crt')
@@ -272,8 +423,10 @@ def update_server_settings():
                     from ssl_utils import generate_self_signed_cert
                     generate_self_signed_cert(cert_path, key_path)
                 
-                update_setting('ssl_cert_path', cert_path)
-                update_setting('ssl_key_path', key_path)
+                values['ssl_cert_path'] = cert_path
+                values['ssl_key_path'] = key_path
+        
+        update_settings(values)
         
         flash('Server settings updated. Please restart the application to apply changes.', 'success')
     except Exception as e:
@@ -286,12 +439,19 @@ def update_scheduler_settings():
     interval = request.form.get('scheduler_interval_minutes')
     daily_time = request.form.get('scheduler_daily_time')
     
-    update_setting('scheduler_type', scheduler_type)
-    update_setting('scheduler_interval_minutes', interval)
-    update_setting('scheduler_daily_time', daily_time)
+    update_settings({
+        'scheduler_type': scheduler_type,
+        'scheduler_interval_minutes': interval,
+        'scheduler_daily_time': daily_time,
+    })
     
-    configure_scheduler()
-    flash('Scheduler settings updated successfully', 'success')
+    if scheduler_leader.is_leader:
+        configure_scheduler()
+        publish_next_run()
+        flash('Scheduler settings updated successfully', 'success')
+    else:
+        # Another worker runs the scheduler and reloads its settings periodically
+        flash('Scheduler settings saved. They will be applied within a minute.', 'success')
     return redirect(url_for('settings'))
 
 @app.route('/settings', methods=['GET', 'POST'])
@@ -319,8 +479,10 @@ def settings():
         plex_token = request.form.get('plex_token')
         
         if plex_url and plex_token:
-            update_setting('plex_url', plex_url)
-            update_setting('plex_token', plex_token)
+            update_settings({'plex_url': plex_url, 'plex_token': plex_token})
+            # Drop the cached Plex connection so the new credentials apply immediately
+            from plex_client import plex_clients
+            plex_clients.invalidate()
             flash('Plex settings updated successfully', 'success')
         
         return redirect(url_for('settings'))
@@ -407,40 +569,162 @@ def change_password():
 @admin_required
 def run_scheduler():
     """Manual trigger for scheduler - for debugging purposes"""
-    from plex_service import check_schedules
-    try:
-        check_schedules()
-        flash('Scheduler executed successfully', 'success')
-    except Exception as e:
-        flash(f'Scheduler failed: {str(e)}', 'error')
-    return redirect(url_for('settings'))
+    job, created = job_runner.enqueue('check_schedules', created_by=current_user.username)
+    if created:
+        flash(f'Scheduler run started (job #{job.id}).', 'info')
+    else:
+        flash(f'A scheduler run is already in progress (job #{job.id}).', 'info')
+    return redirect(url_for('settings', job=job.id))
 
 @app.route('/sync_plex', methods=['POST'])
 @moderator_required
 def sync_plex():
-    from plex_service import sync_plex_data
-    success, message = sync_plex_data()
-    if success:
-        flash(message, 'success')
+    job, created = job_runner.enqueue('sync_plex', created_by=current_user.username)
+    if created:
+        flash(f'Plex sync started (job #{job.id}).', 'info')
     else:
-        flash(f'Error: {message}', 'error')
-    return redirect(url_for('dashboard'))
+        flash(f'A Plex sync is already in progress (job #{job.id}).', 'info')
+    return redirect(url_for('dashboard', job=job.id))
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@auditor_required
+def job_status(job_id):
+    """API endpoint reporting the status, progress and result of a background job"""
+    from flask import jsonify
+    from jobs import job_to_dict
+    
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_dict(job, job_runner.live_progress(job_id)))
+
+@app.route('/api/access/bulk', methods=['POST'])
+@moderator_required
+def bulk_access():
+    """Grant, revoke or set the date window of libraries for many users, then push to Plex"""
+    from flask import jsonify
+    from plex_service import BULK_ACTIONS, apply_bulk_access
+    from datetime import datetime
+    
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in BULK_ACTIONS:
+        return jsonify({'error': f'Invalid action. Use one of: {", ".join(BULK_ACTIONS)}'}), 400
+    try:
+        user_ids = [int(user_id) for user_id in data.get('user_ids') or []]
+        library_ids = [int(library_id) for library_id in data.get('library_ids') or []]
+        dates = {
+            name: datetime.strptime(data[name], '%Y-%m-%d') if data.get(name) else None
+            for name in ('start_date', 'expiration_date')
+        }
+    except (TypeError, ValueError):
+        return jsonify({'error': 'user_ids and library_ids must be lists of ids, dates YYYY-MM-DD'}), 400
+    if not user_ids or not library_ids:
+        return jsonify({'error': 'Select at least one user and one library'}), 400
+    
+    # All share changes in one transaction
+    try:
+        user_ids, written = apply_bulk_access(user_ids, library_ids, action, **dates)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f'Bulk {action} failed: {str(e)}')
+        return jsonify({'error': f'Bulk update failed: {str(e)}'}), 500
+    app.logger.info(f'Bulk {action} by {current_user.username}: {written} shares for {len(user_ids)} users')
+    transitions.notify_users_changed(user_ids)
+    
+    # One parallel Plex push for every affected user, reported per user by the job
+    job, _ = job_runner.enqueue('reconcile_users', {'user_ids': user_ids}, dedupe=False,
+                                created_by=current_user.username)
+    return jsonify({
+        'action': action,
+        'shares_written': written,
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id),
+    }), 202
+
+thumbnail_cache = None
+
+def get_thumbnail_cache():
+    global thumbnail_cache
+    if thumbnail_cache is None:
+        from thumbs import ThumbnailCache
+        thumbnail_cache = ThumbnailCache(os.path.join(os.path.dirname(db_path), 'thumbs'))
+    return thumbnail_cache
+
+@app.template_global()
+def thumb_url(plex_user):
+    """Cacheable URL of a Plex user's avatar (changes when the avatar does)"""
+    from thumbs import thumb_version
+    return url_for('thumb', plex_user_id=plex_user.id, v=thumb_version(plex_user.thumb))
+
+@app.route('/thumb/<int:plex_user_id>')
+@login_required
+def thumb(plex_user_id):
+    """Serve a Plex user's avatar from the local cache"""
+    from flask import send_file
+    from thumbs import THUMB_TTL
+    
+    user = db.session.get(PlexUser, plex_user_id)
+    if not user or not user.thumb:
+        abort(404)
+    cached = get_thumbnail_cache().get(user.id, user.thumb)
+    if not cached:
+        abort(404)
+    path, meta = cached
+    # thumb_url() puts a version in the query string, so browsers can keep the image
+    max_age = 365 * 24 * 3600 if request.args.get('v') else THUMB_TTL
+    response = send_file(path, mimetype=meta['content_type'], max_age=max_age, conditional=True,
+                         etag=meta['digest'], last_modified=meta['fetched_at'])
+    response.cache_control.private = True
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of every worker process"""
+    import hmac
+    from flask import Response
+    
+    # Scraped without a session; set METRICS_TOKEN to require a bearer token
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                  f'Bearer {METRICS_TOKEN}'.encode()):
+        abort(401)
+    return Response(metrics_store.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/sync/summary', methods=['GET'])
+@auditor_required
+def sync_summary():
+    """API endpoint describing what changed in the most recent Plex sync"""
+    from flask import jsonify
+    from plex_service import get_last_sync_summary
+    
+    summary = get_last_sync_summary()
+    if not summary:
+        return jsonify({'error': 'No sync has completed yet'}), 404
+    return jsonify(summary)
 
 @app.route('/user/<int:user_id>', methods=['GET', 'POST'])
 @auditor_required
 def user_details(user_id):
     user = PlexUser.query.get_or_404(user_id)
     libraries = Library.query.all()
+    # One query instead of a lookup per library
+    shares = {share.library_id: share for share in Share.query.filter_by(plex_user_id=user.id)}
     
     if request.method == 'POST':
         if not current_user.can_edit_libraries():
             flash('Access denied. Moderator privileges required to edit access.', 'error')
             return redirect(url_for('user_details', user_id=user.id))
             
-        from plex_service import update_user_access
+        from plex_service import (update_user_access, record_applied_access, access_fingerprint,
+                                  mark_not_applied, NOT_APPLIED_MESSAGE)
+        from sqlalchemy import insert, update
         from datetime import datetime
         
         active_library_keys = []
+        new_shares = []
+        changed_shares = []
+        now = datetime.now()
         
         for lib in libraries:
             is_checked = request.form.get(f'library_{lib.id}') == 'on'
@@ -450,19 +734,16 @@ def user_details(user_id):
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
             expiration_date = datetime.strptime(expiration_date_str, '%Y-%m-%d') if expiration_date_str else None
             
-            # Update Share model
-            share = Share.query.filter_by(plex_user_id=user.id, library_id=lib.id).first()
+            # Only write shares whose values differ from what is stored
+            values = {'is_active': is_checked, 'start_date': start_date, 'expiration_date': expiration_date}
+            share = shares.get(lib.id)
             if not share:
-                share = Share(plex_user_id=user.id, library_id=lib.id)
-                db.session.add(share)
-            
-            share.is_active = is_checked
-            share.start_date = start_date
-            share.expiration_date = expiration_date
+                new_shares.append({'plex_user_id': user.id, 'library_id': lib.id, **values})
+            elif any(getattr(share, column) != value for column, value in values.items()):
+                changed_shares.append({'id': share.id, **values})
             
             # Determine if we should share this library with Plex NOW
             # Logic: If is_active AND (start_date is None OR start_date <= now) AND (expiration_date is None OR expiration_date > now)
-            now = datetime.now()
             should_share = is_checked
             if start_date and start_date > now:
                 should_share = False
@@ -472,86 +753,77 @@ def user_details(user_id):
             if should_share:
                 active_library_keys.append(lib.plex_key)
         
-        db.session.commit()
+        if new_shares or changed_shares:
+            if new_shares:
+                db.session.execute(insert(Share), new_shares)
+            if changed_shares:
+                db.session.execute(update(Share), changed_shares)
+            db.session.commit()
+            transitions.notify_user_changed(user.id)
         
         # Update Plex
-        success, message = update_user_access(user.plex_id, active_library_keys)
-        if success:
+        from tracing import trace_calls, trace_subject
+        with trace_calls(f'access update of {user.username}') as trace, trace_subject(user.plex_id):
+            success, message = update_user_access(user.plex_id, active_library_keys)
+        app.logger.info(trace.describe())
+        if success and not active_library_keys:
+            # Libraries pushed earlier stay shared on Plex
+            if user.applied_access and user.applied_access.fingerprint != access_fingerprint([]):
+                mark_not_applied([user.id])
+                db.session.commit()
+                flash(f'Local saved. {NOT_APPLIED_MESSAGE}.', 'warning')
+            else:
+                flash(message, 'success')
+        elif success:
+            record_applied_access(user.id, active_library_keys)
+            db.session.commit()
             flash('Access updated successfully on Plex.', 'success')
         else:
             flash(f'Local saved, but Plex update failed: {message}', 'error')
             
         return redirect(url_for('user_details', user_id=user.id))
         
-    return render_template('user_details.html', user=user, libraries=libraries)
+    return render_template('user_details.html', user=user, libraries=libraries, shares=shares)
 
 
 # Log Management Helper Functions
+# Seconds between keep-alive comments on idle /api/logs/stream connections
+LOG_STREAM_HEARTBEAT = 15
+
+
 def parse_log_file(filename, max_lines=100, level_filter=None):
-    """Parse log file and return recent entries with optional level filtering"""
-    import os
-    from collections import deque
-    
-    if not os.path.exists(filename):
-        return []
-    
-    log_entries = deque(maxlen=max_lines)
+    """Return the most recent log entries, reading the file backwards from the end"""
+    from log_reader import tail_log
     
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Apply level filter if specified
-                if level_filter:
-                    if f' - {level_filter} - ' not in line:
-                        continue
-                
-                # Parse log line
-                try:
-                    parts = line.split(' - ', 3)
-                    if len(parts) >= 4:
-                        timestamp = parts[0]
-                        logger_name = parts[1]
-                        level = parts[2]
-                        message = parts[3]
-                        
-                        log_entries.append({
-                            'timestamp': timestamp,
-                            'logger': logger_name,
-                            'level': level,
-                            'message': message
-                        })
-                    else:
-                        # Fallback for malformed lines
-                        log_entries.append({
-                            'timestamp': '',
-                            'logger': '',
-                            'level': 'UNKNOWN',
-                            'message': line
-                        })
-                except Exception:
-                    # If parsing fails, add as raw message
-                    log_entries.append({
-                        'timestamp': '',
-                        'logger': '',
-                        'level': 'UNKNOWN',
-                        'message': line
-                    })
-        
-        return list(log_entries)
+        return tail_log(filename, max_lines=max_lines, level_filter=level_filter)
     except Exception as e:
         app.logger.error(f'Error reading log file {filename}: {str(e)}')
         return []
 
 
+def query_log_index(filename, start=None, end=None, level_filter=None, cursor=None, max_lines=100):
+    """Return (entries, next_cursor) for a time range across the log and its rotated backups"""
+    from log_index import InvalidCursor, get_log_index
+    
+    try:
+        return get_log_index(filename).query(start=start, end=end, level=level_filter,
+                                              cursor=cursor, limit=max_lines)
+    except InvalidCursor:
+        raise
+    except Exception as e:
+        app.logger.error(f'Error querying log index for {filename}: {str(e)}')
+        return [], None
+
+
 @app.route('/api/logs', methods=['GET'])
 @auditor_required
 def get_logs():
     """API endpoint to get recent log entries"""
     from flask import jsonify
+    from datetime import datetime, timezone
+    from werkzeug.http import is_resource_modified
+    import re
     
     # Get query parameters
     log_file = request.args.get('file', 'app')  # 'app' or 'error'
@@ -568,18 +840,95 @@ def get_logs():
     if level and level not in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']:
         return jsonify({'error': 'Invalid log level'}), 400
     
+    # Optional time range (server local time, like the log timestamps) and paging cursor
+    time_range = {}
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if value:
+            try:
+                time_range[name] = datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                return jsonify({'error': f'Invalid "{name}" time, use ISO 8601 (YYYY-MM-DDTHH:MM:SS)'}), 400
+    cursor = request.args.get('cursor')
+    if cursor and not re.match(r'^\d+-\d+$', cursor):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    indexed = bool(time_range or cursor)
+    
     # Get log filename
     filename = f'{log_file}.log'
     
+    # Unchanged file and parameters: let the client reuse its copy
+    etag = None
+    last_modified = None
+    if os.path.exists(filename):
+        stat = os.stat(filename)
+        etag = f'{stat.st_size}-{stat.st_mtime_ns}-{log_file}-{level or "all"}-{lines}'
+        if indexed:
+            etag += f'-{time_range.get("from", "")}-{time_range.get("to", "")}-{cursor or ""}'
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+    
     # Parse and return logs
-    logs = parse_log_file(filename, max_lines=lines, level_filter=level)
+    payload = {'file': log_file, 'level_filter': level}
+    if indexed:
+        from log_index import InvalidCursor
+        try:
+            logs, next_cursor = query_log_index(filename, time_range.get('from'), time_range.get('to'),
+                                                level, cursor, lines)
+        except InvalidCursor:
+            return jsonify({'error': 'Cursor has expired because the log was rotated'}), 400
+        payload['next_cursor'] = next_cursor
+    else:
+        logs = parse_log_file(filename, max_lines=lines, level_filter=level)
+    payload.update(count=len(logs), logs=logs)
     
-    return jsonify({
-        'file': log_file,
-        'level_filter': level,
-        'count': len(logs),
-        'logs': logs
-    })
+    response = jsonify(payload)
+    if etag:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+    # Always revalidate so polling clients get 304s instead of stale data
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/logs/stream', methods=['GET'])
+@auditor_required
+def stream_logs():
+    """Server-sent events stream of new log entries (follows the file across rotations)"""
+    from flask import jsonify
+    from log_reader import follow_log
+    import json
+    
+    log_file = request.args.get('file', 'app')
+    level = request.args.get('level', None)
+    
+    if log_file not in ['app', 'error']:
+        return jsonify({'error': 'Invalid log file. Use "app" or "error"'}), 400
+    
+    if level and level not in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']:
+        return jsonify({'error': 'Invalid log level'}), 400
+    
+    filename = f'{log_file}.log'
+    
+    def generate():
+        # Ask EventSource to reconnect after 5 seconds if the connection drops
+        yield 'retry: 5000\n\n'
+        for entry in follow_log(filename, level_filter=level, heartbeat=LOG_STREAM_HEARTBEAT):
+            if entry is None:
+                # Comment line: keeps proxies from closing the idle connection
+                yield ': keep-alive\n\n'
+            else:
+                yield f'data: {json.dumps(entry)}\n\n'
+    
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disable response buffering in nginx-style reverse proxies
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @app.route('/api/logs/download', methods=['GET'])
@@ -690,14 +1039,23 @@ def delete_user(user_id):
     flash(f'User {user.username} deleted successfully', 'success')
     return redirect(url_for('users'))
 
-if __name__ == '__main__':
-    with app.app_context():
+def bootstrap():
+    """Create and migrate the database, fail interrupted jobs and add the default admin"""
+    # Every worker process runs this on start; the lock makes them take turns
+    with app.app_context(), FileLock(os.path.join(os.path.dirname(db_path), 'bootstrap.lock')):
         # Ensure instance directory exists before creating database
         instance_dir = os.path.join(app.root_path, 'instance')
         os.makedirs(instance_dir, exist_ok=True)
         
         db.create_all()
         
+        # Bring existing databases up to the current schema
+        from migrations import run_migrations
+        run_migrations(db.engine)
+        
+        # Jobs left running by a previous process will never finish
+        job_runner.recover()
+        
         # Create default admin user if it doesn't exist
         if not User.query.filter_by(username='admin').first():
             print("Creating default admin user...")
@@ -709,7 +1067,12 @@ if __name__ == '__main__':
             print("⚠️  IMPORTANT: Change the default password immediately!")
         else:
             print("✓ Admin user already exists")
-        
+
+# Development server. In production run the app through wsgi.py:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+if __name__ == '__main__':
+    bootstrap()
+    with app.app_context():
         # Get server config
         port = int(get_setting('server_port', '5000'))
         https_enabled = get_setting('https_enabled', 'false') == 'true'
@@ -724,8 +1087,8 @@ if __name__ == '__main__':
             else:
                 print("Warning: HTTPS enabled but certificates not found. Falling back to HTTP.")
 
-        # Initialize scheduler after database creation
-        configure_scheduler()
-        scheduler.start()
+    # The reloader runs this script twice; only its child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler_leader.start()
     
     app.run(host='0.0.0.0', port=port, ssl_context=ssl_context, debug=True)
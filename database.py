@@ -1,3 +1,63 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+import logging
+import os
+import re
+import sqlite3
 
 db = SQLAlchemy()
+
+logger = logging.getLogger(__name__)
+
+# Pragmas applied to every SQLite connection. WAL lets dashboard reads proceed
+# while the scheduler thread writes, and busy_timeout makes writers wait for
+# each other instead of failing with "database is locked".
+# Set SQLITE_JOURNAL_MODE=DELETE on filesystems without shared-memory support
+# (e.g. some network shares).
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'),  # milliseconds
+    'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-16000'),  # negative = KiB
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# Rows per multi-row INSERT, well below SQLite's bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection; other databases are left untouched"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if not value:
+                continue
+            if not _PRAGMA_VALUE.match(value):
+                logger.warning(f"Ignoring invalid value for SQLite pragma {name}: {value!r}")
+                continue
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def bulk_upsert(model, values, index_elements, set_):
+    """
+    Insert rows (dicts) into model's table in chunks (caller commits).
+
+    Rows conflicting on index_elements get the columns named in set_
+    overwritten with the values of the row being inserted.
+    """
+    for i in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = sqlite_insert(model).values(values[i:i + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={name: stmt.excluded[name] for name in set_},
+        )
+        db.session.execute(stmt)
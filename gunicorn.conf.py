@@ -0,0 +1,68 @@
+"""
+gunicorn settings for the production server:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Port and HTTPS certificates come from the settings saved in the web UI, like
+with the development server (python app.py).
+
+The master process writes and rotates app.log and error.log for every worker
+(see logging_config.start_log_writer).
+"""
+from contextlib import closing
+import os
+import sqlite3
+
+
+def saved_settings():
+    """Read the Settings table without importing the app into the master process"""
+    db_path = os.environ.get('DATABASE_PATH', '/app/instance/plex_manager.db')
+    if not os.path.exists(db_path):
+        return {}
+    try:
+        with closing(sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)) as conn:
+            return dict(conn.execute('SELECT key, value FROM settings'))
+    except sqlite3.Error:
+        return {}
+
+
+settings = saved_settings()
+
+bind = f"0.0.0.0:{settings.get('server_port') or os.environ.get('SERVER_PORT', '5000')}"
+# A few workers are plenty: Plex calls and jobs run on threads, and every
+# worker adds its own memory, caches and Plex connections
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Each worker has its own Plex rate limiter; they split PLEX_RATE_LIMIT
+os.environ['PLEX_RATE_PROCESSES'] = str(workers)
+# Threads keep slow Plex calls and live log streams from tying up a whole worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 120
+# Workers import the app themselves so each starts its own scheduler and job threads
+preload_app = False
+
+if settings.get('https_enabled') == 'true':
+    cert_path = settings.get('ssl_cert_path')
+    key_path = settings.get('ssl_key_path')
+    if cert_path and key_path and os.path.exists(cert_path) and os.path.exists(key_path):
+        certfile = cert_path
+        keyfile = key_path
+    else:
+        print("Warning: HTTPS enabled but certificates not found. Falling back to HTTP.")
+
+
+def on_starting(server):
+    import logging_config
+
+    server.log_writer = logging_config.start_log_writer()
+
+
+def on_exit(server):
+    import logging_config
+
+    logging_config.stop_listener(server.log_writer)
+
+
+def post_worker_init(worker):
+    # Lets the Restart button stop the server instead of only this worker
+    worker.wsgi.config['SERVER_MASTER_PID'] = worker.ppid
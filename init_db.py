@@ -1,10 +1,12 @@
 from app import app
 from database import db
 from models import User
+from migrations import run_migrations
 
 def init_db():
     with app.app_context():
         db.create_all()
+        run_migrations(db.engine)
         
         # Create default admin user if it doesn't exist
         if not User.query.filter_by(username='admin').first():
@@ -0,0 +1,366 @@
+"""
+DB-backed background jobs.
+
+Routes enqueue a Job row and return immediately; a bounded thread pool runs
+the registered handler inside an app context. Handlers get a JobProgress
+callable to report items processed and failures. Progress is kept in memory
+and written to the job row by a flusher thread about once a second, so a
+handler that holds an SQLite write transaction never waits on its own
+progress updates, and other processes can still read it.
+
+Jobs enqueued with a dedupe key (by default their type) are unique while
+queued or running. This is enforced by a partial unique index, so double
+clicks, the scheduler and other worker processes get the running job back
+instead of starting a second one. Jobs whose process died stop sending
+heartbeats and are marked failed by recover().
+"""
+from database import db
+from datetime import datetime, timedelta
+from models import Job
+from tracing import trace_calls
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+PROGRESS_FLUSH_INTERVAL = 1.0  # seconds
+HEARTBEAT_INTERVAL = timedelta(seconds=15)
+# Active jobs without a heartbeat for this long belong to a dead process
+STALE_AFTER = timedelta(seconds=90)
+# Seconds between reads of the job row when waiting for a job without a future
+WAIT_POLL_INTERVAL = 0.5
+
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    """Register a function(progress, **params) -> result dict as the handler of a job type"""
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+
+class JobError(Exception):
+    """Raised by handlers to fail a job with a message"""
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobProgress:
+    """Thread-safe progress counters of a running job"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.done = 0
+        self.total = None
+        self.failures = 0
+        self.message = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __call__(self, done=None, total=None, failures=None, message=None):
+        """Set any of the counters (absolute values)"""
+        with self._lock:
+            if done is not None:
+                self.done = done
+            if total is not None:
+                self.total = total
+            if failures is not None:
+                self.failures = failures
+            if message is not None:
+                self.message = message
+            self._dirty = True
+
+    def snapshot(self, clear=False):
+        with self._lock:
+            if clear:
+                self._dirty = False
+            return {'done': self.done, 'total': self.total, 'failures': self.failures, 'message': self.message}
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+
+class JobRunner:
+    """Executes queued jobs on a thread pool and tracks their progress"""
+
+    def __init__(self, app, max_workers=JOB_WORKERS):
+        self.app = app
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._futures = {}
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._last_heartbeat = datetime.min
+
+    def _ensure_started(self):
+        # Threads are created lazily so that forking servers start them in each worker
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+                self._stop.clear()
+                self._flusher = threading.Thread(target=self._flush_loop, name='job-progress', daemon=True)
+                self._flusher.start()
+
+    def enqueue(self, job_type, params=None, dedupe=True, created_by=None):
+        """Create and submit a job; returns (job, created), or the active duplicate with created=False"""
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job type: {job_type}")
+        for attempt in range(2):
+            now = datetime.now()
+            job = Job(type=job_type, dedupe_key=job_type if dedupe else None, status=Job.STATUS_QUEUED,
+                      params=json.dumps(params or {}), created_by=created_by, worker=worker_id(),
+                      created_at=now, heartbeat_at=now)
+            db.session.add(job)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                existing = Job.query.filter(
+                    Job.dedupe_key == job_type, Job.status.in_(Job.ACTIVE_STATUSES)
+                ).first()
+                if existing and not self._is_stale(existing, now):
+                    logger.info(f"Job {job_type} already active as #{existing.id}")
+                    return existing, False
+                # The holder died (or just finished): clear it and try once more
+                self.recover()
+                continue
+            self._submit(job.id)
+            logger.info(f"Queued job #{job.id} ({job_type})")
+            return job, True
+        raise RuntimeError(f"Could not enqueue job {job_type}")
+
+    def _submit(self, job_id):
+        self._ensure_started()
+        progress = JobProgress(job_id)
+        with self._lock:
+            self._progress[job_id] = progress
+            self._futures[job_id] = self._executor.submit(self._run, job_id, progress)
+
+    def _run(self, job_id, progress):
+        result = None
+        with self.app.app_context():
+            try:
+                result = self._execute(job_id, progress)
+            except Exception as e:
+                # Starting or finishing the job failed (e.g. database is locked)
+                logger.error(f"Job #{job_id} could not run: {str(e)}")
+                db.session.rollback()
+                self._fail(job_id, str(e))
+            finally:
+                db.session.remove()
+                # Stops the heartbeats, so a job left active is seen as stale.
+                # The result is in the job row now; wait() reads it from there
+                with self._lock:
+                    self._progress.pop(job_id, None)
+                    self._futures.pop(job_id, None)
+        return result
+
+    def _execute(self, job_id, progress):
+        job = db.session.get(Job, job_id)
+        job.status = Job.STATUS_RUNNING
+        job.started_at = datetime.now()
+        job.worker = worker_id()
+        db.session.commit()
+        job_type = job.type
+        handler = JOB_HANDLERS[job_type]
+        params = json.loads(job.params or '{}')
+
+        with trace_calls(f'job #{job_id} ({job_type})') as trace:
+            try:
+                result = handler(progress, **params)
+                status, message = Job.STATUS_SUCCEEDED, None
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Job #{job_id} ({job_type}) failed: {str(e)}")
+                result, status, message = None, Job.STATUS_FAILED, str(e)
+
+        # The Plex calls made by the job are kept with its result
+        calls = trace.summary()
+        if calls['calls']:
+            logger.info(trace.describe(calls))
+            if result is None or isinstance(result, dict):
+                result = {**(result or {}), 'plex_calls': calls}
+
+        self._finish(job_id, progress, status, result, message)
+        return result
+
+    def _fail(self, job_id, message):
+        """Mark a job failed outside the ORM session; recover() handles it if this fails too"""
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status.in_(Job.ACTIVE_STATUSES))
+                    .values(status=Job.STATUS_FAILED, message=message, finished_at=datetime.now())
+                )
+        except Exception as e:
+            logger.error(f"Could not mark job #{job_id} as failed: {str(e)}")
+
+    def _finish(self, job_id, progress, status, result, message):
+        snapshot = progress.snapshot(clear=True)
+        job = db.session.get(Job, job_id)
+        job.status = status
+        job.progress_done = snapshot['done']
+        job.progress_total = snapshot['total']
+        job.failures = snapshot['failures']
+        job.message = message or snapshot['message']
+        job.result = json.dumps(result) if result is not None else None
+        job.finished_at = datetime.now()
+        db.session.commit()
+        elapsed = (job.finished_at - job.started_at).total_seconds()
+        logger.info(f"Job #{job_id} ({job.type}) {status} in {elapsed:.1f}s")
+
+    def _flush_loop(self):
+        while not self._stop.wait(PROGRESS_FLUSH_INTERVAL):
+            try:
+                self.flush_progress()
+            except Exception as e:
+                logger.warning(f"Could not save job progress: {str(e)}")
+
+    def flush_progress(self):
+        """Write changed progress (and periodic heartbeats) of this process's jobs"""
+        now = datetime.now()
+        heartbeat = now - self._last_heartbeat >= HEARTBEAT_INTERVAL
+        with self._lock:
+            tracked = list(self._progress.values())
+        updates = [
+            (progress.job_id, progress.snapshot(clear=True) if progress.dirty else None)
+            for progress in tracked if heartbeat or progress.dirty
+        ]
+        if not updates:
+            return
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                for job_id, snapshot in updates:
+                    values = {'heartbeat_at': now}
+                    if snapshot:
+                        values.update(progress_done=snapshot['done'], progress_total=snapshot['total'],
+                                      failures=snapshot['failures'], message=snapshot['message'])
+                    conn.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.status.in_(Job.ACTIVE_STATUSES))
+                        .values(**values)
+                    )
+        if heartbeat:
+            self._last_heartbeat = now
+
+    def live_progress(self, job_id):
+        """In-memory progress of a job running in this process, or None"""
+        with self._lock:
+            progress = self._progress.get(job_id)
+        return progress.snapshot() if progress else None
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job finishes; returns its result, None for an unknown job"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future:
+            return future.result(timeout)
+        # Finished already, or running in another process: poll its row
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.app.app_context():
+                job = db.session.get(Job, job_id)
+                if job is None:
+                    return None
+                if job.status not in Job.ACTIVE_STATUSES:
+                    return json.loads(job.result) if job.result else None
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job #{job_id} still {job.status} after {timeout}s")
+            time.sleep(WAIT_POLL_INTERVAL)
+
+    def _is_stale(self, job, now):
+        return job.heartbeat_at is None or now - job.heartbeat_at > STALE_AFTER
+
+    def recover(self):
+        """Fail queued or running jobs whose process stopped sending heartbeats"""
+        now = datetime.now()
+        with self._lock:
+            local = set(self._progress)
+        stale = [
+            job for job in Job.query.filter(Job.status.in_(Job.ACTIVE_STATUSES)).all()
+            if job.id not in local and self._is_stale(job, now)
+        ]
+        for job in stale:
+            job.status = Job.STATUS_FAILED
+            job.message = 'Interrupted: the process running this job stopped'
+            job.finished_at = now
+            logger.warning(f"Marked stale job #{job.id} ({job.type}) from {job.worker} as failed")
+        if stale:
+            db.session.commit()
+        return len(stale)
+
+    def shutdown(self, wait=True):
+        self._stop.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+
+def job_to_dict(job, live_progress=None):
+    """JSON-friendly view of a job, preferring in-memory progress when available"""
+    progress = live_progress or {
+        'done': job.progress_done, 'total': job.progress_total,
+        'failures': job.failures, 'message': job.message,
+    }
+    end = job.finished_at or datetime.now()
+    return {
+        'id': job.id,
+        'type': job.type,
+        'status': job.status,
+        'progress': {key: progress[key] for key in ('done', 'total', 'failures')},
+        'message': job.message if job.finished_at else progress['message'],
+        'result': json.loads(job.result) if job.result else None,
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'elapsed': round((end - job.started_at).total_seconds(), 1) if job.started_at else None,
+    }
+
+
+@job_handler('sync_plex')
+def run_sync_plex(progress):
+    from plex_service import sync_plex_data
+
+    success, message = sync_plex_data(progress=progress)
+    if not success:
+        raise JobError(message)
+    return {'message': message}
+
+
+@job_handler('check_schedules')
+def run_check_schedules(progress, user_ids=None):
+    from plex_service import check_schedules
+
+    return check_schedules(user_ids=user_ids, progress=progress)
+
+
+@job_handler('reconcile_users')
+def run_reconcile_users(progress, user_ids):
+    from plex_service import reconcile_access
+
+    summary = reconcile_access(user_ids=user_ids, progress=progress, per_user=True)
+    return {
+        'updated': summary['updated'],
+        'skipped': summary['skipped'],
+        'not_applied': summary['not_applied'],
+        'failed': summary['failed'],
+        'results': [result._asdict() for result in summary['results']],
+    }
@@ -0,0 +1,229 @@
+"""
+Persistent offset index over a log file and its rotated backups.
+
+For every file (app.log, app.log.1 ... app.log.5) the index stores one bucket
+per minute of log time: the byte offset of the bucket's first line and a
+bitmask of the levels it contains. Time-range and level queries seek straight
+to the matching buckets instead of scanning every file.
+
+The index is kept in a JSON sidecar next to the log (e.g. app.log.idx) and
+updated incrementally: only bytes appended since the last update are read.
+Files are identified by inode, so entries survive RotatingFileHandler renames.
+"""
+from bisect import bisect_left, bisect_right
+from log_reader import parse_log_line
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+LEVEL_BITS = {'DEBUG': 1, 'INFO': 2, 'WARNING': 4, 'ERROR': 8, 'CRITICAL': 16}
+# Bytes of the first line stored to detect a reused inode
+HEAD_BYTES = 64
+
+
+def _minute(timestamp):
+    """Bucket key for a '%Y-%m-%d %H:%M:%S,mmm' timestamp (sorts lexicographically)"""
+    return timestamp[:16]
+
+
+class InvalidCursor(ValueError):
+    """A paging cursor that is malformed or points into a file rotated away"""
+
+
+def encode_cursor(inode, offset):
+    return f'{inode}-{offset}'
+
+
+def decode_cursor(cursor):
+    inode, _, offset = cursor.partition('-')
+    if not inode.isdigit() or not offset.isdigit():
+        raise InvalidCursor(f'Malformed cursor: {cursor!r}')
+    return inode, int(offset)
+
+
+class LogIndex:
+    """Incrementally maintained bucket index for one rotating log file"""
+
+    def __init__(self, filename, backup_count=5):
+        self.filename = filename
+        self.backup_count = backup_count
+        self.index_path = f'{filename}.idx'
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _paths(self):
+        """Existing log files, oldest first"""
+        candidates = [f'{self.filename}.{n}' for n in range(self.backup_count, 0, -1)] + [self.filename]
+        return [path for path in candidates if os.path.exists(path)]
+
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                raise ValueError('index version mismatch')
+        except (OSError, ValueError):
+            data = {'version': INDEX_VERSION, 'files': {}}
+        self._data = data
+        return data
+
+    def _save(self, data):
+        # Per process: every worker may save the shared index at the same time
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            # The in-memory index still works; it is just rebuilt after a restart
+            logger.warning(f'Could not save log index {self.index_path}: {str(e)}')
+
+    @staticmethod
+    def _read_head(path):
+        with open(path, 'rb') as f:
+            return f.read(HEAD_BYTES).decode('utf-8', errors='replace')
+
+    def _scan(self, path, entry):
+        """Index the bytes appended to path since entry['indexed_size']"""
+        buckets = entry['buckets']
+        with open(path, 'rb') as f:
+            f.seek(entry['indexed_size'])
+            offset = entry['indexed_size']
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    # Incomplete last line: index it once the writer finishes it
+                    break
+                parsed = parse_log_line(raw.decode('utf-8', errors='replace').strip())
+                if parsed['timestamp']:
+                    minute = _minute(parsed['timestamp'])
+                    if not buckets or buckets[-1][0] != minute:
+                        buckets.append([minute, offset, 0])
+                    buckets[-1][2] |= LEVEL_BITS.get(parsed['level'], 0)
+                elif not buckets:
+                    # Continuation lines before the first timestamp
+                    buckets.append(['', offset, 0])
+                offset += len(raw)
+        entry['indexed_size'] = offset
+
+    def update(self):
+        """Bring the index up to date with the files on disk; returns the file list"""
+        with self._lock:
+            data = self._load()
+            files = {}
+            ordered = []
+            changed = False
+            for path in self._paths():
+                stat = os.stat(path)
+                inode = str(stat.st_ino)
+                entry = data['files'].get(inode)
+                head = self._read_head(path)
+                if (not entry or stat.st_size < entry['indexed_size']
+                        or not head.startswith(entry['head'][:len(head)])):
+                    entry = {'head': head, 'indexed_size': 0, 'buckets': []}
+                    changed = True
+                elif len(entry['head']) < len(head):
+                    entry['head'] = head
+                if stat.st_size > entry['indexed_size']:
+                    before = entry['indexed_size']
+                    self._scan(path, entry)
+                    changed = changed or entry['indexed_size'] != before
+                files[inode] = entry
+                ordered.append((path, inode, entry))
+            if changed or set(files) != set(data['files']):
+                data['files'] = files
+                self._save(data)
+            return ordered
+
+    def query(self, start=None, end=None, level=None, cursor=None, limit=100):
+        """
+        Return (entries, next_cursor) for log lines between start and end.
+
+        start/end are '%Y-%m-%d %H:%M:%S' strings (inclusive) and entries come
+        back oldest first. Lines without a timestamp (tracebacks) belong to the
+        entry above them. next_cursor is None when nothing is left. Raises
+        InvalidCursor for a malformed cursor or one whose file was rotated away.
+        """
+        files = self.update()
+        level_bit = LEVEL_BITS.get(level) if level else None
+        start_minute = _minute(start) if start else None
+        end_minute = _minute(end) if end else None
+
+        # Locate the first file and offset to read from
+        first = 0
+        start_offset = None
+        if cursor:
+            cursor_inode, cursor_offset = decode_cursor(cursor)
+            positions = [i for i, (_, inode, _) in enumerate(files) if inode == cursor_inode]
+            if not positions:
+                # Restarting from the oldest file would repeat lines already returned
+                raise InvalidCursor(f'Cursor {cursor} points to a file that was rotated away')
+            first, start_offset = positions[0], cursor_offset
+
+        entries = []
+        for file_number in range(first, len(files)):
+            path, inode, entry = files[file_number]
+            buckets = entry['buckets']
+            if not buckets:
+                continue
+            keys = [bucket[0] for bucket in buckets]
+            offsets = [bucket[1] for bucket in buckets]
+
+            if file_number == first and start_offset is not None:
+                bucket_number = max(0, bisect_right(offsets, start_offset) - 1)
+            elif start_minute:
+                bucket_number = bisect_left(keys, start_minute)
+            else:
+                bucket_number = 0
+
+            with open(path, 'rb') as f:
+                for i in range(bucket_number, len(buckets)):
+                    key, offset, mask = buckets[i]
+                    if end_minute and key > end_minute:
+                        return entries, None
+                    if level_bit and not mask & level_bit:
+                        continue
+                    stop = offsets[i + 1] if i + 1 < len(buckets) else entry['indexed_size']
+                    if file_number == first and start_offset is not None and i == bucket_number:
+                        offset = max(offset, start_offset)
+                    f.seek(offset)
+                    current_time = ''
+                    while offset < stop:
+                        raw = f.readline()
+                        line_start = offset
+                        offset += len(raw)
+                        line = raw.decode('utf-8', errors='replace').strip()
+                        if not line:
+                            continue
+                        parsed = parse_log_line(line)
+                        if parsed['timestamp']:
+                            current_time = parsed['timestamp'][:19]
+                        elif level:
+                            continue
+                        if level and parsed['level'] != level:
+                            continue
+                        if start and current_time < start:
+                            continue
+                        if end and current_time > end:
+                            return entries, None
+                        if len(entries) >= limit:
+                            return entries, encode_cursor(inode, line_start)
+                        entries.append(parsed)
+        return entries, None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_log_index(filename, backup_count=5):
+    """Process-wide LogIndex for a log file"""
+    with _indexes_lock:
+        if filename not in _indexes:
+            _indexes[filename] = LogIndex(filename, backup_count)
+        return _indexes[filename]
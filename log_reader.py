@@ -0,0 +1,149 @@
+"""
+Log file reading helpers for the log viewer API.
+
+Lines are read backwards from the end of the file in fixed-size blocks, so
+fetching the most recent entries costs time proportional to the amount of
+text returned rather than the size of the file.
+"""
+import json
+import os
+import time
+
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_log_line(line):
+    """Parse a JSON log line or split a '<time> - <logger> - <level> - <message>' line into a dict"""
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and 'level' in record:
+            return {
+                'timestamp': record.get('timestamp', ''),
+                'logger': record.get('logger', ''),
+                'level': record['level'],
+                'message': record.get('message', '')
+            }
+    parts = line.split(' - ', 3)
+    if len(parts) >= 4:
+        return {
+            'timestamp': parts[0],
+            'logger': parts[1],
+            'level': parts[2],
+            'message': parts[3]
+        }
+    # Fallback for malformed lines (e.g. traceback continuation lines)
+    return {
+        'timestamp': '',
+        'logger': '',
+        'level': 'UNKNOWN',
+        'message': line
+    }
+
+
+def iter_lines_reverse(f, block_size=BLOCK_SIZE):
+    """Yield the lines of a binary file object from last to first, without newlines"""
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    remainder = b''
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        block = f.read(read_size) + remainder
+        lines = block.split(b'\n')
+        # The first piece may be the tail of a line that started in an earlier block
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            yield line.decode('utf-8', errors='replace')
+    if remainder:
+        yield remainder.decode('utf-8', errors='replace')
+
+
+def tail_log(filename, max_lines=100, level_filter=None, block_size=BLOCK_SIZE):
+    """
+    Return the last max_lines entries of a log file, oldest first.
+
+    Reading stops as soon as enough lines matching level_filter were found.
+    """
+    if not os.path.exists(filename):
+        return []
+
+    entries = []
+    with open(filename, 'rb') as f:
+        for line in iter_lines_reverse(f, block_size):
+            line = line.strip()
+            if not line:
+                continue
+            entry = parse_log_line(line)
+            # Apply level filter if specified
+            if level_filter and entry['level'] != level_filter:
+                continue
+            entries.append(entry)
+            if len(entries) >= max_lines:
+                break
+
+    entries.reverse()
+    return entries
+
+
+def follow_log(filename, level_filter=None, poll_interval=1.0, heartbeat=15.0):
+    """
+    Yield entries appended to a log file after the call, like 'tail -f'.
+
+    A rotated or truncated file is detected by inode/size and reopened from the
+    start. None is yielded every heartbeat seconds without new entries so that
+    callers can send keep-alives (and notice disconnected clients).
+    """
+    f = None
+    inode = None
+    buffer = b''
+    # Only new lines: existing content is served by tail_log
+    from_start = not os.path.exists(filename)
+    last_yield = time.monotonic()
+    try:
+        while True:
+            if f is None and os.path.exists(filename):
+                f = open(filename, 'rb')
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                inode = os.fstat(f.fileno()).st_ino
+
+            chunk = f.read() if f else b''
+            if chunk:
+                lines = (buffer + chunk).split(b'\n')
+                # Keep a partially written last line for the next read
+                buffer = lines.pop()
+                for raw in lines:
+                    line = raw.decode('utf-8', errors='replace').strip()
+                    if not line:
+                        continue
+                    entry = parse_log_line(line)
+                    if level_filter and entry['level'] != level_filter:
+                        continue
+                    last_yield = time.monotonic()
+                    yield entry
+                continue
+
+            if f is not None:
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    stat = None
+                if stat is None or stat.st_ino != inode or stat.st_size < f.tell():
+                    # Rotated or truncated: the old handle was read to the end above
+                    f.close()
+                    f = None
+                    buffer = b''
+                    from_start = True
+                    continue
+
+            if time.monotonic() - last_yield >= heartbeat:
+                last_yield = time.monotonic()
+                yield None
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
@@ -0,0 +1,122 @@
+"""
+Logging setup shared by the app and its background jobs.
+
+LOG_FORMAT=json writes one JSON object per line instead of the
+'<time> - <logger> - <level> - <message>' text format. LOG_LEVEL sets the
+lowest level written to app.log and the console (DEBUG adds a line per Plex
+HTTP call, see tracing.py). LOG_QUEUE=true hands
+records to a QueueListener thread so that file writes and rotations never run
+on request or scheduler threads.
+
+Under gunicorn the master process calls start_log_writer() before forking.
+Workers then send their records to it over a multiprocessing queue, so one
+process writes and rotates app.log and error.log for all of them.
+"""
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import queue
+
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+LOG_QUEUE = os.environ.get('LOG_QUEUE', 'false').lower() in ('1', 'true', 'yes')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Queue of the log writer process, inherited by forked workers
+_writer_queue = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'logger': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['message'] += '\n' + self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def build_file_formatter(log_format=LOG_FORMAT):
+    if log_format == 'json':
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def stop_listener(listener):
+    """Flush and stop a QueueListener; safe to call more than once"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def parse_level(name):
+    """Numeric level for a name such as 'DEBUG'; INFO for anything else"""
+    level = logging.getLevelName(str(name).upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def build_handlers(log_format=LOG_FORMAT, level=LOG_LEVEL):
+    """The app.log, error.log and console handlers"""
+    file_formatter = build_file_formatter(log_format)
+    level = parse_level(level)
+
+    # App log handler (LOG_LEVEL and above) - 10MB max, 5 backups
+    app_handler = RotatingFileHandler('app.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    app_handler.setLevel(level)
+    app_handler.setFormatter(file_formatter)
+
+    # Error log handler (ERROR only) - 10MB max, 5 backups
+    error_handler = RotatingFileHandler('error.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(file_formatter)
+
+    # Console handler for development
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(level)
+    console_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+
+    return [app_handler, error_handler, console_handler]
+
+
+def start_log_writer(log_format=LOG_FORMAT, level=LOG_LEVEL):
+    """Write the log files of every process forked after this call; returns the QueueListener"""
+    global _writer_queue
+    _writer_queue = multiprocessing.Queue()
+    listener = QueueListener(_writer_queue, *build_handlers(log_format, level), respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def configure_logging(log_format=LOG_FORMAT, use_queue=LOG_QUEUE, level=LOG_LEVEL):
+    """Install the app/error/console handlers on the root logger; returns the QueueListener if any"""
+    root = logging.getLogger()
+    # Remove any existing handlers
+    root.handlers = []
+    root.setLevel(parse_level(level))
+
+    if _writer_queue is not None:
+        # Forked by a process running start_log_writer(): it owns the files
+        root.addHandler(QueueHandler(_writer_queue))
+        return None
+
+    handlers = build_handlers(log_format, level)
+    if not use_queue:
+        for handler in handlers:
+            root.addHandler(handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush queued records on shutdown
+    atexit.register(stop_listener, listener)
+    root.addHandler(QueueHandler(log_queue))
+    return listener
@@ -0,0 +1,285 @@
+"""
+In-process metrics exposed in the Prometheus text format on /metrics.
+
+Counters and histograms are plain dicts guarded by a lock, so recording a
+value costs a dictionary update. Each gunicorn worker keeps its own values;
+once MetricsStore.start() has been called they are written to a shared
+directory every METRICS_FLUSH_INTERVAL seconds and /metrics adds up the
+values of every worker, so a scrape sees the whole server whichever worker
+answers it.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'plex-user-manager-metrics'))
+
+# Seconds; request handlers, Plex calls and reconciliation runs share them
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class MetricsRegistry:
+    """Named metrics that are rendered together"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        """JSON-friendly copy of every series: {name: [[label values, value], ...]}"""
+        return {name: metric.series() for name, metric in self.metrics.items()}
+
+    def render(self, snapshots=()):
+        """Prometheus text exposition of this process plus the given snapshots"""
+        lines = []
+        for name, metric in self.metrics.items():
+            combined = {tuple(labels): value for labels, value in metric.series()}
+            for snapshot in snapshots:
+                for labels, value in snapshot.get(name, ()):
+                    key = tuple(labels)
+                    combined[key] = metric.merge(combined.get(key), value)
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels in sorted(combined):
+                lines.extend(metric.render(labels, combined[labels]))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def series(self):
+        with self._lock:
+            return [[list(key), self._copy(value)] for key, value in self._values.items()]
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    """Monotonically increasing count; name it with a _total suffix"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def merge(self, current, other):
+        return (current or 0) + other
+
+    def render(self, labels, value):
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}']
+
+
+class Histogram(Metric):
+    """Distribution of observed values in fixed buckets, plus their count and sum"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Per-bucket (not cumulative) counts followed by count and sum
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return series[-2] if series else 0
+
+    def _copy(self, value):
+        return list(value)
+
+    def merge(self, current, other):
+        if current is None:
+            return list(other)
+        return [a + b for a, b in zip(current, other)]
+
+    def render(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value):
+            cumulative += count
+            le = format_labels(self.labelnames, labels, f'le="{format_value(float(bound))}"')
+            lines.append(f'{self.name}_bucket{le} {cumulative}')
+        label_text = format_labels(self.labelnames, labels)
+        inf = format_labels(self.labelnames, labels, 'le="+Inf"')
+        lines.append(f'{self.name}_bucket{inf} {value[-2]}')
+        lines.append(f'{self.name}_sum{label_text} {format_value(value[-1])}')
+        lines.append(f'{self.name}_count{label_text} {value[-2]}')
+        return lines
+
+
+class MetricsStore:
+    """Shares the metrics of several worker processes through a directory"""
+
+    def __init__(self, directory=METRICS_DIR, registry=REGISTRY, interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+        self.started = False
+        self._stop = threading.Event()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'{os.getpid()}.json')
+
+    def start(self):
+        """Publish this process's metrics periodically and at exit"""
+        if self.started:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_dead()
+        self.started = True
+        self._stop.clear()
+        threading.Thread(target=self._flush_loop, name='metrics', daemon=True).start()
+        atexit.register(self.flush)
+
+    def stop(self):
+        self._stop.set()
+        atexit.unregister(self.flush)
+        self.started = False
+
+    def _remove_dead(self):
+        for entry in os.scandir(self.directory):
+            pid = entry.name[:-len('.json')]
+            if entry.name.endswith('.json') and pid.isdigit() and not pid_alive(int(pid)):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not write metrics: {str(e)}")
+
+    def flush(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def other_snapshots(self):
+        """Last published metrics of every other worker process"""
+        if not self.started:
+            return []
+        snapshots = []
+        own = os.path.basename(self.path)
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json') or entry.name == own:
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        return self.registry.render(self.other_snapshots())
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Metrics recorded by the app
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests',
+    ['endpoint', 'method', 'status'])
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries issued per HTTP request',
+    ['endpoint'], buckets=COUNT_BUCKETS)
+DB_QUERIES = Counter(
+    'db_queries_total', 'Database statements executed', ['operation'])
+PLEX_REQUEST_LATENCY = Histogram(
+    'plex_request_duration_seconds', 'Latency of HTTP calls to Plex servers and plex.tv',
+    ['method', 'endpoint', 'status'])
+SYNC_DURATION = Histogram(
+    'plex_sync_duration_seconds', 'Duration of Plex syncs', ['outcome'])
+RECONCILE_DURATION = Histogram(
+    'reconcile_duration_seconds', 'Duration of access reconciliation runs')
+RECONCILE_USERS = Counter(
+    'reconcile_users_total', 'Users handled by reconciliation runs', ['outcome'])
+SCHEDULER_LAG = Histogram(
+    'scheduler_lag_seconds', 'Delay between the scheduled and the actual start of scheduler jobs', ['job'])
+SCHEDULER_MISSED = Counter(
+    'scheduler_missed_runs_total', 'Scheduler runs skipped because they were too late', ['job'])
@@ -1,54 +1,37 @@
 """
-Database migration script to add role column to User table
-Run this script to migrate existing database to support RBAC
+Database migration script
+Applies pending schema migrations (see migrations.py) without starting the app.
+Migrations also run automatically when the application starts.
 """
-import sqlite3
 import os
+from app import app
+from database import db
+from migrations import get_schema_version, run_migrations
 
 def migrate_database():
-    # Database is in instance folder
-    db_path = os.path.join('instance', 'plex_manager.db')
-    print(f"Target database: {os.path.abspath(db_path)}")
-    
-    if not os.path.exists(db_path):
-        print("Database file not found. No migration needed.")
-        return
-    
-    print("Starting database migration...")
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    try:
-        # Check if role column already exists
-        cursor.execute("PRAGMA table_info(user)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'role' in columns:
-            print("Role column already exists. Migration not needed.")
+    with app.app_context():
+        db_path = db.engine.url.database
+        print(f"Target database: {os.path.abspath(db_path)}")
+
+        if not os.path.exists(db_path):
+            print("Database file not found. No migration needed.")
             return
-        
-        # Add role column with default value 'auditor'
-        print("Adding 'role' column to user table...")
-        cursor.execute("ALTER TABLE user ADD COLUMN role VARCHAR(20) NOT NULL DEFAULT 'auditor'")
-        
-        # Update existing admin user to have admin role
-        print("Setting existing admin user to 'admin' role...")
-        cursor.execute("UPDATE user SET role = 'admin' WHERE username = 'admin'")
-        
-        # Commit changes
-        conn.commit()
-        print("✓ Migration completed successfully!")
-        print(f"  - Added 'role' column to user table")
-        print(f"  - Set admin user role to 'admin'")
-        
-    except Exception as e:
-        conn.rollback()
-        print(f"✗ Migration failed: {e}")
-        raise
-    
-    finally:
-        conn.close()
+
+        print("Starting database migration...")
+
+        try:
+            before = get_schema_version(db.engine)
+            after = run_migrations(db.engine)
+
+            if after == before:
+                print(f"Schema already at version {after}. Migration not needed.")
+            else:
+                print("✓ Migration completed successfully!")
+                print(f"  - Schema upgraded from version {before} to {after}")
+
+        except Exception as e:
+            print(f"✗ Migration failed: {e}")
+            raise
 
 if __name__ == '__main__':
     migrate_database()
@@ -0,0 +1,124 @@
+"""
+Versioned schema migrations.
+
+db.create_all() only creates missing tables, so changes to existing tables
+(new columns, indexes) are applied here. Every migration runs once, in its
+own transaction, and the applied versions are recorded in the schema_version
+table. Migrations must be idempotent so that databases freshly created from
+the current models can be stamped without errors.
+"""
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _column_names(conn, table):
+    return [row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")')]
+
+
+def add_user_role(conn):
+    """Add the role column to user (previously done by migrate_db.py)"""
+    if 'role' in _column_names(conn, 'user'):
+        return
+    conn.exec_driver_sql("ALTER TABLE user ADD COLUMN role VARCHAR(20) NOT NULL DEFAULT 'auditor'")
+    conn.exec_driver_sql("UPDATE user SET role = 'admin' WHERE username = 'admin'")
+
+
+def index_shares(conn):
+    """Unique (plex_user_id, library_id) index and date indexes on share"""
+    # Older versions could create duplicate rows; keep the newest one
+    conn.exec_driver_sql(
+        'DELETE FROM share WHERE id NOT IN '
+        '(SELECT MAX(id) FROM share GROUP BY plex_user_id, library_id)'
+    )
+    conn.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_share_user_library ON share (plex_user_id, library_id)'
+    )
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_share_start_date ON share (start_date)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_share_expiration_date ON share (expiration_date)')
+
+
+def index_plex_users(conn):
+    """Case-insensitive username and email indexes for the paginated dashboard"""
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_plex_user_username ON plex_user (username COLLATE NOCASE)'
+    )
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_plex_user_email ON plex_user (email COLLATE NOCASE)')
+
+
+def create_plex_user_search(conn):
+    """FTS5 index over plex_user username/email, kept in sync by triggers"""
+    try:
+        conn.exec_driver_sql(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS plex_user_fts USING fts5('
+            "username, email, content='plex_user', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+    except OperationalError as e:
+        # SQLite built without FTS5: user_search falls back to LIKE queries
+        logger.warning(f"Full-text search unavailable, skipping plex_user_fts: {str(e)}")
+        return
+    conn.exec_driver_sql(
+        'CREATE TRIGGER IF NOT EXISTS plex_user_fts_insert AFTER INSERT ON plex_user BEGIN '
+        'INSERT INTO plex_user_fts (rowid, username, email) VALUES (new.id, new.username, new.email); END'
+    )
+    conn.exec_driver_sql(
+        'CREATE TRIGGER IF NOT EXISTS plex_user_fts_delete AFTER DELETE ON plex_user BEGIN '
+        "INSERT INTO plex_user_fts (plex_user_fts, rowid, username, email) "
+        "VALUES ('delete', old.id, old.username, old.email); END"
+    )
+    conn.exec_driver_sql(
+        'CREATE TRIGGER IF NOT EXISTS plex_user_fts_update AFTER UPDATE OF username, email ON plex_user BEGIN '
+        "INSERT INTO plex_user_fts (plex_user_fts, rowid, username, email) "
+        "VALUES ('delete', old.id, old.username, old.email); "
+        'INSERT INTO plex_user_fts (rowid, username, email) VALUES (new.id, new.username, new.email); END'
+    )
+    # Index the rows that already exist
+    conn.exec_driver_sql("INSERT INTO plex_user_fts (plex_user_fts) VALUES ('rebuild')")
+
+
+def add_applied_access_not_applied(conn):
+    """Remember which unapplied library removals were already reported"""
+    columns = _column_names(conn, 'applied_access')
+    if not columns or 'not_applied_at' in columns:
+        # Missing tables are created with the column by db.create_all()
+        return
+    conn.exec_driver_sql('ALTER TABLE applied_access ADD COLUMN not_applied_at DATETIME')
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, 'Add role column to user', add_user_role),
+    (2, 'Index share lookups and date columns', index_shares),
+    (3, 'Index plex_user username and email', index_plex_users),
+    (4, 'Full-text search over plex_user', create_plex_user_search),
+    (5, 'Add not_applied_at column to applied_access', add_applied_access_not_applied),
+]
+
+
+def get_schema_version(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS schema_version ('
+            'version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at DATETIME)'
+        )
+        return conn.exec_driver_sql('SELECT MAX(version) FROM schema_version').scalar() or 0
+
+
+def run_migrations(engine):
+    """Apply every pending migration; returns the resulting schema version"""
+    current = get_schema_version(engine)
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.exec_driver_sql(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.now().isoformat(sep=' ', timespec='seconds')),
+            )
+        current = version
+    return current
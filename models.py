@@ -61,6 +61,12 @@ class PlexUser(db.Model):
     email = db.Column(db.String(100))
     thumb = db.Column(db.String(255))
 
+    # Case-insensitive indexes for sorting the dashboard listing
+    __table_args__ = (
+        db.Index('ix_plex_user_username', db.collate(username, 'NOCASE')),
+        db.Index('ix_plex_user_email', db.collate(email, 'NOCASE')),
+    )
+
 class Library(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     plex_key = db.Column(db.String(50), unique=True, nullable=False)
@@ -71,15 +77,81 @@ class Share(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     plex_user_id = db.Column(db.Integer, db.ForeignKey('plex_user.id'), nullable=False)
     library_id = db.Column(db.Integer, db.ForeignKey('library.id'), nullable=False)
-    start_date = db.Column(db.DateTime, nullable=True)
-    expiration_date = db.Column(db.DateTime, nullable=True)
+    start_date = db.Column(db.DateTime, nullable=True, index=True)
+    expiration_date = db.Column(db.DateTime, nullable=True, index=True)
     is_active = db.Column(db.Boolean, default=True)
 
     plex_user = db.relationship('PlexUser', backref=db.backref('shares', lazy=True))
     library = db.relationship('Library', backref=db.backref('shares', lazy=True))
 
+    # Existing databases get these through migrations.index_shares
+    __table_args__ = (db.Index('ix_share_user_library', 'plex_user_id', 'library_id', unique=True),)
+
 class Settings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(50), unique=True, nullable=False)
     value = db.Column(db.String(255))
 
+
+class AppliedAccess(db.Model):
+    # Fingerprint of the library set last pushed to Plex for a user, so the
+    # scheduler can skip users whose effective access has not changed
+    id = db.Column(db.Integer, primary_key=True)
+    plex_user_id = db.Column(db.Integer, db.ForeignKey('plex_user.id'), unique=True, nullable=False)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
+    # When the removal of every library was reported as not applied, so the
+    # scheduler reports it once; cleared by the next successful push
+    not_applied_at = db.Column(db.DateTime, nullable=True)
+
+    plex_user = db.relationship('PlexUser', backref=db.backref('applied_access', uselist=False, lazy=True))
+
+class SyncFingerprint(db.Model):
+    # Content fingerprint of a remote Plex record ('library' or 'user') as of
+    # the last sync, so unchanged records can be skipped entirely
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    remote_key = db.Column(db.String(50), nullable=False)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    synced_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (db.UniqueConstraint('kind', 'remote_key'),)
+
+class ShareChange(db.Model):
+    # Users whose shares were edited in a worker that does not run the
+    # scheduler; the one that does reads and deletes them (transitions.refresh)
+    id = db.Column(db.Integer, primary_key=True)
+    plex_user_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.now)
+
+class Job(db.Model):
+    # Background task (Plex sync, scheduler run, bulk push) executed by jobs.JobRunner
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    # Jobs sharing a dedupe key never run concurrently (NULL = no deduplication)
+    dedupe_key = db.Column(db.String(100))
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED)
+    params = db.Column(db.Text)  # JSON
+    result = db.Column(db.Text)  # JSON
+    message = db.Column(db.Text)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer)
+    failures = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))  # host:pid of the process running the job
+    heartbeat_at = db.Column(db.DateTime)  # refreshed while the owning process is alive
+    created_by = db.Column(db.String(150))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_active_dedupe_key', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')")),
+        db.Index('ix_job_status', 'status'),
+    )
@@ -0,0 +1,274 @@
+"""
+Process-wide Plex client.
+
+Keeps one pooled, keep-alive requests.Session for all Plex traffic and caches
+the PlexServer and MyPlexAccount objects for a limited time, so callers stop
+paying a TLS handshake and a server/account round-trip on every operation.
+"""
+from plexapi.library import Library
+from plexapi.myplex import MyPlexAccount
+from plexapi.server import PlexServer
+from requests.adapters import HTTPAdapter
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from metrics import PLEX_REQUEST_LATENCY
+from tracing import record_call
+from urllib.parse import urlparse
+import logging
+import os
+import re
+import threading
+import time
+
+import requests
+import urllib3
+
+logger = logging.getLogger(__name__)
+
+# Seconds before cached PlexServer/MyPlexAccount objects are rebuilt
+PLEX_CLIENT_TTL = int(os.environ.get('PLEX_CLIENT_TTL', 300))
+# Connections kept alive per host (local server and plex.tv)
+PLEX_POOL_SIZE = int(os.environ.get('PLEX_POOL_SIZE', 10))
+# Timeout in seconds for every Plex HTTP request
+PLEX_TIMEOUT = int(os.environ.get('PLEX_TIMEOUT', 30))
+# Parallel per-user updates during a reconciliation run
+PLEX_WORKERS = int(os.environ.get('PLEX_WORKERS', 4))
+# Sustained requests per second to plex.tv (0 disables limiting) and burst size
+PLEX_RATE_LIMIT = float(os.environ.get('PLEX_RATE_LIMIT', 5))
+PLEX_RATE_BURST = int(os.environ.get('PLEX_RATE_BURST', 10))
+# Worker processes sharing that budget (set by gunicorn.conf.py); each
+# process gets an equal part of the rate and burst
+PLEX_RATE_PROCESSES = max(1, int(os.environ.get('PLEX_RATE_PROCESSES', 1)))
+# Longest Retry-After we are willing to honour for a single 429
+MAX_RETRY_AFTER = 60
+
+
+class RateLimiter:
+    """Token bucket shared by every thread using the Plex session"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for the given time, e.g. after a 429"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            # Refill from the end of the pause, not across it
+            self._updated = self._blocked_until
+
+
+def retry_after_seconds(response, default):
+    """Parse a Retry-After header (seconds or HTTP date), capped at MAX_RETRY_AFTER"""
+    value = response.headers.get('Retry-After')
+    seconds = default
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                seconds = default
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+# Path segments that identify an object: numeric ids, machine identifiers, UUIDs
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{16,}|[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12})$', re.IGNORECASE)
+
+
+def is_plex_tv(url):
+    host = urlparse(url).hostname or ''
+    return host == 'plex.tv' or host.endswith('.plex.tv')
+
+
+def url_template(url):
+    """Endpoint of a Plex URL with ids replaced and the query (token) dropped"""
+    parsed = urlparse(url)
+    host = parsed.hostname if is_plex_tv(url) else 'server'
+    path = '/'.join(':id' if _ID_SEGMENT.match(segment) else segment for segment in parsed.path.split('/'))
+    return f'{host}{path}'
+
+
+def response_size(response, streamed=False):
+    """Body size from Content-Length, or of the downloaded body; 0 when unknown"""
+    length = response.headers.get('Content-Length', '')
+    if length.isdigit():
+        return int(length)
+    # Reading a streamed body here would consume it before the caller does
+    return 0 if streamed else len(response.content or b'')
+
+
+class RateLimitedSession(requests.Session):
+    """Session that rate-limits plex.tv calls and retries 429 responses after Retry-After"""
+
+    def __init__(self, limiter, max_retries=3):
+        super().__init__()
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def _send(self, method, url, *args, **kwargs):
+        """One HTTP call, timed per endpoint and reported to the current trace"""
+        start = time.perf_counter()
+        status = 'error'
+        size = 0
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            status = response.status_code
+            size = response_size(response, streamed=kwargs.get('stream', False))
+            return response
+        finally:
+            seconds = time.perf_counter() - start
+            method, endpoint = method.upper(), url_template(url)
+            PLEX_REQUEST_LATENCY.observe(seconds, method=method, endpoint=endpoint, status=status)
+            record_call(method, endpoint, status, size, seconds)
+
+    def request(self, method, url, *args, **kwargs):
+        limited = is_plex_tv(url)
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                self.limiter.acquire()
+            response = self._send(method, url, *args, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+
+            delay = retry_after_seconds(response, default=2 ** attempt)
+            logger.warning(f"Plex rate limit hit on {urlparse(url).path}, retrying in {delay:.1f}s")
+            if limited:
+                # Back off every worker, not just this one
+                self.limiter.pause(delay)
+            else:
+                time.sleep(delay)
+        return response
+
+
+class SectionIndex:
+    """Key and title lookup tables over the server's library sections"""
+
+    def __init__(self, sections):
+        self.sections = list(sections)
+        self.by_key = {str(section.key): section for section in self.sections}
+        self.by_title = {}
+        for section in self.sections:
+            self.by_title.setdefault(section.title.lower(), section)
+
+    @classmethod
+    def fetch(cls, server):
+        """Load the sections with a fresh request, bypassing plexapi's per-object caching"""
+        return cls(Library(server, None).sections())
+
+    def get(self, key):
+        return self.by_key.get(str(key))
+
+    @property
+    def default(self):
+        """The 'Default' library that is always shared to keep users on the server"""
+        return self.by_title.get('default')
+
+
+class PlexClientManager:
+    """Thread-safe cache of the Plex session, server and account objects"""
+
+    def __init__(self, ttl=PLEX_CLIENT_TTL, pool_size=PLEX_POOL_SIZE, timeout=PLEX_TIMEOUT,
+                 rate_limit=PLEX_RATE_LIMIT / PLEX_RATE_PROCESSES,
+                 rate_burst=max(1, PLEX_RATE_BURST // PLEX_RATE_PROCESSES)):
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_limit, rate_burst)
+        self._lock = threading.RLock()
+        self._session = None
+        self._server = None
+        self._account = None
+        self._sections = None
+        self._credentials = None
+        self._created_at = 0.0
+
+    @property
+    def session(self):
+        """Shared session with connection pooling, created on first use"""
+        with self._lock:
+            if self._session is None:
+                self._session = self._build_session()
+            return self._session
+
+    def _build_session(self):
+        session = RateLimitedSession(self.limiter)
+        # Local Plex servers usually present self-signed certificates
+        session.verify = False
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _is_fresh(self, url, token):
+        return (
+            self._server is not None
+            and self._credentials == (url, token)
+            and time.monotonic() - self._created_at < self.ttl
+        )
+
+    def get_server(self, url, token):
+        """Return a cached PlexServer for these credentials, reconnecting when stale"""
+        with self._lock:
+            if not self._is_fresh(url, token):
+                logger.info(f"Connecting to Plex server at {url}")
+                self._server = PlexServer(url, token, session=self.session, timeout=self.timeout)
+                self._account = None
+                self._sections = None
+                self._credentials = (url, token)
+                self._created_at = time.monotonic()
+            return self._server
+
+    def get_account(self, url, token):
+        """Return the cached MyPlexAccount that owns the server"""
+        with self._lock:
+            self.get_server(url, token)
+            if self._account is None:
+                self._account = MyPlexAccount(token=token, session=self.session, timeout=self.timeout)
+            return self._account
+
+    def get_section_index(self, url, token, refresh=False):
+        """Return the cached SectionIndex, reloading it when asked or when the server was rebuilt"""
+        with self._lock:
+            server = self.get_server(url, token)
+            if refresh or self._sections is None:
+                self._sections = SectionIndex.fetch(server)
+            return self._sections
+
+    def invalidate(self):
+        """Drop cached server/account objects, e.g. after the Plex settings change"""
+        with self._lock:
+            self._server = None
+            self._account = None
+            self._sections = None
+            self._credentials = None
+            self._created_at = 0.0
+
+
+plex_clients = PlexClientManager()
@@ -1,131 +1,290 @@
-from plexapi.server import PlexServer
-from database import db
-from models import PlexUser, Library, Share, Settings
+from database import db, bulk_upsert
+from metrics import RECONCILE_DURATION, RECONCILE_USERS, SYNC_DURATION
+from plex_client import plex_clients, PLEX_WORKERS
+from models import PlexUser, Library, Share, AppliedAccess, SyncFingerprint, ShareChange
+from settings_store import get_setting, update_setting
+from tracing import in_context, trace_subject
 from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from sqlalchemy import and_, or_, delete, func, insert, update
+import hashlib
+import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+def get_plex_credentials():
+    """Return (plex_url, plex_token) from settings, or None if not configured"""
+    plex_url = get_setting('plex_url')
+    plex_token = get_setting('plex_token')
+    if not plex_url or not plex_token:
+        return None
+    return plex_url, plex_token
+
 def get_plex_server():
-    url_setting = Settings.query.filter_by(key='plex_url').first()
-    token_setting = Settings.query.filter_by(key='plex_token').first()
-    
-    if not url_setting or not token_setting:
+    credentials = get_plex_credentials()
+    if not credentials:
         return None
-        
-    import requests
-    session = requests.Session()
-    session.verify = False
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
-    return PlexServer(url_setting.value, token_setting.value, session=session)
+    return plex_clients.get_server(*credentials)
+
+def get_plex_account():
+    credentials = get_plex_credentials()
+    if not credentials:
+        return None
+    return plex_clients.get_account(*credentials)
+
+def get_section_index(refresh=False):
+    """Return the cached key/title index of the server's library sections"""
+    credentials = get_plex_credentials()
+    if not credentials:
+        return None
+    return plex_clients.get_section_index(*credentials, refresh=refresh)
+
+def shared_section_keys(plex_user, machine_id):
+    """Return the library section keys our server shares with a MyPlexUser"""
+    # user.servers lists the SharedServer entries for every server shared
+    # with this user; we only care about the one matching our machineIdentifier
+    for shared_server in plex_user.servers:
+        if shared_server.machineIdentifier != machine_id:
+            continue
+        # Depending on the plexapi version, sections is a list or a method
+        sections = getattr(shared_server, 'sections', None) or []
+        if callable(sections):
+            sections = sections()
+        # section.key matches Library.plex_key
+        return [str(section.key) for section in sections]
+    return []
+
+def record_fingerprint(*values):
+    """Fingerprint of a remote record's synced fields"""
+    canonical = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def store_sync_fingerprints(fingerprints):
+    """Upsert (kind, remote_key, fingerprint) rows into SyncFingerprint in bulk (caller commits)"""
+    now = datetime.now()
+    values = [
+        {'kind': kind, 'remote_key': key, 'fingerprint': fingerprint, 'synced_at': now}
+        for kind, key, fingerprint in fingerprints
+    ]
+    bulk_upsert(SyncFingerprint, values, [SyncFingerprint.kind, SyncFingerprint.remote_key],
+                ['fingerprint', 'synced_at'])
+
+def get_last_sync_summary():
+    """Return the 'changed since last sync' summary of the most recent sync, if any"""
+    value = get_setting('last_sync_summary')
+    return json.loads(value) if value else None
 
-def sync_plex_data():
+def sync_plex_data(progress=None):
+    """
+    Import libraries, friends and their existing shares from Plex.
+
+    Existing rows are preloaded into dicts keyed by their natural keys and
+    every remote library and user is fingerprinted; records whose
+    fingerprint matches the last sync are skipped entirely. The remaining
+    differences are written with bulk INSERT/UPDATE statements in a single
+    transaction, and a per-kind added/changed/unchanged summary is stored.
+    progress, if given, is called with done/total user counts and a message.
+    """
     logger.info("Starting Plex sync...")
+    timings = {}
+    sync_start = phase_start = time.perf_counter()
+    
+    def finish(success, message):
+        SYNC_DURATION.observe(time.perf_counter() - sync_start, outcome='success' if success else 'failed')
+        return success, message
+    
+    def phase_done(name):
+        nonlocal phase_start
+        now = time.perf_counter()
+        timings[name] = now - phase_start
+        phase_start = now
+    
+    summary = {
+        'libraries': {'added': 0, 'changed': 0, 'unchanged': 0},
+        'users': {'added': 0, 'changed': 0, 'unchanged': 0},
+        'shares_imported': 0,
+    }
+    
     try:
         plex = get_plex_server()
         if not plex:
             logger.error("Plex credentials not configured.")
-            return False, "Plex credentials not configured."
+            return finish(False, "Plex credentials not configured.")
         
         logger.info(f"Connected to Plex server: {plex.friendlyName}")
-
-        # Sync Libraries
-        plex_libraries = plex.library.sections()
+        my_machine_id = plex.machineIdentifier
+        
+        # Fetch everything from Plex first (also refreshes the cached section index)
+        plex_libraries = get_section_index(refresh=True).sections
         logger.info(f"Found {len(plex_libraries)} libraries.")
+        # account.users() returns users you share with
+        plex_users = get_plex_account().users()
+        logger.info(f"Found {len(plex_users)} users.")
+        phase_done('fetch')
+        if progress:
+            progress(total=len(plex_users), message='Comparing users with the last sync')
+        
+        # Preload existing rows keyed by their natural keys
+        libraries = {
+            row.plex_key: row for row in db.session.query(Library.id, Library.plex_key)
+        }
+        users = {
+            row.plex_id: row for row in db.session.query(PlexUser.id, PlexUser.plex_id)
+        }
+        fingerprints = {
+            (row.kind, row.remote_key): row.fingerprint for row in db.session.query(
+                SyncFingerprint.kind, SyncFingerprint.remote_key, SyncFingerprint.fingerprint)
+        }
+        new_fingerprints = []
+        phase_done('load')
+        
+        # Sync Libraries
+        new_libraries = []
+        changed_libraries = []
         for lib in plex_libraries:
-            existing_lib = Library.query.filter_by(plex_key=str(lib.key)).first()
-            if not existing_lib:
-                new_lib = Library(plex_key=str(lib.key), title=lib.title, type=lib.type)
-                db.session.add(new_lib)
+            key = str(lib.key)
+            fingerprint = record_fingerprint(lib.title, lib.type)
+            existing = libraries.get(key)
+            if existing and fingerprints.get(('library', key)) == fingerprint:
+                summary['libraries']['unchanged'] += 1
+                continue
+            new_fingerprints.append(('library', key, fingerprint))
+            if not existing:
+                new_libraries.append({'plex_key': key, 'title': lib.title, 'type': lib.type})
+                summary['libraries']['added'] += 1
                 logger.info(f"Added new library: {lib.title}")
             else:
-                existing_lib.title = lib.title
+                changed_libraries.append({'id': existing.id, 'title': lib.title, 'type': lib.type})
+                summary['libraries']['changed'] += 1
+        if new_libraries:
+            db.session.execute(insert(Library), new_libraries)
+        if changed_libraries:
+            db.session.execute(update(Library), changed_libraries)
+        library_ids = {row.plex_key: row.id for row in libraries.values()}
+        if new_libraries:
+            library_ids = dict(db.session.query(Library.plex_key, Library.id).all())
+        phase_done('libraries')
         
         # Sync Users (Friends/Shared Users)
-        # plex.myPlexAccount().users() returns users you share with
-        account = plex.myPlexAccount()
-        plex_users = account.users()
-        logger.info(f"Found {len(plex_users)} users.")
-        
+        new_users = []
+        changed_users = []
+        changed_plex_users = []
         for user in plex_users:
-            existing_user = PlexUser.query.filter_by(plex_id=str(user.id)).first()
-            if not existing_user:
-                new_user = PlexUser(
-                    plex_id=str(user.id),
-                    username=user.title, # username is often in title or username
-                    email=user.email,
-                    thumb=user.thumb
-                )
-                db.session.add(new_user)
-                db.session.flush() # Flush to get ID
-                current_db_user = new_user
+            plex_id = str(user.id)
+            # Only keys of known libraries count, so a newly synced library
+            # changes the fingerprint of the users it is shared with
+            shared_keys = sorted(key for key in shared_section_keys(user, my_machine_id) if key in library_ids)
+            fingerprint = record_fingerprint(user.title, user.email, user.thumb, ','.join(shared_keys))
+            existing = users.get(plex_id)
+            if existing and fingerprints.get(('user', plex_id)) == fingerprint:
+                summary['users']['unchanged'] += 1
+                continue
+            new_fingerprints.append(('user', plex_id, fingerprint))
+            changed_plex_users.append((user, shared_keys))
+            # username is often in title or username
+            values = {'username': user.title, 'email': user.email, 'thumb': user.thumb}
+            if not existing:
+                new_users.append({'plex_id': plex_id, **values})
+                summary['users']['added'] += 1
                 logger.info(f"Added new user: {user.title}")
             else:
-                existing_user.username = user.title
-                existing_user.email = user.email
-                existing_user.thumb = user.thumb
-                current_db_user = existing_user
-
-            # Sync existing shares
-            # We need to find what this server shares with this user
-            # user.servers is a list of servers shared with this user?
-            # Or we need to ask the server for the list of shared sections for this user.
-            
-            # According to plexapi docs/source:
-            # account.users() returns User objects.
-            # User objects have a 'servers' attribute which lists servers shared with them?
-            # Or we use plex.myPlexAccount().user(user.title).servers?
-            
-            # Let's try to get the specific server share info
-            # The 'user' object from account.users() might already have it.
-            # user.servers is a list of SharedServer objects.
-            
-            # We need to match the machineIdentifier of our server
-            my_machine_id = plex.machineIdentifier
-            
-            for shared_server in user.servers:
-                if shared_server.machineIdentifier == my_machine_id:
-                    # This is our server shared with this user
-                    # shared_server.sections() returns the sections shared
-                    # But wait, shared_server might not have sections() method directly if it's a SharedServer object
-                    # It might have 'sections' attribute which is a list of SharedSection
-                    
-                    # Let's assume shared_server.sections is a list of objects with 'key' or 'id'
-                    # Actually, looking at plexapi, it seems we might need to iterate sections
-                    
-                    if hasattr(shared_server, 'sections'):
-                        # If sections is a list of objects or method
-                        sections = shared_server.sections
-                        if callable(sections):
-                            sections = sections()
-                            
-                        for section in sections:
-                            # section.key should match library.plex_key
-                            # Note: section.key might be the section ID
-                            
-                            lib = Library.query.filter_by(plex_key=str(section.key)).first()
-                            if lib:
-                                # Create or update Share
-                                share = Share.query.filter_by(plex_user_id=current_db_user.id, library_id=lib.id).first()
-                                if not share:
-                                    share = Share(plex_user_id=current_db_user.id, library_id=lib.id, is_active=True)
-                                    db.session.add(share)
-                                    logger.info(f"Imported existing share: {lib.title} for {user.title}")
-                                else:
-                                    # Ensure it's active if it exists on Plex
-                                    share.is_active = True
-                    break
+                changed_users.append({'id': existing.id, **values})
+                summary['users']['changed'] += 1
+        if new_users:
+            db.session.execute(insert(PlexUser), new_users)
+        if changed_users:
+            db.session.execute(update(PlexUser), changed_users)
+        user_ids = {row.plex_id: row.id for row in users.values()}
+        if new_users:
+            user_ids = dict(db.session.query(PlexUser.plex_id, PlexUser.id).all())
+        phase_done('users')
+        if progress:
+            progress(done=len(plex_users), message='Importing shares')
+        
+        # Sync existing shares: import what our server already shares with
+        # the users that changed since the last sync
+        new_shares = []
+        reactivated_shares = []
+        if changed_plex_users:
+            changed_ids = [user_ids[str(user.id)] for user, _ in changed_plex_users]
+            shares = {
+                (row.plex_user_id, row.library_id): row for row in db.session.query(
+                    Share.id, Share.plex_user_id, Share.library_id, Share.is_active
+                ).filter(Share.plex_user_id.in_(changed_ids))
+            }
+            for user, shared_keys in changed_plex_users:
+                plex_user_id = user_ids[str(user.id)]
+                for key in shared_keys:
+                    library_id = library_ids[key]
+                    existing = shares.get((plex_user_id, library_id))
+                    if not existing:
+                        new_shares.append({'plex_user_id': plex_user_id, 'library_id': library_id, 'is_active': True})
+                        logger.info(f"Imported existing share: library {key} for {user.title}")
+                    elif not existing.is_active:
+                        # Ensure it's active if it exists on Plex
+                        reactivated_shares.append({'id': existing.id, 'is_active': True})
+        if new_shares:
+            db.session.execute(insert(Share), new_shares)
+        if reactivated_shares:
+            db.session.execute(update(Share), reactivated_shares)
+        summary['shares_imported'] = len(new_shares) + len(reactivated_shares)
+        phase_done('shares')
         
+        store_sync_fingerprints(new_fingerprints)
+        summary['synced_at'] = datetime.now().isoformat(timespec='seconds')
+        update_setting('last_sync_summary', json.dumps(summary), commit=False)
         db.session.commit()
+        phase_done('commit')
+        
+        logger.info(f"Sync changes: {summary}")
+        logger.info("Sync phase timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
         logger.info("Sync completed successfully.")
-        return True, "Sync successful."
+        changed_user_count = summary['users']['added'] + summary['users']['changed']
+        changed_library_count = summary['libraries']['added'] + summary['libraries']['changed']
+        return finish(True, (f"Sync successful: {changed_user_count} users and "
+                             f"{changed_library_count} libraries changed since last sync."))
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Sync failed: {str(e)}")
-        return False, str(e)
+        return finish(False, str(e))
+
+class AccessContext:
+    """
+    Plex objects shared by every access update in one run.
+
+    Loading them up front means worker threads only talk to Plex and never
+    need the database or an app context.
+    """
+
+    def __init__(self, plex, account, section_index, friends=None):
+        self.plex = plex
+        self.account = account
+        self.section_index = section_index
+        self.friends = friends
+
+    @classmethod
+    def load(cls, refresh=False):
+        """Build a context from the cached client, or None if Plex is not configured"""
+        plex = get_plex_server()
+        if not plex:
+            return None
+        account = get_plex_account()
+        section_index = get_section_index(refresh=refresh)
+        # One friend list request per run instead of one per user via account.user()
+        friends = {str(user.id): user for user in account.users()} if refresh else None
+        return cls(plex, account, section_index, friends)
 
-def update_user_access(plex_user_id, library_keys):
+    def friend(self, plex_user_id):
+        if self.friends is not None and str(plex_user_id) in self.friends:
+            return self.friends[str(plex_user_id)]
+        return self.account.user(plex_user_id)
+
+
+def update_user_access(plex_user_id, library_keys, context=None):
     logger.info(f"Updating access for user {plex_user_id} with libraries: {library_keys}")
     
     # If user has no libraries assigned, skip the update entirely
@@ -134,35 +293,33 @@ def update_user_access(plex_user_id, library_keys):
         return True, "No libraries to share - user not invited."
     
     try:
-        plex = get_plex_server()
-        if not plex:
+        context = context or AccessContext.load()
+        if not context:
             logger.error("Plex credentials not configured.")
             return False, "Plex credentials not configured."
         
-        account = plex.myPlexAccount()
-        user = account.user(plex_user_id)
+        plex = context.plex
+        account = context.account
+        user = context.friend(plex_user_id)
         logger.info(f"Found user: {user.title} (email: {user.email})")
         
+        # Resolve sections from the index instead of asking the server each time
+        sections = context.section_index
         sections_to_share = []
         for key in library_keys:
-            for section in plex.library.sections():
-                if str(section.key) == str(key):
-                    sections_to_share.append(section)
-                    break
+            section = sections.get(key)
+            if section:
+                sections_to_share.append(section)
         
         # Only add "Default" library if user has at least one library assigned
         # This prevents user removal from server when modifying shares
-        default_lib = None
-        for section in plex.library.sections():
-            if section.title.lower() == 'default':
-                default_lib = section
-                # Check if it's not already in the list
-                if not any(s.key == section.key for s in sections_to_share):
-                    sections_to_share.append(section)
-                    logger.info("Added 'Default' library automatically to prevent user removal")
-                break
-        
-        if not default_lib:
+        default_lib = sections.default
+        if default_lib:
+            # Check if it's not already in the list
+            if not any(s.key == default_lib.key for s in sections_to_share):
+                sections_to_share.append(default_lib)
+                logger.info("Added 'Default' library automatically to prevent user removal")
+        else:
             logger.warning("'Default' library not found on Plex server!")
 
         
@@ -179,37 +336,330 @@ def update_user_access(plex_user_id, library_keys):
         return False, str(e)
 
 
-def check_schedules():
+def access_fingerprint(library_keys):
+    """Order-independent fingerprint of a set of library keys"""
+    canonical = ','.join(sorted({str(key) for key in library_keys}))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def record_applied_access(plex_user_id, library_keys):
+    """Remember the library set last pushed to Plex for a user (caller commits)"""
+    applied = AppliedAccess.query.filter_by(plex_user_id=plex_user_id).first()
+    if not applied:
+        applied = AppliedAccess(plex_user_id=plex_user_id)
+        db.session.add(applied)
+    applied.fingerprint = access_fingerprint(library_keys)
+    applied.applied_at = datetime.now()
+    applied.not_applied_at = None
+
+def mark_not_applied(plex_user_ids, reported=True):
+    """Set (or clear) the reported unapplied removal of these users (caller commits)"""
+    if not plex_user_ids:
+        return
+    db.session.execute(
+        update(AppliedAccess)
+        .where(AppliedAccess.plex_user_id.in_(list(plex_user_ids)))
+        .values(not_applied_at=datetime.now() if reported else None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Compact per-user view of the access the scheduler should enforce right now
+EffectiveAccess = namedtuple(
+    'EffectiveAccess',
+    ['user_id', 'plex_id', 'username', 'library_keys', 'applied_fingerprint', 'not_applied_at']
+)
+
+def iter_effective_access(now=None, chunk_size=500, user_ids=None):
     """
-    Background job to check for expired or starting shares.
+    Yield an EffectiveAccess tuple for every PlexUser (or only those in user_ids).
+
+    Everything comes from a single outer-joined query filtered on the share
+    dates and streamed in chunks, so no ORM objects are built and memory stays
+    flat regardless of the number of users. Users without any effective share
+    are yielded with an empty key tuple.
     """
-    # To avoid circular imports, we'll implement the logic here but need to ensure
-    # it's called within an app context in app.py
-    
-    users = PlexUser.query.all()
+    now = now or datetime.now()
+    effective_share = and_(
+        Share.plex_user_id == PlexUser.id,
+        Share.is_active.is_(True),
+        or_(Share.start_date.is_(None), Share.start_date <= now),
+        or_(Share.expiration_date.is_(None), Share.expiration_date > now),
+    )
+    rows = (
+        db.session.query(PlexUser.id, PlexUser.plex_id, PlexUser.username,
+                         Library.plex_key, AppliedAccess.fingerprint, AppliedAccess.not_applied_at)
+        .select_from(PlexUser)
+        .outerjoin(Share, effective_share)
+        .outerjoin(Library, Library.id == Share.library_id)
+        .outerjoin(AppliedAccess, AppliedAccess.plex_user_id == PlexUser.id)
+        .order_by(PlexUser.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if user_ids is not None:
+        rows = rows.filter(PlexUser.id.in_(list(user_ids)))
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        user_rows = list(user_rows)
+        first = user_rows[0]
+        library_keys = tuple(sorted(row[3] for row in user_rows if row[3] is not None))
+        yield EffectiveAccess(user_id, first[1], first[2], library_keys, first[4], first[5])
+
+def upcoming_transitions(now=None, user_ids=None):
+    """
+    Yield (when, plex_user_id) for every future share start or expiration.
+
+    These are the only moments at which a user's effective access can change
+    without someone editing their shares.
+    """
+    now = now or datetime.now()
+    query = db.session.query(Share.plex_user_id, Share.start_date, Share.expiration_date).filter(
+        Share.is_active.is_(True),
+        or_(Share.start_date > now, Share.expiration_date > now),
+    )
+    if user_ids is not None:
+        query = query.filter(Share.plex_user_id.in_(list(user_ids)))
+    for plex_user_id, start_date, expiration_date in query:
+        if start_date and start_date > now:
+            yield start_date, plex_user_id
+        if expiration_date and expiration_date > now:
+            yield expiration_date, plex_user_id
+
+def record_share_changes(plex_user_ids):
+    """Log users whose shares were edited, for the worker running the scheduler (caller commits)"""
+    now = datetime.now()
+    db.session.execute(insert(ShareChange), [
+        {'plex_user_id': plex_user_id, 'changed_at': now} for plex_user_id in set(plex_user_ids)
+    ])
+
+def latest_share_change():
+    """Id of the last logged share change, 0 if there is none"""
+    return db.session.query(func.max(ShareChange.id)).scalar() or 0
+
+def share_changes_after(change_id):
+    """Return (last change id, set of plex_user_ids) of the changes logged after change_id"""
+    rows = db.session.query(ShareChange.id, ShareChange.plex_user_id).filter(ShareChange.id > change_id).all()
+    if not rows:
+        return change_id, set()
+    return max(row[0] for row in rows), {row[1] for row in rows}
+
+def clear_share_changes(up_to_id):
+    """Delete the share changes already read (caller commits)"""
+    db.session.execute(delete(ShareChange).where(ShareChange.id <= up_to_id))
+
+def store_applied_fingerprints(applied):
+    """Upsert (plex_user_id, library_keys) pairs into AppliedAccess in bulk (caller commits)"""
+    if not applied:
+        return
     now = datetime.now()
+    values = [
+        {'plex_user_id': user_id, 'fingerprint': access_fingerprint(keys), 'applied_at': now,
+         'not_applied_at': None}
+        for user_id, keys in applied
+    ]
+    bulk_upsert(AppliedAccess, values, [AppliedAccess.plex_user_id],
+                ['fingerprint', 'applied_at', 'not_applied_at'])
+
+def push_user_access(updates, context, max_workers=PLEX_WORKERS, on_result=None):
+    """
+    Apply (plex_id, library_keys) updates on a bounded thread pool.
+
+    Plex calls are throttled by the shared client's rate limiter. Returns a
+    dict of plex_id -> (success, message); on_result(plex_id, outcome) is
+    called as each one completes.
+    """
+    if not updates:
+        return {}
     
-    for user in users:
-        active_library_keys = []
-        shares = Share.query.filter_by(plex_user_id=user.id).all()
-        
-        needs_update = False
-        
-        for share in shares:
-            if share.is_active:
-                should_share = True
-                if share.start_date and share.start_date > now:
-                    should_share = False
-                if share.expiration_date and share.expiration_date <= now:
-                    should_share = False
-                
-                if should_share:
-                    active_library_keys.append(share.library.plex_key)
-        
-        # Update Plex for this user
+    def apply(update):
+        plex_id, library_keys = update
+        with trace_subject(plex_id):
+            return plex_id, update_user_access(plex_id, list(library_keys), context)
+    
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='plex-update') as pool:
+        # Pool threads do not inherit the caller's trace; run each update in its context
+        for plex_id, outcome in pool.map(in_context(apply), updates):
+            results[plex_id] = outcome
+            if on_result:
+                on_result(plex_id, outcome)
+    return results
+
+
+AccessResult = namedtuple('AccessResult', 'user_id username status message')
+ACCESS_STATUSES = ('updated', 'skipped', 'not_applied', 'failed')
+
+# Plex has no call to remove every library without removing the friend, so
+# a user whose last library was revoked keeps their old access on Plex
+NOT_APPLIED_MESSAGE = 'No libraries left to share - access on Plex was not changed'
+
+
+def record_reconcile_metrics(summary, started):
+    RECONCILE_DURATION.observe(time.perf_counter() - started)
+    for status in ACCESS_STATUSES:
+        if summary[status]:
+            RECONCILE_USERS.inc(summary[status], outcome=status)
+    return summary
+
+
+def reconcile_access(user_ids=None, progress=None, per_user=False):
+    """
+    Push every user whose effective library set differs from the one last
+    applied on Plex, in parallel.
+
+    Pass user_ids to reconcile only those users. Returns a summary dict with
+    'updated', 'skipped', 'not_applied' and 'failed' counts and an 'errors'
+    dict of username -> message. With per_user, it also holds a 'results'
+    list with an AccessResult for every user. progress, if given, is called
+    with done/total/failures user counts.
+    """
+    started = time.perf_counter()
+    summary = {status: 0 for status in ACCESS_STATUSES}
+    summary['errors'] = {}
+    results = [] if per_user else None
+
+    def report(access, status, message=None):
+        summary[status] += 1
+        if status == 'failed':
+            summary['errors'][access.username] = message
+        if per_user:
+            results.append(AccessResult(access.user_id, access.username, status, message))
+
+    def finish():
+        if per_user:
+            summary['results'] = results
+        return record_reconcile_metrics(summary, started)
+    
+    # Diff while streaming so only the users that need a Plex call are kept,
+    # and the read cursor is closed before any network I/O starts
+    pending = []
+    reported = []
+    restored = []
+    for access in iter_effective_access(user_ids=user_ids):
+        if access.applied_fingerprint == access_fingerprint(access.library_keys):
+            if access.not_applied_at:
+                # Given back the libraries Plex still had: in sync again
+                restored.append(access.user_id)
+            report(access, 'skipped')
+        elif not access.library_keys and access.applied_fingerprint is None:
+            # Never shared and nothing to share
+            report(access, 'skipped')
+        elif not access.library_keys and access.not_applied_at:
+            # Reported by an earlier run; nothing changed since
+            report(access, 'skipped')
+        elif not access.library_keys:
+            logger.warning(f"Cannot remove the last library of {access.username} on Plex")
+            report(access, 'not_applied', NOT_APPLIED_MESSAGE)
+            reported.append(access.user_id)
+        else:
+            pending.append(access)
+    if reported or restored:
+        mark_not_applied(reported)
+        mark_not_applied(restored, reported=False)
+        db.session.commit()
+    counts = {'done': sum(summary[status] for status in ACCESS_STATUSES), 'failures': 0}
+    if progress:
+        progress(total=counts['done'] + len(pending), **counts)
+    
+    # Load the server, account, section index and friend list once for the whole run
+    context = None
+    if pending:
         try:
-            update_user_access(user.plex_id, active_library_keys)
-            print(f"Updated access for user {user.username}")
+            context = AccessContext.load(refresh=True)
         except Exception as e:
-            print(f"Failed to update access for user {user.username}: {e}")
+            logger.error(f"Could not load Plex state for reconciliation: {str(e)}")
+        if not context:
+            db.session.rollback()
+            if progress:
+                progress(failures=len(pending))
+            for access in pending:
+                report(access, 'failed', 'Plex unavailable')
+            return finish()
+    
+    def count(plex_id, outcome):
+        counts['done'] += 1
+        counts['failures'] += 0 if outcome[0] else 1
+        progress(**counts)
+    
+    pushed = push_user_access(
+        [(access.plex_id, access.library_keys) for access in pending], context,
+        on_result=count if progress else None,
+    )
+    
+    applied = []
+    for access in pending:
+        success, message = pushed[access.plex_id]
+        if success:
+            applied.append((access.user_id, access.library_keys))
+            report(access, 'updated', message)
+            logger.info(f"Updated access for user {access.username}")
+        else:
+            report(access, 'failed', message)
+            logger.error(f"Failed to update access for user {access.username}: {message}")
+    
+    store_applied_fingerprints(applied)
+    db.session.commit()
+    return finish()
+
+
+def check_schedules(user_ids=None, progress=None):
+    """
+    Background job to check for expired or starting shares.
 
+    Pass user_ids to reconcile only those users, e.g. when one of their
+    shares starts or expires.
+
+    Only users whose effective library set differs from the one last applied
+    on Plex are pushed, in parallel. Returns the summary of reconcile_access().
+    """
+    # To avoid circular imports, we'll implement the logic here but need to ensure
+    # it's called within an app context in app.py
+    
+    summary = reconcile_access(user_ids=user_ids, progress=progress)
+    logger.info(f"Schedule check finished: {summary['updated']} updated, "
+                f"{summary['skipped']} skipped, {summary['not_applied']} not applied, "
+                f"{summary['failed']} failed")
+    return summary
+
+
+BULK_ACTIONS = ('grant', 'revoke', 'window')
+
+
+def apply_bulk_access(user_ids, library_ids, action, start_date=None, expiration_date=None):
+    """
+    Change the shares of many users in one transaction (caller commits).
+
+    'grant' activates the libraries with the given date window, creating
+    shares as needed; 'revoke' deactivates existing shares; 'window' only
+    sets the dates of existing shares. Unknown user and library ids are
+    ignored. Returns (user_ids, shares_written).
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unknown bulk action: {action}")
+    user_ids = [row[0] for row in db.session.query(PlexUser.id).filter(PlexUser.id.in_(set(user_ids)))]
+    library_ids = [row[0] for row in db.session.query(Library.id).filter(Library.id.in_(set(library_ids)))]
+    if not user_ids or not library_ids:
+        return user_ids, 0
+    
+    if action == 'grant':
+        values = [
+            {'plex_user_id': user_id, 'library_id': library_id, 'is_active': True,
+             'start_date': start_date, 'expiration_date': expiration_date}
+            for user_id in user_ids for library_id in library_ids
+        ]
+        bulk_upsert(Share, values, [Share.plex_user_id, Share.library_id],
+                    ['is_active', 'start_date', 'expiration_date'])
+        return user_ids, len(values)
+    
+    if action == 'revoke':
+        values = {'is_active': False}
+    else:
+        values = {'start_date': start_date, 'expiration_date': expiration_date}
+    written = 0
+    for i in range(0, len(user_ids), 500):
+        result = db.session.execute(
+            update(Share)
+            .where(Share.plex_user_id.in_(user_ids[i:i + 500]), Share.library_id.in_(library_ids))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        written += result.rowcount
+    return user_ids, written
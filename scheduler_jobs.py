@@ -0,0 +1,19 @@
+"""
+Functions run by jobs in the persistent scheduler job store.
+
+APScheduler saves jobs in the database with a textual reference to their
+function ('scheduler_jobs:run_schedule'), so it must be a module-level
+function of a module that is imported under the same name whether app.py
+runs as __main__ (python app.py) or is imported by wsgi.py. app.py registers
+the callbacks they dispatch to when it is imported.
+"""
+_callbacks = {}
+
+
+def register(name, func):
+    _callbacks[name] = func
+
+
+def run_schedule():
+    """Reconcile every user's access (the access_check_job)"""
+    _callbacks['run_schedule']()
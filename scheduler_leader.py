@@ -0,0 +1,110 @@
+"""
+Scheduler ownership when several worker processes serve the app.
+
+Every gunicorn worker imports app.py, but only one of them may run the
+BackgroundScheduler, otherwise each reconciliation would run once per worker.
+The owner is the process holding an exclusive lock on scheduler.lock next to
+the database. The OS drops the lock when that process exits or crashes, and
+the other workers retry every SCHEDULER_LEADER_RETRY seconds, so one of them
+takes over.
+"""
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LEADER_RETRY = int(os.environ.get('SCHEDULER_LEADER_RETRY', 30))
+
+
+class FileLock:
+    """Exclusive advisory lock on a file, held until release() or process exit"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock; returns False if blocking is False and another process holds it"""
+        if self._file:
+            return True
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file.fileno(), flags)
+            except OSError:
+                lock_file.close()
+                return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file:
+            # Closing the descriptor releases the lock
+            self._file.close()
+            self._file = None
+
+    @property
+    def locked(self):
+        return self._file is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SchedulerLeader:
+    """Calls on_elected once this process owns the scheduler lock"""
+
+    def __init__(self, lock_path, on_elected, retry=SCHEDULER_LEADER_RETRY):
+        self.lock = FileLock(lock_path)
+        self.on_elected = on_elected
+        self.retry = retry
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self.lock.locked
+
+    def start(self):
+        """Try to become leader now, else keep retrying in the background; returns is_leader"""
+        if self._try_elect():
+            return True
+        logger.info(f"Scheduler owned by another worker (pid {os.getpid()} will retry every {self.retry}s)")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._retry_loop, name='scheduler-leader', daemon=True)
+            self._thread.start()
+        return False
+
+    def _try_elect(self):
+        if not self.lock.acquire(blocking=False):
+            return False
+        logger.info(f"Worker pid {os.getpid()} is running the scheduler")
+        try:
+            self.on_elected()
+        except Exception as e:
+            # Let another worker try rather than holding a lock with no scheduler
+            logger.error(f"Could not start the scheduler: {str(e)}")
+            self.lock.release()
+            return False
+        return True
+
+    def _retry_loop(self):
+        while not self._stop.wait(self.retry):
+            if self._try_elect():
+                return
+
+    def stop(self):
+        self._stop.set()
+        self.lock.release()
@@ -0,0 +1,101 @@
+"""
+Write-through in-process cache of the Settings table.
+
+All key/value rows are loaded with one query and served from memory. Writes
+go to the database and update the cache once committed. Entries also expire
+after SETTINGS_CACHE_TTL seconds so that changes made by another process
+(e.g. a second WSGI worker) are picked up.
+"""
+from database import db
+from models import Settings
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import os
+import threading
+import time
+
+SETTINGS_CACHE_TTL = int(os.environ.get('SETTINGS_CACHE_TTL', 30))
+
+
+class SettingsCache:
+    """Thread-safe snapshot of every setting"""
+
+    def __init__(self, ttl=SETTINGS_CACHE_TTL):
+        self.ttl = ttl
+        self._values = None
+        self._loaded_at = 0.0
+        self._pending_commit = False
+        self._lock = threading.Lock()
+
+    def _snapshot(self):
+        with self._lock:
+            if self._values is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._values
+        values = dict(db.session.query(Settings.key, Settings.value).all())
+        with self._lock:
+            self._values = values
+            self._loaded_at = time.monotonic()
+        return values
+
+    def get(self, key, default=None):
+        value = self._snapshot().get(key)
+        return default if value is None else value
+
+    def update(self, values, commit=True):
+        """Write several settings in one transaction"""
+        existing = {
+            setting.key: setting
+            for setting in Settings.query.filter(Settings.key.in_(list(values))).all()
+        }
+        for key, value in values.items():
+            setting = existing.get(key)
+            if not setting:
+                setting = Settings(key=key)
+                db.session.add(setting)
+            setting.value = value
+
+        if not commit:
+            # The caller owns the transaction; reload once it commits or rolls back
+            self._pending_commit = True
+            self.invalidate()
+            return
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.invalidate()
+            raise
+        with self._lock:
+            if self._values is not None:
+                self._values = {**self._values, **values}
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+
+settings_cache = SettingsCache()
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reload_after_transaction(session):
+    """Drop the cache when a transaction holding uncommitted setting writes ends"""
+    if settings_cache._pending_commit:
+        settings_cache._pending_commit = False
+        settings_cache.invalidate()
+
+
+def get_setting(key, default=None):
+    """Get a setting value from the cache"""
+    return settings_cache.get(key, default)
+
+
+def update_setting(key, value, commit=True):
+    """Update or create a setting (write-through)"""
+    settings_cache.update({key: value}, commit=commit)
+
+
+def update_settings(values, commit=True):
+    """Update or create several settings in a single transaction (write-through)"""
+    settings_cache.update(values, commit=commit)
@@ -0,0 +1,41 @@
+// Poll /api/jobs/<id> until the job finishes, calling onUpdate with each status
+async function watchJob(jobId, onUpdate, interval = 1000) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error('Could not load job status');
+        }
+        const job = await response.json();
+        onUpdate(job);
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+function describeJob(job) {
+    const progress = job.progress;
+    let text = `Job #${job.id} (${job.type.replace('_', ' ')}): ${job.status}`;
+    if (progress.total) {
+        text += ` - ${progress.done}/${progress.total}`;
+    }
+    if (progress.failures) {
+        text += `, ${progress.failures} failed`;
+    }
+    if (job.elapsed !== null) {
+        text += ` - ${job.elapsed}s`;
+    }
+    if (job.message) {
+        text += ` - ${job.message}`;
+    }
+    const calls = job.result && job.result.plex_calls;
+    if (calls) {
+        text += ` - ${calls.calls} Plex calls in ${calls.seconds}s`;
+        if (calls.endpoints.length) {
+            const slowest = calls.endpoints[0];
+            text += ` (slowest: ${slowest.method} ${slowest.endpoint}, ${slowest.seconds}s)`;
+        }
+    }
+    return text;
+}
@@ -0,0 +1,46 @@
+"""
+Unit tests for SQLite connection tuning
+"""
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine
+import database
+
+
+class TestSqlitePragmas(unittest.TestCase):
+    """Test cases for the per-connection pragmas"""
+
+    def setUp(self):
+        """Create a file-backed engine"""
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = create_engine(f'sqlite:///{self.db_path}')
+
+    def tearDown(self):
+        """Remove the temporary database"""
+        self.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def pragma(self, name):
+        with self.engine.connect() as conn:
+            return conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+    def test_defaults_applied(self):
+        """Test that WAL, synchronous and busy timeout are set on connect"""
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    def test_invalid_values_are_ignored(self):
+        """Test that values that are not simple tokens never reach SQL"""
+        pragmas = dict(database.SQLITE_PRAGMAS, busy_timeout='1; DROP TABLE x')
+        with patch.dict(database.SQLITE_PRAGMAS, pragmas), self.assertLogs('database', 'WARNING'):
+            self.assertEqual(self.pragma('journal_mode'), 'wal')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+"""
+Unit tests for the background job queue
+"""
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from app import app
+from database import db
+from jobs import JOB_HANDLERS, JobRunner, job_handler, job_to_dict
+from models import Job, User
+from tracing import record_call
+
+release = threading.Event()
+started = threading.Event()
+
+
+@job_handler('test_blocking')
+def blocking_job(progress, items=3):
+    progress(total=items, message='working')
+    started.set()
+    release.wait(5)
+    progress(done=items, failures=1)
+    return {'items': items}
+
+
+@job_handler('test_failing')
+def failing_job(progress):
+    raise RuntimeError('boom')
+
+
+@job_handler('test_plex_calls')
+def plex_calls_job(progress):
+    record_call('GET', 'plex.tv/api/v2/friends', 200, 512, 0.25)
+    return {'done': True}
+
+
+class TestJobRunner(unittest.TestCase):
+    """Test cases for enqueueing, deduplicating and tracking jobs"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.runner = JobRunner(app, max_workers=2)
+        release.clear()
+        started.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        release.set()
+        self.runner.shutdown()
+        db.session.remove()
+        db.drop_all()
+        # Close the connections opened by worker threads so that later tests
+        # that change the schema do not share them
+        db.engine.dispose()
+        self.app_context.pop()
+
+    def test_job_runs_and_records_result(self):
+        """Test that a job moves from queued to succeeded with its result and progress"""
+        job, created = self.runner.enqueue('test_blocking', {'items': 5}, created_by='admin')
+        release.set()
+        self.runner.wait(job.id, timeout=5)
+
+        job = db.session.get(Job, job.id)
+        db.session.refresh(job)
+        data = job_to_dict(job)
+        self.assertTrue(created)
+        self.assertEqual(data['status'], Job.STATUS_SUCCEEDED)
+        self.assertEqual(data['result'], {'items': 5})
+        self.assertEqual(data['progress'], {'done': 5, 'total': 5, 'failures': 1})
+        self.assertIsNotNone(data['elapsed'])
+
+    def test_same_type_is_deduplicated_while_active(self):
+        """Test that a second enqueue returns the running job"""
+        first, _ = self.runner.enqueue('test_blocking')
+        started.wait(5)
+        second, created = self.runner.enqueue('test_blocking')
+
+        self.assertFalse(created)
+        self.assertEqual(second.id, first.id)
+
+        release.set()
+        self.runner.wait(first.id, timeout=5)
+        third, created = self.runner.enqueue('test_blocking')
+        self.assertTrue(created)
+        self.assertNotEqual(third.id, first.id)
+
+    def test_progress_is_visible_while_running(self):
+        """Test that in-memory progress is flushed to the job row"""
+        job, _ = self.runner.enqueue('test_blocking', {'items': 4})
+        started.wait(5)
+
+        self.assertEqual(self.runner.live_progress(job.id)['total'], 4)
+        self.runner.flush_progress()
+        db.session.expire_all()
+        row = db.session.get(Job, job.id)
+        self.assertEqual((row.status, row.progress_total, row.message), (Job.STATUS_RUNNING, 4, 'working'))
+
+    def test_failed_job(self):
+        """Test that handler exceptions fail the job with their message"""
+        job, _ = self.runner.enqueue('test_failing')
+        self.runner.wait(job.id, timeout=5)
+
+        db.session.expire_all()
+        row = db.session.get(Job, job.id)
+        self.assertEqual((row.status, row.message), (Job.STATUS_FAILED, 'boom'))
+
+    def test_job_that_cannot_start_is_released(self):
+        """Test that errors outside the handler fail the job and stop its heartbeats"""
+        with patch('jobs.json.loads', side_effect=ValueError('bad params')):
+            job, _ = self.runner.enqueue('test_failing')
+            self.runner.wait(job.id, timeout=5)
+
+        db.session.expire_all()
+        row = db.session.get(Job, job.id)
+        self.assertEqual((row.status, row.message), (Job.STATUS_FAILED, 'bad params'))
+        self.assertIsNone(self.runner.live_progress(job.id))
+        _, created = self.runner.enqueue('test_failing')
+        self.assertTrue(created)
+
+    def test_finished_jobs_are_not_kept_in_memory(self):
+        """Test that results are dropped from the runner and read back from the job row"""
+        job, _ = self.runner.enqueue('test_blocking', {'items': 2})
+        release.set()
+        self.assertEqual(self.runner.wait(job.id, timeout=5), {'items': 2})
+
+        self.assertEqual(self.runner._futures, {})
+        self.assertEqual(self.runner.wait(job.id, timeout=5), {'items': 2})
+        self.assertIsNone(self.runner.wait(999))
+
+    def test_wait_polls_jobs_of_other_processes(self):
+        """Test that waiting on a job without a future times out while it is active"""
+        row = Job(type='test_blocking', status=Job.STATUS_RUNNING, heartbeat_at=datetime.now())
+        db.session.add(row)
+        db.session.commit()
+
+        with patch('jobs.WAIT_POLL_INTERVAL', 0.01), self.assertRaises(TimeoutError):
+            self.runner.wait(row.id, timeout=0.05)
+
+    def test_recover_fails_stale_jobs(self):
+        """Test that jobs of a dead process are failed and no longer block their type"""
+        old = datetime.now() - timedelta(hours=1)
+        db.session.add_all([
+            Job(type='test_blocking', dedupe_key='test_blocking', status=Job.STATUS_RUNNING, heartbeat_at=old),
+            Job(type='test_failing', dedupe_key='test_failing', status=Job.STATUS_RUNNING,
+                heartbeat_at=datetime.now()),
+        ])
+        db.session.commit()
+
+        job, created = self.runner.enqueue('test_blocking')
+
+        self.assertTrue(created)
+        statuses = dict(db.session.query(Job.type, Job.status).filter(Job.id != job.id).all())
+        self.assertEqual(statuses, {'test_blocking': Job.STATUS_FAILED, 'test_failing': Job.STATUS_RUNNING})
+
+    def test_plex_calls_are_stored_with_the_result(self):
+        """Test that the trace summary of a job is kept in its result"""
+        job, _ = self.runner.enqueue('test_plex_calls')
+        self.runner.wait(job.id, timeout=5)
+
+        db.session.expire_all()
+        result = job_to_dict(db.session.get(Job, job.id))['result']
+        self.assertTrue(result['done'])
+        self.assertEqual(result['plex_calls']['calls'], 1)
+        self.assertEqual(result['plex_calls']['endpoints'][0]['endpoint'], 'plex.tv/api/v2/friends')
+
+    def test_unknown_type(self):
+        """Test that only registered job types can be enqueued"""
+        self.assertNotIn('nope', JOB_HANDLERS)
+        with self.assertRaises(ValueError):
+            self.runner.enqueue('nope')
+
+
+class TestJobRoutes(unittest.TestCase):
+    """Test cases for the routes that enqueue jobs"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        moderator = User(username='moderator', role=User.ROLE_MODERATOR)
+        moderator.set_password('mod')
+        db.session.add(moderator)
+        db.session.commit()
+        self.client = app.test_client()
+        self.client.post('/login', data={'username': 'moderator', 'password': 'mod'})
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch('plex_service.sync_plex_data', return_value=(True, 'Sync successful'))
+    def test_sync_returns_immediately_and_reports_status(self, mock_sync):
+        """Test that /sync_plex enqueues a job whose status can be polled"""
+        from app import job_runner
+
+        response = self.client.post('/sync_plex')
+        job_id = int(response.headers['Location'].rsplit('job=', 1)[1])
+        job_runner.wait(job_id, timeout=5)
+        status = self.client.get(f'/api/jobs/{job_id}').json
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(status['status'], Job.STATUS_SUCCEEDED)
+        self.assertEqual(status['result'], {'message': 'Sync successful'})
+        self.assertEqual(status['created_by'], 'moderator')
+
+    def test_missing_job(self):
+        """Test that unknown job ids return 404"""
+        self.assertEqual(self.client.get('/api/jobs/12345').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Unit tests for the persistent log offset index
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from log_index import InvalidCursor, LogIndex
+
+
+def write_lines(path, minutes, levels=('INFO', 'ERROR'), mode='a'):
+    """Append two lines per minute to path"""
+    with open(path, mode, encoding='utf-8') as f:
+        for minute in minutes:
+            for second, level in zip((10, 40), levels):
+                f.write(f'2026-01-01 10:{minute:02d}:{second:02d},000 - app - {level} - minute {minute} {level}\n')
+
+
+class TestLogIndex(unittest.TestCase):
+    """Test cases for time-range queries over rotated log files"""
+
+    def setUp(self):
+        """Create app.log with one rotated backup"""
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'app.log')
+        write_lines(f'{self.filename}.1', range(0, 10))
+        write_lines(self.filename, range(10, 20))
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write('Traceback line without separators\n')
+
+    def tearDown(self):
+        """Remove the log directory"""
+        shutil.rmtree(self.directory)
+
+    def messages(self, entries):
+        return [entry['message'] for entry in entries]
+
+    def test_time_range_spans_rotated_files(self):
+        """Test that a range crossing a rotation is returned oldest first"""
+        entries, cursor = LogIndex(self.filename).query(start='2026-01-01 10:09:30', end='2026-01-01 10:10:20')
+
+        self.assertEqual(self.messages(entries), ['minute 9 ERROR', 'minute 10 INFO'])
+        self.assertIsNone(cursor)
+
+    def test_level_filter(self):
+        """Test that only lines of the requested level are returned"""
+        entries, _ = LogIndex(self.filename).query(start='2026-01-01 10:18:00', level='ERROR')
+
+        self.assertEqual(self.messages(entries), ['minute 18 ERROR', 'minute 19 ERROR'])
+
+    def test_cursor_pages_through_results(self):
+        """Test that following next_cursor returns every line exactly once"""
+        index = LogIndex(self.filename)
+        seen = []
+        cursor = None
+        while True:
+            entries, cursor = index.query(level='INFO', cursor=cursor, limit=3)
+            seen.extend(self.messages(entries))
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [f'minute {minute} INFO' for minute in range(20)])
+
+    def test_rotated_away_cursor_is_rejected(self):
+        """Test that a cursor into a deleted file does not restart from the oldest file"""
+        index = LogIndex(self.filename)
+        _, cursor = index.query(start='2026-01-01 10:00:00', limit=3)
+        os.remove(f'{self.filename}.1')
+
+        with self.assertRaises(InvalidCursor):
+            index.query(cursor=cursor)
+        with self.assertRaises(InvalidCursor):
+            index.query(cursor='1-2')
+
+    def test_malformed_cursor_is_rejected(self):
+        """Test that a cursor that is not inode-offset raises InvalidCursor"""
+        with self.assertRaises(InvalidCursor):
+            LogIndex(self.filename).query(cursor='abc')
+
+    def test_continuation_lines_follow_their_entry(self):
+        """Test that lines without a timestamp belong to the entry above"""
+        entries, _ = LogIndex(self.filename).query(start='2026-01-01 10:19:40')
+
+        self.assertEqual(self.messages(entries), ['minute 19 ERROR', 'Traceback line without separators'])
+
+    def test_incremental_update_and_sidecar(self):
+        """Test that appended lines are indexed without rescanning the file"""
+        LogIndex(self.filename).update()
+        write_lines(self.filename, [20])
+
+        index = LogIndex(self.filename)
+        with open(index.index_path, encoding='utf-8') as f:
+            indexed_size = sum(entry['indexed_size'] for entry in json.load(f)['files'].values())
+        entries, _ = index.query(start='2026-01-01 10:20:00')
+
+        self.assertEqual(self.messages(entries), ['minute 20 INFO', 'minute 20 ERROR'])
+        self.assertLess(indexed_size, os.path.getsize(self.filename) + os.path.getsize(f'{self.filename}.1'))
+
+    def test_rotation_keeps_entries_by_inode(self):
+        """Test that renamed files keep their index entry and new files are indexed"""
+        index = LogIndex(self.filename)
+        index.update()
+        os.rename(f'{self.filename}.1', f'{self.filename}.2')
+        os.rename(self.filename, f'{self.filename}.1')
+        write_lines(self.filename, [20], mode='w')
+
+        entries, _ = index.query(start='2026-01-01 10:00:00', end='2026-01-01 10:00:59')
+        newest, _ = index.query(start='2026-01-01 10:20:00')
+
+        self.assertEqual(self.messages(entries), ['minute 0 INFO', 'minute 0 ERROR'])
+        self.assertEqual(self.messages(newest), ['minute 20 INFO', 'minute 20 ERROR'])
+
+    def test_truncated_file_is_reindexed(self):
+        """Test that a file that shrank is indexed from the start again"""
+        index = LogIndex(self.filename)
+        index.update()
+        write_lines(self.filename, [30], mode='w')
+
+        entries, _ = index.query(start='2026-01-01 10:10:00')
+
+        self.assertEqual(self.messages(entries), ['minute 30 INFO', 'minute 30 ERROR'])
+
+
+if __name__ == '__main__':
+    unittest.main()
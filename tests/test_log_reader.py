@@ -0,0 +1,134 @@
+"""
+Unit tests for the log file reader
+"""
+import os
+import tempfile
+import unittest
+from log_reader import follow_log, iter_lines_reverse, parse_log_line, tail_log
+
+
+class TestLogReader(unittest.TestCase):
+    """Test cases for reading log files backwards"""
+
+    def setUp(self):
+        """Write a sample log file"""
+        handle, self.filename = tempfile.mkstemp(suffix='.log')
+        levels = ['INFO', 'WARNING', 'INFO', 'ERROR']
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            for i in range(200):
+                f.write(f'2026-01-01 00:00:{i % 60:02d},000 - plex_service - {levels[i % 4]} - message {i}\n')
+            f.write('Traceback line without separators\n\n')
+
+    def tearDown(self):
+        """Remove the sample log file"""
+        os.remove(self.filename)
+
+    def test_reverse_iteration_across_blocks(self):
+        """Test that lines split across block boundaries are reassembled"""
+        with open(self.filename, 'rb') as f:
+            lines = [line for line in iter_lines_reverse(f, block_size=7) if line]
+        with open(self.filename, encoding='utf-8') as f:
+            expected = [line for line in f.read().split('\n') if line]
+        self.assertEqual(lines, list(reversed(expected)))
+
+    def test_tail_returns_last_entries_oldest_first(self):
+        """Test that the newest lines are returned in file order"""
+        entries = tail_log(self.filename, max_lines=3, block_size=64)
+
+        self.assertEqual([entry['message'] for entry in entries],
+                         ['message 198', 'message 199', 'Traceback line without separators'])
+        self.assertEqual(entries[-1]['level'], 'UNKNOWN')
+
+    def test_tail_with_level_filter(self):
+        """Test that only lines of the requested level are counted"""
+        entries = tail_log(self.filename, max_lines=2, level_filter='ERROR', block_size=64)
+
+        self.assertEqual([entry['message'] for entry in entries], ['message 195', 'message 199'])
+        self.assertTrue(all(entry['level'] == 'ERROR' for entry in entries))
+
+    def test_missing_file(self):
+        """Test that a missing file yields no entries"""
+        self.assertEqual(tail_log(self.filename + '.missing'), [])
+
+    def test_parse_log_line(self):
+        """Test splitting a formatted line"""
+        entry = parse_log_line('2026-01-01 00:00:00,000 - app - INFO - a - b')
+        self.assertEqual(entry['logger'], 'app')
+        self.assertEqual(entry['message'], 'a - b')
+
+    def test_parse_json_line(self):
+        """Test reading a structured JSON line"""
+        entry = parse_log_line('{"timestamp": "2026-01-01 00:00:00,000", "logger": "app", '
+                               '"level": "ERROR", "message": "a - b\\nTraceback"}')
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertEqual(entry['message'], 'a - b\nTraceback')
+
+    def test_tail_mixed_formats_with_level_filter(self):
+        """Test that JSON lines are filtered by level like text lines"""
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write('{"timestamp": "2026-01-01 00:01:00,000", "logger": "app", "level": "ERROR", "message": "json"}\n')
+        entries = tail_log(self.filename, max_lines=2, level_filter='ERROR')
+
+        self.assertEqual([entry['message'] for entry in entries], ['message 199', 'json'])
+
+
+
+class TestFollowLog(unittest.TestCase):
+    """Test cases for following a log file like 'tail -f'"""
+
+    def setUp(self):
+        """Create a log file with existing content"""
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'app.log')
+        self.write('old line', mode='w')
+        self.follower = follow_log(self.filename, poll_interval=0.01, heartbeat=0.05)
+
+    def tearDown(self):
+        """Close the follower and remove the directory"""
+        self.follower.close()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def write(self, message, level='INFO', mode='a'):
+        with open(self.filename, mode, encoding='utf-8') as f:
+            f.write(f'2026-01-01 00:00:00,000 - app - {level} - {message}\n')
+
+    def next_entries(self, count):
+        """Collect count entries, skipping heartbeats"""
+        entries = []
+        while len(entries) < count:
+            entry = next(self.follower)
+            if entry is not None:
+                entries.append(entry['message'])
+        return entries
+
+    def test_only_new_lines_with_heartbeats(self):
+        """Test that existing content is skipped and idle periods yield None"""
+        self.assertIsNone(next(self.follower))
+        self.write('new line')
+
+        self.assertEqual(self.next_entries(1), ['new line'])
+
+    def test_level_filter(self):
+        """Test that entries of other levels are not streamed"""
+        self.follower.close()
+        self.follower = follow_log(self.filename, level_filter='ERROR', poll_interval=0.01, heartbeat=0.05)
+        next(self.follower)
+        self.write('skipped', level='INFO')
+        self.write('kept', level='ERROR')
+
+        self.assertEqual(self.next_entries(1), ['kept'])
+
+    def test_follows_rotation(self):
+        """Test that lines written before and after a rotation are all streamed"""
+        next(self.follower)
+        self.write('before rotation')
+        os.rename(self.filename, self.filename + '.1')
+        self.write('after rotation', mode='w')
+
+        self.assertEqual(self.next_entries(2), ['before rotation', 'after rotation'])
+
+
+if __name__ == '__main__':
+    unittest.main()
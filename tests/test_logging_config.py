@@ -0,0 +1,125 @@
+"""
+Unit tests for the logging setup
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from logging.handlers import QueueHandler
+from log_reader import tail_log
+from unittest.mock import patch
+import logging_config
+from logging_config import JsonFormatter, configure_logging, start_log_writer, stop_listener
+
+
+def log_from_worker(message):
+    """Runs in a forked process, like a gunicorn worker"""
+    configure_logging(log_format='text', use_queue=False)
+    logging.getLogger('worker').info(message)
+
+
+class TestLoggingConfig(unittest.TestCase):
+    """Test cases for JSON output and queue-based logging"""
+
+    def setUp(self):
+        """Log into a temporary directory and keep the current root handlers"""
+        self.root = logging.getLogger()
+        self.saved_handlers = self.root.handlers[:]
+        self.saved_level = self.root.level
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        """Restore the root logger and remove the log files"""
+        for handler in self.root.handlers:
+            handler.close()
+        self.root.handlers = self.saved_handlers
+        self.root.setLevel(self.saved_level)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_json_formatter_includes_traceback(self):
+        """Test that exceptions stay on one JSON line"""
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('app', logging.ERROR, __file__, 1, 'failed %s', ('x',), sys.exc_info())
+        line = JsonFormatter().format(record)
+
+        self.assertNotIn('\n', line)
+        entry = json.loads(line)
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertTrue(entry['message'].startswith('failed x\nTraceback'))
+
+    def test_queue_mode_writes_json_lines(self):
+        """Test that records go through the listener thread into app.log and error.log"""
+        listener = configure_logging(log_format='json', use_queue=True)
+        self.assertIsInstance(self.root.handlers[0], QueueHandler)
+
+        logging.getLogger('plex_service').info('synced')
+        logging.getLogger('plex_service').error('failed')
+        stop_listener(listener)
+
+        app_entries = tail_log('app.log')
+        self.assertEqual([(entry['level'], entry['message']) for entry in app_entries],
+                         [('INFO', 'synced'), ('ERROR', 'failed')])
+        self.assertEqual([entry['message'] for entry in tail_log('error.log')], ['failed'])
+
+    def test_direct_mode_keeps_text_format(self):
+        """Test that the default setup writes the plain text format"""
+        self.assertIsNone(configure_logging(log_format='text', use_queue=False))
+
+        logging.getLogger('app').warning('careful')
+        for handler in self.root.handlers:
+            handler.flush()
+
+        with open('app.log', encoding='utf-8') as f:
+            self.assertIn(' - app - WARNING - careful', f.read())
+
+    def test_debug_level_shows_plex_calls(self):
+        """Test that LOG_LEVEL=DEBUG lets per-call Plex lines reach app.log"""
+        from tracing import record_call
+
+        configure_logging(log_format='text', use_queue=False, level='debug')
+        record_call('GET', 'plex.tv/api/v2/friends', 200, 512, 0.25)
+        for handler in self.root.handlers:
+            handler.flush()
+
+        with open('app.log', encoding='utf-8') as f:
+            self.assertIn('tracing - DEBUG - Plex GET plex.tv/api/v2/friends -> 200', f.read())
+
+    def test_unknown_level_falls_back_to_info(self):
+        """Test that a mistyped LOG_LEVEL keeps the INFO default"""
+        configure_logging(log_format='text', use_queue=False, level='verbose')
+
+        self.assertEqual(self.root.level, logging.INFO)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_workers_log_through_the_writer(self):
+        """Test that forked processes leave app.log to the process running the writer"""
+        import multiprocessing
+
+        with patch.object(logging_config, '_writer_queue', None):
+            listener = start_log_writer(log_format='text')
+            try:
+                context = multiprocessing.get_context('fork')
+                workers = [context.Process(target=log_from_worker, args=(f'hello {n}',)) for n in range(2)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join(10)
+            finally:
+                stop_listener(listener)
+            for handler in listener.handlers:
+                handler.close()
+
+        messages = sorted(entry['message'] for entry in tail_log('app.log'))
+        self.assertEqual(messages, ['hello 0', 'hello 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Unit tests for the metrics registry and the /metrics endpoint
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from app import app
+from database import db
+from metrics import Counter, DB_QUERIES, Histogram, MetricsRegistry, MetricsStore
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Test cases for counters, histograms and their text format"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.registry = MetricsRegistry()
+        self.requests = Counter('requests_total', 'Requests', ['path'], registry=self.registry)
+        self.latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1), registry=self.registry)
+
+    def test_render(self):
+        """Test the Prometheus text exposition of counters and histograms"""
+        self.requests.inc(path='/a')
+        self.requests.inc(2, path='/a')
+        self.requests.inc(path='say "hi"\n')
+        for value in (0.05, 0.5, 0.5, 3):
+            self.latency.observe(value)
+
+        lines = self.registry.render().splitlines()
+
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{path="/a"} 3', lines)
+        self.assertIn('requests_total{path="say \\"hi\\"\\n"} 1', lines)
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_sum 4.05', lines)
+        self.assertIn('latency_seconds_count 4', lines)
+
+    def test_duplicate_names_are_rejected(self):
+        """Test that a metric name can only be registered once"""
+        with self.assertRaises(ValueError):
+            Counter('requests_total', 'Again', registry=self.registry)
+
+    def test_workers_are_added_up(self):
+        """Test that /metrics sums the values published by other workers"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.requests.inc(path='/a')
+        self.latency.observe(0.5)
+        # Another live worker (the parent process) and a dead one
+        other = {'requests_total': [[['/a'], 4]], 'latency_seconds': [[[], [1, 0, 1, 0.05]]]}
+        for pid in (os.getppid(), 99999999):
+            with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                json.dump(other, f)
+
+        store = MetricsStore(directory, registry=self.registry, interval=3600)
+        store.start()
+        self.addCleanup(store.stop)
+        lines = store.render().splitlines()
+
+        self.assertIn('requests_total{path="/a"} 5', lines)
+        self.assertIn('latency_seconds_count 2', lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertFalse(os.path.exists(os.path.join(directory, '99999999.json')))
+        store.flush()
+        with open(store.path) as f:
+            self.assertEqual(json.load(f)['requests_total'], [[['/a'], 1]])
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """Test cases for the /metrics route and request instrumentation"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_requests_and_queries_are_recorded(self):
+        """Test that request latency and database queries show up on /metrics"""
+        selects = DB_QUERIES.value(operation='SELECT')
+        self.client.post('/login', data={'username': 'nobody', 'password': 'x'})
+
+        response = self.client.get('/metrics')
+        body = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('http_request_duration_seconds_count{endpoint="login",method="POST",status="200"}', body)
+        self.assertIn('http_request_db_queries_count{endpoint="login"}', body)
+        self.assertGreater(DB_QUERIES.value(operation='SELECT'), selects)
+
+    def test_token(self):
+        """Test that METRICS_TOKEN requires a matching bearer token"""
+        with patch('app.METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer nope'}).status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Unit tests for the schema migration framework
+"""
+import os
+import tempfile
+import unittest
+from sqlalchemy import create_engine, inspect
+from migrations import MIGRATIONS, get_schema_version, run_migrations
+
+
+class TestMigrations(unittest.TestCase):
+    """Test cases for upgrading a legacy database"""
+
+    def setUp(self):
+        """Create a database with the pre-migration schema"""
+        handle, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = create_engine(f'sqlite:///{self.db_path}')
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                'CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(150), password_hash VARCHAR(128))'
+            )
+            conn.exec_driver_sql(
+                'CREATE TABLE share (id INTEGER PRIMARY KEY, plex_user_id INTEGER, library_id INTEGER, '
+                'start_date DATETIME, expiration_date DATETIME, is_active BOOLEAN)'
+            )
+            conn.exec_driver_sql(
+                'CREATE TABLE plex_user (id INTEGER PRIMARY KEY, plex_id VARCHAR(50), username VARCHAR(100), '
+                'email VARCHAR(100), thumb VARCHAR(255))'
+            )
+            conn.exec_driver_sql("INSERT INTO user (username) VALUES ('admin'), ('viewer')")
+            conn.exec_driver_sql(
+                'INSERT INTO share (plex_user_id, library_id, is_active) VALUES (1, 1, 0), (1, 1, 1), (1, 2, 1)'
+            )
+
+    def tearDown(self):
+        """Remove the temporary database"""
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    def test_upgrade_legacy_database(self):
+        """Test that all migrations apply and the version is recorded"""
+        version = run_migrations(self.engine)
+
+        self.assertEqual(version, MIGRATIONS[-1][0])
+        self.assertEqual(get_schema_version(self.engine), version)
+
+        columns = [column['name'] for column in inspect(self.engine).get_columns('user')]
+        self.assertIn('role', columns)
+        with self.engine.connect() as conn:
+            roles = dict(conn.exec_driver_sql('SELECT username, role FROM user').fetchall())
+        self.assertEqual(roles, {'admin': 'admin', 'viewer': 'auditor'})
+
+    def test_share_indexes_and_dedupe(self):
+        """Test that duplicate shares are collapsed before the unique index is added"""
+        run_migrations(self.engine)
+
+        indexes = {index['name']: index for index in inspect(self.engine).get_indexes('share')}
+        self.assertTrue(indexes['ix_share_user_library']['unique'])
+        self.assertIn('ix_share_start_date', indexes)
+        self.assertIn('ix_share_expiration_date', indexes)
+        with self.engine.connect() as conn:
+            rows = conn.exec_driver_sql('SELECT plex_user_id, library_id, is_active FROM share ORDER BY id').fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(1, 1, 1), (1, 2, 1)])
+
+    def test_plex_user_indexes(self):
+        """Test that the listing indexes are added to an existing plex_user table"""
+        run_migrations(self.engine)
+
+        indexes = [index['name'] for index in inspect(self.engine).get_indexes('plex_user')]
+        self.assertIn('ix_plex_user_username', indexes)
+        self.assertIn('ix_plex_user_email', indexes)
+
+    def test_plex_user_search_index(self):
+        """Test that existing users are indexed and new ones follow via triggers"""
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO plex_user (plex_id, username, email) VALUES ('1', 'alice', 'a@x.org')")
+        run_migrations(self.engine)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO plex_user (plex_id, username, email) VALUES ('2', 'alfred', NULL)")
+            rows = conn.exec_driver_sql(
+                "SELECT rowid FROM plex_user_fts WHERE plex_user_fts MATCH 'al*' ORDER BY rowid"
+            ).fetchall()
+        self.assertEqual([row[0] for row in rows], [1, 2])
+
+    def test_migrations_run_once(self):
+        """Test that a second run applies nothing"""
+        first = run_migrations(self.engine)
+        second = run_migrations(self.engine)
+
+        self.assertEqual(first, second)
+        with self.engine.connect() as conn:
+            count = conn.exec_driver_sql('SELECT COUNT(*) FROM schema_version').scalar()
+        self.assertEqual(count, len(MIGRATIONS))
+
+
+if __name__ == '__main__':
+    unittest.main()
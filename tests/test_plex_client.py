@@ -0,0 +1,171 @@
+"""
+Unit tests for the shared Plex client manager
+"""
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from metrics import PLEX_REQUEST_LATENCY
+from plex_client import (PlexClientManager, RateLimiter, RateLimitedSession, SectionIndex, retry_after_seconds,
+                         url_template)
+
+
+class TestRateLimiting(unittest.TestCase):
+    """Test cases for the token bucket and 429 handling"""
+
+    def test_burst_then_throttle(self):
+        """Test that requests beyond the burst wait for new tokens"""
+        limiter = RateLimiter(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        # Two tokens are free, the next two need ~20ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.03)
+
+    def test_pause_blocks_callers(self):
+        """Test that a pause delays the next acquire even when unlimited"""
+        limiter = RateLimiter(rate=0, burst=1)
+        limiter.pause(0.05)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_no_burst_after_pause(self):
+        """Test that tokens do not accumulate while paused"""
+        limiter = RateLimiter(rate=20, burst=10)
+        limiter.pause(0.2)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        # Pause, then ~50ms per token instead of three at once
+        self.assertGreaterEqual(time.monotonic() - start, 0.2 + 0.1)
+
+    def test_retry_after_parsing(self):
+        """Test Retry-After parsing with seconds, garbage and caps"""
+        response = SimpleNamespace(headers={'Retry-After': '3'})
+        self.assertEqual(retry_after_seconds(response, default=1), 3)
+        response.headers['Retry-After'] = 'soon'
+        self.assertEqual(retry_after_seconds(response, default=1), 1)
+        response.headers['Retry-After'] = '3600'
+        self.assertEqual(retry_after_seconds(response, default=1), 60)
+
+    def test_session_retries_429(self):
+        """Test that plex.tv 429 responses are retried after Retry-After"""
+        session = RateLimitedSession(RateLimiter(rate=0, burst=1))
+        responses = [SimpleNamespace(status_code=429, headers={'Retry-After': '0'}, content=b''),
+                     SimpleNamespace(status_code=200, headers={}, content=b'')]
+        with patch('requests.Session.request', side_effect=responses) as mock_request:
+            response = session.get('https://plex.tv/api/users')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_request.call_count, 2)
+
+    def test_calls_are_timed_per_endpoint(self):
+        """Test that every attempt is recorded under its URL template and status"""
+        session = RateLimitedSession(RateLimiter(rate=0, burst=1))
+        labels = {'method': 'GET', 'endpoint': 'plex.tv/api/v2/friends/:id'}
+        before_429 = PLEX_REQUEST_LATENCY.count(status='429', **labels)
+        before_200 = PLEX_REQUEST_LATENCY.count(status='200', **labels)
+        responses = [SimpleNamespace(status_code=429, headers={'Retry-After': '0'}, content=b''),
+                     SimpleNamespace(status_code=200, headers={}, content=b'')]
+        with patch('requests.Session.request', side_effect=responses):
+            session.get('https://plex.tv/api/v2/friends/123?X-Plex-Token=secret')
+
+        self.assertEqual(PLEX_REQUEST_LATENCY.count(status='429', **labels), before_429 + 1)
+        self.assertEqual(PLEX_REQUEST_LATENCY.count(status='200', **labels), before_200 + 1)
+
+    def test_url_template(self):
+        """Test that ids and tokens are removed from endpoint names"""
+        self.assertEqual(url_template('https://plex.tv/api/servers/0123456789abcdef0123/shared_servers/42'),
+                         'plex.tv/api/servers/:id/shared_servers/:id')
+        self.assertEqual(url_template('http://192.168.1.10:32400/library/sections/3/all?X-Plex-Token=t'),
+                         'server/library/sections/:id/all')
+        self.assertEqual(url_template('https://clients.plex.tv/api/v2/user'), 'clients.plex.tv/api/v2/user')
+
+
+class TestSectionIndex(unittest.TestCase):
+    """Test cases for the library section index"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.index = SectionIndex([
+            SimpleNamespace(key=1, title='Movies'),
+            SimpleNamespace(key=2, title='Default'),
+        ])
+
+    def test_lookup_by_key(self):
+        """Test that sections resolve by string or integer key"""
+        self.assertEqual(self.index.get('1').title, 'Movies')
+        self.assertEqual(self.index.get(1).title, 'Movies')
+        self.assertIsNone(self.index.get('9'))
+
+    def test_default_library(self):
+        """Test that the Default library is found case-insensitively"""
+        self.assertEqual(self.index.default.key, 2)
+        self.assertIsNone(SectionIndex([]).default)
+
+
+@patch('plex_client.MyPlexAccount')
+@patch('plex_client.PlexServer')
+class TestPlexClientManager(unittest.TestCase):
+    """Test cases for server/account caching"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.manager = PlexClientManager(ttl=60, pool_size=4, timeout=5)
+
+    def test_server_is_reused(self, mock_server, mock_account):
+        """Test that repeated lookups share one PlexServer and session"""
+        first = self.manager.get_server('http://plex:32400', 'token')
+        second = self.manager.get_server('http://plex:32400', 'token')
+
+        self.assertIs(first, second)
+        mock_server.assert_called_once_with('http://plex:32400', 'token',
+                                            session=self.manager.session, timeout=5)
+
+    def test_account_is_reused(self, mock_server, mock_account):
+        """Test that the MyPlexAccount is only created once"""
+        self.manager.get_account('http://plex:32400', 'token')
+        self.manager.get_account('http://plex:32400', 'token')
+
+        mock_account.assert_called_once()
+
+    def test_credential_change_reconnects(self, mock_server, mock_account):
+        """Test that new credentials rebuild the cached objects"""
+        self.manager.get_account('http://plex:32400', 'token')
+        self.manager.get_account('http://plex:32400', 'other-token')
+
+        self.assertEqual(mock_server.call_count, 2)
+        self.assertEqual(mock_account.call_count, 2)
+
+    def test_ttl_expiry_reconnects(self, mock_server, mock_account):
+        """Test that expired objects are rebuilt"""
+        self.manager.ttl = 0
+        self.manager.get_server('http://plex:32400', 'token')
+        self.manager.get_server('http://plex:32400', 'token')
+
+        self.assertEqual(mock_server.call_count, 2)
+
+    @patch('plex_client.SectionIndex.fetch')
+    def test_section_index_is_cached(self, mock_fetch, mock_server, mock_account):
+        """Test that the section index is only reloaded on refresh"""
+        self.manager.get_section_index('http://plex:32400', 'token')
+        self.manager.get_section_index('http://plex:32400', 'token')
+        self.assertEqual(mock_fetch.call_count, 1)
+
+        self.manager.get_section_index('http://plex:32400', 'token', refresh=True)
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    def test_invalidate(self, mock_server, mock_account):
+        """Test that invalidate forces a reconnect but keeps the session"""
+        session = self.manager.session
+        self.manager.get_server('http://plex:32400', 'token')
+        self.manager.invalidate()
+        self.manager.get_server('http://plex:32400', 'token')
+
+        self.assertEqual(mock_server.call_count, 2)
+        self.assertIs(self.manager.session, session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,425 @@
+"""
+Unit tests for the Plex service reconciliation logic
+"""
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import ANY, MagicMock, patch
+from app import app, job_runner
+from database import db
+from metrics import RECONCILE_DURATION, RECONCILE_USERS
+from models import PlexUser, Library, Share, AppliedAccess, User
+from plex_client import SectionIndex
+from settings_store import settings_cache
+import plex_service
+
+
+class TestUpdateUserAccess(unittest.TestCase):
+    """Test cases for pushing a user's libraries to Plex"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.movies = SimpleNamespace(key=1, title='Movies')
+        self.default = SimpleNamespace(key=3, title='Default')
+        self.index = SectionIndex([self.movies, SimpleNamespace(key=2, title='Shows'), self.default])
+        self.account = MagicMock()
+
+    def test_sections_resolved_from_index(self):
+        """Test that sections come from the index and Default is always added"""
+        plex = MagicMock()
+        friend = SimpleNamespace(id=100, title='alice', email='alice@example.com')
+        context = plex_service.AccessContext(plex, self.account, self.index, {'100': friend})
+
+        success, _ = plex_service.update_user_access('100', ['1'], context)
+
+        self.assertTrue(success)
+        plex.library.sections.assert_not_called()
+        self.account.user.assert_not_called()
+        kwargs = self.account.updateFriend.call_args.kwargs
+        self.assertIs(kwargs['user'], friend)
+        self.assertEqual(kwargs['sections'], [self.movies, self.default])
+
+    def test_no_libraries_skips_plex(self):
+        """Test that an empty library set never reaches Plex"""
+        with patch('plex_service.get_plex_server') as mock_server:
+            success, _ = plex_service.update_user_access('100', [])
+
+        self.assertTrue(success)
+        mock_server.assert_not_called()
+
+
+@patch('plex_service.AccessContext.load')
+class TestCheckSchedules(unittest.TestCase):
+    """Test cases for diff-based schedule reconciliation"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.movies = Library(plex_key='1', title='Movies', type='movie')
+        self.shows = Library(plex_key='2', title='Shows', type='show')
+        self.alice = PlexUser(plex_id='100', username='alice')
+        self.bob = PlexUser(plex_id='200', username='bob')
+        db.session.add_all([self.movies, self.shows, self.alice, self.bob])
+        db.session.flush()
+
+        yesterday = datetime.now() - timedelta(days=1)
+        db.session.add_all([
+            Share(plex_user_id=self.alice.id, library_id=self.movies.id, is_active=True),
+            Share(plex_user_id=self.alice.id, library_id=self.shows.id, is_active=True,
+                  expiration_date=yesterday),
+            Share(plex_user_id=self.bob.id, library_id=self.shows.id, is_active=True),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_fingerprint_ignores_order_and_type(self, mock_load):
+        """Test that fingerprints only depend on the set of keys"""
+        self.assertEqual(plex_service.access_fingerprint(['2', 1]),
+                         plex_service.access_fingerprint([1, '2', '2']))
+        self.assertNotEqual(plex_service.access_fingerprint(['1']),
+                            plex_service.access_fingerprint(['1', '2']))
+
+    def test_effective_access_single_pass(self, mock_load):
+        """Test that effective access is grouped per user with date filtering"""
+        carol = PlexUser(plex_id='300', username='carol')
+        db.session.add(carol)
+        db.session.add(Share(plex_user_id=self.bob.id, library_id=self.movies.id, is_active=True,
+                             start_date=datetime.now() + timedelta(days=1)))
+        db.session.commit()
+
+        rows = {row.plex_id: row for row in plex_service.iter_effective_access(chunk_size=2)}
+
+        self.assertEqual(rows['100'].library_keys, ('1',))
+        self.assertEqual(rows['200'].library_keys, ('2',))
+        self.assertEqual(rows['300'].library_keys, ())
+        self.assertIsNone(rows['100'].applied_fingerprint)
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_first_run_updates_everyone(self, mock_update, mock_load):
+        """Test that users without an applied fingerprint are pushed"""
+        summary = plex_service.check_schedules()
+
+        self.assertEqual(summary, {'updated': 2, 'skipped': 0, 'not_applied': 0, 'failed': 0, 'errors': {}})
+        mock_update.assert_any_call('100', ['1'], ANY)
+        mock_update.assert_any_call('200', ['2'], ANY)
+        self.assertEqual(AppliedAccess.query.count(), 2)
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_unchanged_users_are_skipped(self, mock_update, mock_load):
+        """Test that a second run does not call Plex again"""
+        plex_service.check_schedules()
+        mock_update.reset_mock()
+
+        summary = plex_service.check_schedules()
+
+        self.assertEqual(summary, {'updated': 0, 'skipped': 2, 'not_applied': 0, 'failed': 0, 'errors': {}})
+        self.assertNotIn('results', summary)
+        mock_update.assert_not_called()
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_changed_share_is_pushed(self, mock_update, mock_load):
+        """Test that only the user whose access changed is pushed"""
+        plex_service.check_schedules()
+        mock_update.reset_mock()
+
+        db.session.add(Share(plex_user_id=self.bob.id, library_id=self.movies.id, is_active=True))
+        db.session.commit()
+
+        summary = plex_service.check_schedules()
+
+        self.assertEqual(summary, {'updated': 1, 'skipped': 1, 'not_applied': 0, 'failed': 0, 'errors': {}})
+        mock_update.assert_called_once_with('200', ['1', '2'], ANY)
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_revoking_last_library_is_not_applied(self, mock_update, mock_load):
+        """Test that removing every library is reported instead of claimed as updated"""
+        plex_service.check_schedules()
+        mock_update.reset_mock()
+        applied = AppliedAccess.query.filter_by(plex_user_id=self.bob.id).first().fingerprint
+
+        share = Share.query.filter_by(plex_user_id=self.bob.id).first()
+        share.is_active = False
+        db.session.commit()
+
+        summary = plex_service.reconcile_access(per_user=True)
+
+        self.assertEqual((summary['updated'], summary['skipped'], summary['not_applied']), (0, 1, 1))
+        mock_update.assert_not_called()
+        self.assertEqual(AppliedAccess.query.filter_by(plex_user_id=self.bob.id).first().fingerprint, applied)
+        statuses = {result.username: result.status for result in summary['results']}
+        self.assertEqual(statuses, {'alice': 'skipped', 'bob': 'not_applied'})
+
+        # Reported once: later runs skip bob until his access changes again
+        self.assertEqual(plex_service.check_schedules()['skipped'], 2)
+        share.is_active = True
+        db.session.commit()
+        plex_service.check_schedules()
+        self.assertIsNone(AppliedAccess.query.filter_by(plex_user_id=self.bob.id).first().not_applied_at)
+        share.is_active = False
+        db.session.commit()
+        self.assertEqual(plex_service.check_schedules()['not_applied'], 1)
+
+    @patch('plex_service.update_user_access')
+    def test_users_never_shared_are_skipped(self, mock_update, mock_load):
+        """Test that users without libraries and without pushed access need no call"""
+        Share.query.delete()
+        db.session.commit()
+
+        summary = plex_service.check_schedules()
+
+        self.assertEqual(summary['skipped'], 2)
+        mock_update.assert_not_called()
+        mock_load.assert_not_called()
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_outcomes_are_counted(self, mock_update, mock_load):
+        """Test that each run records its duration and per-user outcomes"""
+        runs = RECONCILE_DURATION.count()
+        updated = RECONCILE_USERS.value(outcome='updated')
+        skipped = RECONCILE_USERS.value(outcome='skipped')
+
+        plex_service.check_schedules()
+        plex_service.check_schedules()
+
+        self.assertEqual(RECONCILE_DURATION.count(), runs + 2)
+        self.assertEqual(RECONCILE_USERS.value(outcome='updated'), updated + 2)
+        self.assertEqual(RECONCILE_USERS.value(outcome='skipped'), skipped + 2)
+
+    def test_plex_unavailable(self, mock_load):
+        """Test that a missing Plex connection fails the run without recording anything"""
+        mock_load.return_value = None
+
+        summary = plex_service.check_schedules()
+
+        self.assertEqual(summary['failed'], 2)
+        self.assertEqual(AppliedAccess.query.count(), 0)
+
+    @patch('plex_service.update_user_access', return_value=(False, 'boom'))
+    def test_failed_users_are_retried(self, mock_update, mock_load):
+        """Test that failures are counted and not recorded as applied"""
+        summary = plex_service.check_schedules()
+
+        self.assertEqual(summary['failed'], 2)
+        self.assertEqual(summary['errors'], {'alice': 'boom', 'bob': 'boom'})
+        self.assertEqual(AppliedAccess.query.count(), 0)
+
+
+@patch('plex_service.AccessContext.load')
+class TestBulkAccess(unittest.TestCase):
+    """Test cases for changing many users' shares at once"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.movies = Library(plex_key='1', title='Movies', type='movie')
+        self.shows = Library(plex_key='2', title='Shows', type='show')
+        self.alice = PlexUser(plex_id='100', username='alice')
+        self.bob = PlexUser(plex_id='200', username='bob')
+        moderator = User(username='moderator', role=User.ROLE_MODERATOR)
+        moderator.set_password('mod')
+        db.session.add_all([self.movies, self.shows, self.alice, self.bob, moderator])
+        db.session.flush()
+        db.session.add_all([
+            Share(plex_user_id=self.alice.id, library_id=self.movies.id, is_active=True),
+            Share(plex_user_id=self.alice.id, library_id=self.shows.id, is_active=False),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def shares(self):
+        return {
+            (share.plex_user_id, share.library_id): (share.is_active, share.expiration_date)
+            for share in Share.query.all()
+        }
+
+    def test_grant_creates_and_reactivates_shares(self, mock_load):
+        """Test that grant upserts every user/library pair with the date window"""
+        until = datetime(2099, 1, 1)
+        user_ids, written = plex_service.apply_bulk_access(
+            [self.alice.id, self.bob.id, 999], [self.shows.id], 'grant', expiration_date=until
+        )
+        db.session.commit()
+
+        self.assertEqual(sorted(user_ids), [self.alice.id, self.bob.id])
+        self.assertEqual(written, 2)
+        shares = self.shares()
+        self.assertEqual(shares[(self.alice.id, self.shows.id)], (True, until))
+        self.assertEqual(shares[(self.bob.id, self.shows.id)], (True, until))
+        self.assertEqual(shares[(self.alice.id, self.movies.id)], (True, None))
+
+    def test_revoke_and_window_only_touch_existing_shares(self, mock_load):
+        """Test that revoke and window never create shares"""
+        until = datetime(2099, 1, 1)
+        plex_service.apply_bulk_access([self.alice.id, self.bob.id], [self.movies.id], 'window',
+                                       expiration_date=until)
+        _, written = plex_service.apply_bulk_access([self.alice.id, self.bob.id], [self.movies.id], 'revoke')
+        db.session.commit()
+
+        self.assertEqual(written, 1)
+        self.assertEqual(self.shares()[(self.alice.id, self.movies.id)], (False, until))
+        self.assertEqual(len(self.shares()), 2)
+
+    def test_unknown_action(self, mock_load):
+        """Test that only the supported actions are accepted"""
+        with self.assertRaises(ValueError):
+            plex_service.apply_bulk_access([self.alice.id], [self.movies.id], 'delete')
+
+    @patch('plex_service.update_user_access')
+    def test_bulk_endpoint_reports_per_user_results(self, mock_update, mock_load):
+        """Test that the endpoint saves the shares and pushes every selected user"""
+        mock_update.side_effect = lambda plex_id, keys, context: (plex_id == '100', 'ok' if plex_id == '100' else 'boom')
+        client = self.app.test_client()
+        client.post('/login', data={'username': 'moderator', 'password': 'mod'})
+
+        response = client.post('/api/access/bulk', json={
+            'action': 'grant', 'user_ids': [self.alice.id, self.bob.id], 'library_ids': [self.shows.id],
+        })
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['shares_written'], 2)
+        job_runner.wait(response.json['job_id'], timeout=10)
+        job = client.get(response.json['status_url']).json
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['progress'], {'done': 2, 'total': 2, 'failures': 1})
+        statuses = {result['username']: result['status'] for result in job['result']['results']}
+        self.assertEqual(statuses, {'alice': 'updated', 'bob': 'failed'})
+        mock_update.assert_any_call('100', ['1', '2'], ANY)
+        self.assertEqual(AppliedAccess.query.count(), 1)
+
+    def test_bulk_endpoint_validates_input(self, mock_load):
+        """Test that malformed requests are rejected before touching the database"""
+        client = self.app.test_client()
+        client.post('/login', data={'username': 'moderator', 'password': 'mod'})
+
+        self.assertEqual(client.post('/api/access/bulk', json={'action': 'nuke'}).status_code, 400)
+        self.assertEqual(client.post('/api/access/bulk', json={
+            'action': 'grant', 'user_ids': [self.alice.id], 'library_ids': [],
+        }).status_code, 400)
+        self.assertEqual(client.post('/api/access/bulk', json={
+            'action': 'window', 'user_ids': [self.alice.id], 'library_ids': [self.movies.id],
+            'start_date': 'tomorrow',
+        }).status_code, 400)
+
+
+class TestSyncPlexData(unittest.TestCase):
+    """Test cases for the bulk Plex sync"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        settings_cache.invalidate()
+
+        self.plex = SimpleNamespace(friendlyName='Test Server', machineIdentifier='machine-1')
+        self.sections = SectionIndex([
+            SimpleNamespace(key=1, title='Movies', type='movie'),
+            SimpleNamespace(key=2, title='Shows', type='show'),
+        ])
+        shared = SimpleNamespace(machineIdentifier='machine-1', sections=[SimpleNamespace(key=1)])
+        other = SimpleNamespace(machineIdentifier='machine-2', sections=[SimpleNamespace(key=2)])
+        self.friends = [
+            SimpleNamespace(id=100, title='alice', email='a@example.com', thumb=None, servers=[shared, other]),
+            SimpleNamespace(id=200, title='bob', email='b@example.com', thumb=None, servers=[]),
+        ]
+        self.account = MagicMock()
+        self.account.users.return_value = self.friends
+
+        patchers = [
+            patch('plex_service.get_plex_server', return_value=self.plex),
+            patch('plex_service.get_plex_account', return_value=self.account),
+            patch('plex_service.get_section_index', return_value=self.sections),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_initial_sync_imports_everything(self):
+        """Test that libraries, users and our server's shares are imported"""
+        success, _ = plex_service.sync_plex_data()
+
+        self.assertTrue(success)
+        self.assertEqual(Library.query.count(), 2)
+        self.assertEqual(PlexUser.query.count(), 2)
+        alice = PlexUser.query.filter_by(plex_id='100').first()
+        self.assertEqual([share.library.plex_key for share in alice.shares], ['1'])
+
+    def test_resync_updates_in_place(self):
+        """Test that a second sync updates changed rows without duplicating"""
+        plex_service.sync_plex_data()
+        share = Share.query.first()
+        share.is_active = False
+        db.session.commit()
+
+        self.friends[1].email = 'bob@example.com'
+        self.sections.sections[1].title = 'TV Shows'
+        success, _ = plex_service.sync_plex_data()
+
+        self.assertTrue(success)
+        self.assertEqual(PlexUser.query.count(), 2)
+        self.assertEqual(Share.query.count(), 1)
+        self.assertEqual(PlexUser.query.filter_by(plex_id='200').first().email, 'bob@example.com')
+        self.assertEqual(Library.query.filter_by(plex_key='2').first().title, 'TV Shows')
+        # alice did not change on Plex, so her locally disabled share is left alone
+        self.assertFalse(Share.query.first().is_active)
+
+        summary = plex_service.get_last_sync_summary()
+        self.assertEqual(summary['users'], {'added': 0, 'changed': 1, 'unchanged': 1})
+        self.assertEqual(summary['libraries'], {'added': 0, 'changed': 1, 'unchanged': 1})
+
+    def test_unchanged_sync_skips_everything(self):
+        """Test that a sync with no remote changes writes no records"""
+        plex_service.sync_plex_data()
+
+        success, message = plex_service.sync_plex_data()
+
+        self.assertTrue(success)
+        self.assertIn('0 users and 0 libraries changed', message)
+        summary = plex_service.get_last_sync_summary()
+        self.assertEqual(summary['users']['unchanged'], 2)
+        self.assertEqual(summary['libraries']['unchanged'], 2)
+        self.assertEqual(summary['shares_imported'], 0)
+
+    def test_new_share_on_plex_is_imported(self):
+        """Test that a share added on Plex changes the fingerprint and is imported"""
+        plex_service.sync_plex_data()
+        self.friends[1].servers = [SimpleNamespace(machineIdentifier='machine-1',
+                                                   sections=[SimpleNamespace(key=2)])]
+
+        plex_service.sync_plex_data()
+
+        bob = PlexUser.query.filter_by(plex_id='200').first()
+        self.assertEqual([share.library.plex_key for share in bob.shares], ['2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
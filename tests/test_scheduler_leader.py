@@ -0,0 +1,122 @@
+"""
+Unit tests for scheduler leader election
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from app import app, publish_next_run, get_next_run, scheduler, start_scheduler, sync_scheduler_state
+from database import db
+from scheduler_leader import FileLock, SchedulerLeader
+from settings_store import get_setting, update_settings
+
+
+class TestSchedulerLeader(unittest.TestCase):
+    """Test cases for the scheduler lock"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.directory = tempfile.mkdtemp()
+        self.lock_path = os.path.join(self.directory, 'scheduler.lock')
+        self.leaders = []
+
+    def tearDown(self):
+        """Clean up after tests"""
+        for leader in self.leaders:
+            leader.stop()
+        shutil.rmtree(self.directory)
+
+    def make_leader(self, on_elected, retry=0.05):
+        leader = SchedulerLeader(self.lock_path, on_elected, retry=retry)
+        self.leaders.append(leader)
+        return leader
+
+    def test_only_one_leader(self):
+        """Test that the second process stays a follower while the lock is held"""
+        started = []
+        first = self.make_leader(lambda: started.append('first'))
+        second = self.make_leader(lambda: started.append('second'), retry=60)
+
+        self.assertTrue(first.start())
+        self.assertFalse(second.start())
+        self.assertEqual(started, ['first'])
+        self.assertFalse(FileLock(self.lock_path).acquire(blocking=False))
+
+    def test_follower_takes_over(self):
+        """Test that a follower is elected once the leader releases the lock"""
+        elected = threading.Event()
+        first = self.make_leader(lambda: None)
+        second = self.make_leader(elected.set)
+        first.start()
+        second.start()
+
+        first.stop()
+
+        self.assertTrue(elected.wait(2))
+        self.assertTrue(second.is_leader)
+
+    def test_failed_start_releases_lock(self):
+        """Test that a leader whose scheduler cannot start lets others try"""
+        def fail():
+            raise RuntimeError('no database')
+
+        leader = self.make_leader(fail, retry=60)
+
+        self.assertFalse(leader.start())
+        self.assertFalse(leader.is_leader)
+        self.assertTrue(FileLock(self.lock_path).acquire(blocking=False))
+
+
+class TestSchedulerSync(unittest.TestCase):
+    """Test cases for sharing scheduler state between workers"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_failed_start_stops_the_scheduler(self):
+        """Test that a scheduler that could not be configured does not keep running"""
+        with patch('app.configure_scheduler', side_effect=RuntimeError('no database')):
+            with self.assertRaises(RuntimeError):
+                start_scheduler()
+
+        self.assertFalse(scheduler.running)
+
+    def test_settings_saved_elsewhere_are_applied(self):
+        """Test that the leader reconfigures when another worker changed the settings"""
+        with patch('app.configure_scheduler') as configure, \
+                patch('app.applied_scheduler_settings', {'type': 'interval', 'interval_minutes': 60,
+                                                         'daily_time': '03:00'}):
+            sync_scheduler_state()
+            configure.assert_not_called()
+
+            update_settings({'scheduler_type': 'daily'})
+            sync_scheduler_state()
+            configure.assert_called_once()
+
+    def test_next_run_is_published(self):
+        """Test that followers read the next run time written by the leader"""
+        from datetime import datetime, timezone
+        next_run = datetime(2030, 1, 2, 3, 4, tzinfo=timezone.utc)
+
+        with patch('app.scheduler') as scheduler:
+            scheduler.running = True
+            scheduler.get_job.return_value.next_run_time = next_run
+            publish_next_run()
+
+        self.assertEqual(get_setting('scheduler_next_run'), next_run.isoformat())
+        self.assertEqual(get_next_run(), next_run)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Unit tests for the persistent scheduler job store
+"""
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+import app as app_module
+from app import app, configure_scheduler
+from database import db
+from settings_store import update_settings
+
+
+class TestPersistentScheduler(unittest.TestCase):
+    """Test cases for access check jobs surviving restarts"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        update_settings({'scheduler_type': 'interval', 'scheduler_interval_minutes': '60'})
+        self.scheduler = None
+        self.runs = []
+        self.ran = threading.Event()
+        callbacks = patch.dict('scheduler_jobs._callbacks', {'run_schedule': self.fake_run})
+        callbacks.start()
+        self.addCleanup(callbacks.stop)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.stop()
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP TABLE IF EXISTS apscheduler_jobs')
+        db.drop_all()
+        self.app_context.pop()
+
+    def fake_run(self):
+        self.runs.append(datetime.now())
+        self.ran.set()
+
+    def start(self):
+        """Start a scheduler on the database job store, like a fresh process"""
+        self.scheduler = BackgroundScheduler(
+            jobstores={'default': SQLAlchemyJobStore(engine=db.engine)},
+            job_defaults=app_module.scheduler._job_defaults,
+        )
+        self.scheduler.start(paused=True)
+        patcher = patch('app.scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        configure_scheduler()
+        return self.scheduler.get_job('access_check_job')
+
+    def stop(self):
+        if self.scheduler and self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def miss_runs(self, next_run_time):
+        """Move the stored next run into the past, as if the app was down"""
+        store = SQLAlchemyJobStore(engine=db.engine)
+        store.start(self.scheduler, 'default')
+        job = store.lookup_job('access_check_job')
+        job.next_run_time = next_run_time
+        store.update_job(job)
+
+    def test_next_run_survives_restart(self):
+        """Test that an unchanged schedule keeps its stored next run time"""
+        missed = datetime.now().astimezone() - timedelta(minutes=5)
+        self.start()
+        self.stop()
+        self.miss_runs(missed)
+
+        job = self.start()
+
+        self.assertEqual(job.next_run_time, missed)
+
+    def test_changed_settings_replace_job(self):
+        """Test that a new interval reschedules the stored job"""
+        self.start()
+        self.stop()
+        update_settings({'scheduler_interval_minutes': '30'})
+
+        job = self.start()
+
+        self.assertEqual(str(job.trigger), 'interval[0:30:00]')
+        self.assertGreater(job.next_run_time, datetime.now().astimezone() + timedelta(minutes=29))
+
+    def test_missed_runs_are_coalesced(self):
+        """Test that several runs missed while stopped are made up once"""
+        self.start()
+        self.stop()
+        self.miss_runs(datetime.now().astimezone() - timedelta(hours=3, minutes=1))
+
+        self.start()
+        self.scheduler.resume()
+
+        self.assertTrue(self.ran.wait(5))
+        self.assertEqual(len(self.runs), 1)
+        next_run = self.scheduler.get_job('access_check_job').next_run_time
+        self.assertGreater(next_run, datetime.now().astimezone())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Unit tests for the settings cache
+"""
+import unittest
+from app import app
+from database import db
+from models import Settings
+from settings_store import SettingsCache
+
+
+class TestSettingsCache(unittest.TestCase):
+    """Test cases for cached and write-through settings"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Settings(key='plex_url', value='http://plex:32400'))
+        db.session.commit()
+        self.cache = SettingsCache(ttl=60)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_reads_are_served_from_memory(self):
+        """Test that values are cached after the first read"""
+        self.assertEqual(self.cache.get('plex_url'), 'http://plex:32400')
+        Settings.query.filter_by(key='plex_url').first().value = 'changed elsewhere'
+        db.session.commit()
+
+        self.assertEqual(self.cache.get('plex_url'), 'http://plex:32400')
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+
+    def test_write_through(self):
+        """Test that updates are persisted and visible immediately"""
+        self.cache.get('plex_url')
+        self.cache.update({'plex_url': 'http://new:32400', 'plex_token': 'abc'})
+
+        self.assertEqual(self.cache.get('plex_url'), 'http://new:32400')
+        self.assertEqual(self.cache.get('plex_token'), 'abc')
+        self.assertEqual(Settings.query.count(), 2)
+
+    def test_ttl_expiry_reloads(self):
+        """Test that expired snapshots pick up changes from other processes"""
+        self.cache.ttl = 0
+        self.cache.get('plex_url')
+        Settings.query.filter_by(key='plex_url').first().value = 'http://other:32400'
+        db.session.commit()
+
+        self.assertEqual(self.cache.get('plex_url'), 'http://other:32400')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""
+Unit tests for the avatar thumbnail cache
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import app as app_module
+from database import db
+from models import PlexUser, User
+from thumbs import THUMB_SIZE, ThumbnailCache, resize_image, thumb_version
+
+
+def make_response(status_code=200, content=b'image', headers=None):
+    response = MagicMock(status_code=status_code, content=content)
+    response.headers = headers or {'Content-Type': 'image/jpeg', 'ETag': '"v1"'}
+    return response
+
+
+@patch('thumbs.resize_image', return_value=None)
+@patch('thumbs.avatar_session')
+class TestThumbnailCache(unittest.TestCase):
+    """Test cases for downloading, revalidating and evicting avatars"""
+
+    def setUp(self):
+        """Use an empty cache directory"""
+        self.directory = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(self.directory, ttl=60, max_bytes=10)
+
+    def tearDown(self):
+        """Remove the cache directory"""
+        shutil.rmtree(self.directory)
+
+    def read(self, result):
+        with open(result[0], 'rb') as f:
+            return f.read()
+
+    def test_downloads_once_within_ttl(self, mock_session, mock_resize):
+        """Test that a cached avatar is served without another request"""
+        mock_session.return_value.get.return_value = make_response()
+
+        first = self.cache.get(1, 'https://plex.tv/a.jpg')
+        second = self.cache.get(1, 'https://plex.tv/a.jpg')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.read(first), b'image')
+        self.assertEqual(first[1]['content_type'], 'image/jpeg')
+        mock_session.return_value.get.assert_called_once()
+
+    def test_revalidates_after_ttl(self, mock_session, mock_resize):
+        """Test that an expired entry sends the stored ETag and keeps the file on 304"""
+        mock_session.return_value.get.side_effect = [make_response(), make_response(status_code=304)]
+        self.cache.get(1, 'https://plex.tv/a.jpg')
+        self.cache.ttl = 0
+
+        result = self.cache.get(1, 'https://plex.tv/a.jpg')
+
+        headers = mock_session.return_value.get.call_args.kwargs['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(self.read(result), b'image')
+
+    def test_changed_url_downloads_again(self, mock_session, mock_resize):
+        """Test that a new avatar URL replaces the cached file unconditionally"""
+        mock_session.return_value.get.side_effect = [make_response(), make_response(content=b'new')]
+        self.cache.get(1, 'https://plex.tv/a.jpg')
+
+        result = self.cache.get(1, 'https://plex.tv/b.jpg')
+
+        self.assertEqual(self.read(result), b'new')
+        self.assertEqual(mock_session.return_value.get.call_args.kwargs['headers'], {})
+
+    def test_stale_copy_served_on_error(self, mock_session, mock_resize):
+        """Test that a failed revalidation still returns the cached avatar"""
+        mock_session.return_value.get.side_effect = [make_response(), Exception('offline')]
+        self.cache.get(1, 'https://plex.tv/a.jpg')
+        self.cache.ttl = 0
+
+        self.assertEqual(self.read(self.cache.get(1, 'https://plex.tv/a.jpg')), b'image')
+        self.assertIsNone(self.cache.get(2, 'https://plex.tv/c.jpg'))
+
+    def test_evicts_least_recently_served(self, mock_session, mock_resize):
+        """Test that the oldest avatars are removed once the size bound is exceeded"""
+        mock_session.return_value.get.return_value = make_response(content=b'12345')
+        self.cache.get(1, 'https://plex.tv/1.jpg')
+        self.cache.get(2, 'https://plex.tv/2.jpg')
+        # Serve user 1 again so that user 2 becomes the least recently used
+        past = time.time() - 100
+        os.utime(os.path.join(self.directory, '2.img'), (past, past))
+
+        self.cache.get(3, 'https://plex.tv/3.jpg')
+
+        remaining = sorted(name for name in os.listdir(self.directory) if name.endswith('.img'))
+        self.assertEqual(remaining, ['1.img', '3.img'])
+
+    def test_thumb_version_changes_with_url(self, mock_session, mock_resize):
+        """Test the cache-busting version string"""
+        self.assertEqual(thumb_version('a'), thumb_version('a'))
+        self.assertNotEqual(thumb_version('a'), thumb_version('b'))
+
+
+
+class TestResizeImage(unittest.TestCase):
+    """Test cases for shrinking downloaded avatars"""
+
+    def test_resizes_to_thumb_size(self):
+        """Test that large avatars are stored as small PNGs"""
+        from PIL import Image
+        import io
+
+        source = io.BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(source, format='JPEG')
+
+        content, content_type = resize_image(source.getvalue())
+
+        self.assertEqual(content_type, 'image/png')
+        with Image.open(io.BytesIO(content)) as image:
+            self.assertEqual(image.size, (THUMB_SIZE, THUMB_SIZE // 2))
+
+    def test_unreadable_image(self):
+        """Test that data Pillow cannot read is stored as downloaded"""
+        self.assertIsNone(resize_image(b'not an image'))
+
+
+class TestThumbRoute(unittest.TestCase):
+    """Test cases for the /thumb proxy endpoint"""
+
+    def setUp(self):
+        """Create a logged-in auditor and a Plex user with an avatar"""
+        self.app_context = app_module.app.app_context()
+        self.app_context.push()
+        self.client = app_module.app.test_client()
+        db.create_all()
+        auditor = User(username='auditor', role=User.ROLE_AUDITOR)
+        auditor.set_password('audit')
+        self.plex_user = PlexUser(plex_id='7', username='friend', thumb='https://plex.tv/users/7/avatar')
+        db.session.add_all([auditor, self.plex_user, PlexUser(plex_id='8', username='no-avatar')])
+        db.session.commit()
+        self.client.post('/login', data={'username': 'auditor', 'password': 'audit'})
+        self.directory = tempfile.mkdtemp()
+        self.cache_patch = patch.object(app_module, 'thumbnail_cache', ThumbnailCache(self.directory))
+        self.cache_patch.start()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        self.cache_patch.stop()
+        shutil.rmtree(self.directory)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @patch('thumbs.resize_image', return_value=None)
+    @patch('thumbs.avatar_session')
+    def test_serves_cached_avatar_with_long_lived_headers(self, mock_session, mock_resize):
+        """Test that a versioned URL is served from disk with a one-year max-age"""
+        mock_session.return_value.get.return_value = make_response()
+        with app_module.app.test_request_context():
+            url = app_module.thumb_url(self.plex_user)
+
+        response = self.client.get(url)
+        again = self.client.get(url, headers={'If-None-Match': response.headers['ETag']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'image')
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertEqual(again.status_code, 304)
+        mock_session.return_value.get.assert_called_once()
+
+    def test_user_without_avatar(self):
+        """Test that users without a thumb URL get a 404"""
+        user = PlexUser.query.filter_by(username='no-avatar').one()
+        self.assertEqual(self.client.get(f'/thumb/{user.id}').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Unit tests for Plex call tracing
+"""
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+from plex_client import RateLimiter, RateLimitedSession
+from tracing import in_context, record_call, trace_calls, trace_subject
+
+
+def fake_response(status_code=200, size=None, content=b'{}'):
+    headers = {'Content-Length': str(size)} if size is not None else {}
+    return SimpleNamespace(status_code=status_code, headers=headers, content=content)
+
+
+class TestTrace(unittest.TestCase):
+    """Test cases for collecting Plex calls of a run"""
+
+    def test_session_calls_are_traced(self):
+        """Test that method, URL template, status and bytes reach the current trace"""
+        session = RateLimitedSession(RateLimiter(rate=0, burst=1))
+        responses = [fake_response(size=2048), fake_response(404, content=b'missing')]
+        with patch('requests.Session.request', side_effect=responses):
+            with trace_calls('sync') as trace:
+                session.get('https://plex.tv/api/v2/friends?X-Plex-Token=secret')
+                session.put('http://10.0.0.2:32400/library/sections/4/refresh')
+
+        summary = trace.summary()
+        self.assertEqual((summary['calls'], summary['errors'], summary['bytes']), (2, 1, 2048 + 7))
+        endpoints = {(stats['method'], stats['endpoint']) for stats in summary['endpoints']}
+        self.assertEqual(endpoints, {('GET', 'plex.tv/api/v2/friends'),
+                                     ('PUT', 'server/library/sections/:id/refresh')})
+
+    def test_calls_are_attributed_across_threads(self):
+        """Test that pool threads report to the caller's trace with their own user"""
+        def push(user):
+            with trace_subject(user):
+                for _ in range(user):
+                    record_call('PUT', 'plex.tv/api/v2/shared_servers/:id', 200, 10, 0.01 * user)
+
+        with trace_calls('reconcile') as trace:
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                list(pool.map(in_context(push), [1, 2, 3]))
+
+        summary = trace.summary()
+        self.assertEqual(summary['calls'], 6)
+        self.assertEqual(summary['slowest_users'][0], {'user': 3, 'calls': 3, 'seconds': 0.09})
+        self.assertIn('Plex calls for reconcile: 6 calls, 0 errors', trace.describe())
+
+    def test_calls_outside_a_trace(self):
+        """Test that calls without a current trace are not collected"""
+        with trace_calls('outer') as trace:
+            pass
+        record_call('GET', 'server/identity', 200, 1, 0.001)
+
+        self.assertEqual(trace.summary()['calls'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Unit tests for the event-driven share transition scheduler
+"""
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from app import app
+from database import db
+from models import PlexUser, Library, Share, ShareChange
+import plex_service
+from transitions import BUSY_RETRY_DELAY, RETRY_DELAY, TransitionScheduler
+
+
+class TestTransitionScheduler(unittest.TestCase):
+    """Test cases for queueing and firing share transitions"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        movies = Library(plex_key='1', title='Movies')
+        self.alice = PlexUser(plex_id='100', username='alice')
+        self.bob = PlexUser(plex_id='200', username='bob')
+        db.session.add_all([movies, self.alice, self.bob])
+        db.session.flush()
+
+        now = datetime.now()
+        self.soon = now + timedelta(hours=1)
+        self.later = now + timedelta(days=2)
+        db.session.add_all([
+            Share(plex_user_id=self.alice.id, library_id=movies.id, is_active=True, start_date=self.soon,
+                  expiration_date=self.later),
+            Share(plex_user_id=self.bob.id, library_id=movies.id, is_active=True,
+                  expiration_date=now - timedelta(days=1)),
+        ])
+        db.session.commit()
+
+        self.scheduler = MagicMock()
+        self.scheduler.get_job.return_value = None
+        self.job_runner = MagicMock()
+        self.job_runner.enqueue.return_value = (SimpleNamespace(id=1), True)
+        self.job_runner.wait.return_value = {'failed': 0}
+        self.transitions = TransitionScheduler(self.scheduler, self.app, self.job_runner)
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_start_schedules_earliest_transition(self):
+        """Test that only future transitions are queued and the first is scheduled"""
+        self.transitions.start()
+
+        self.assertEqual(self.transitions.next_transition(), self.soon)
+        kwargs = self.scheduler.add_job.call_args.kwargs
+        self.assertEqual(kwargs['run_date'], self.soon)
+        self.assertEqual(kwargs['id'], TransitionScheduler.JOB_ID)
+
+    def test_notify_queues_new_dates(self):
+        """Test that editing a share queues its new transition"""
+        self.transitions.start()
+        sooner = datetime.now() + timedelta(minutes=5)
+        share = Share.query.filter_by(plex_user_id=self.bob.id).first()
+        share.expiration_date = sooner
+        db.session.commit()
+
+        self.transitions.notify_user_changed(self.bob.id)
+
+        self.assertEqual(self.transitions.next_transition(), sooner)
+
+    def test_edits_in_other_workers_are_picked_up(self):
+        """Test that refresh only reads the users logged by workers without the scheduler"""
+        self.transitions.start()
+        other_worker = TransitionScheduler(MagicMock(running=False), self.app, self.job_runner)
+        sooner = datetime.now() + timedelta(minutes=5)
+        share = Share.query.filter_by(plex_user_id=self.bob.id).first()
+        share.expiration_date = sooner
+        db.session.commit()
+
+        other_worker.notify_user_changed(self.bob.id)
+        with patch('plex_service.upcoming_transitions', wraps=plex_service.upcoming_transitions) as upcoming:
+            self.transitions.refresh()
+            self.transitions.refresh()
+
+        upcoming.assert_called_once_with(user_ids=[self.bob.id])
+        self.assertEqual(self.transitions.next_transition(), sooner)
+        self.assertEqual(ShareChange.query.count(), 0)
+
+    def fire(self):
+        with patch('transitions.datetime') as mock_datetime:
+            mock_datetime.now.return_value = self.soon
+            self.transitions.run_due()
+
+    def test_run_due_reconciles_only_due_users(self):
+        """Test that firing queues a reconciliation of the due users and schedules the next one"""
+        self.transitions.start()
+
+        self.fire()
+
+        self.job_runner.enqueue.assert_called_once_with(
+            'check_schedules', {'user_ids': [self.alice.id]}, created_by='scheduler')
+        self.job_runner.wait.assert_called_once_with(1)
+        self.assertEqual(self.transitions.next_transition(), self.later)
+
+    def test_failed_transition_is_retried(self):
+        """Test that users are requeued when Plex could not be updated"""
+        self.job_runner.wait.return_value = {'failed': 1}
+        self.transitions.start()
+
+        self.fire()
+
+        self.assertEqual(self.transitions.next_transition(), self.soon + RETRY_DELAY)
+
+    def test_active_reconciliation_is_not_overlapped(self):
+        """Test that due users wait for a running check_schedules job instead of a parallel push"""
+        self.job_runner.enqueue.return_value = (SimpleNamespace(id=7), False)
+        self.transitions.start()
+
+        self.fire()
+
+        self.job_runner.wait.assert_not_called()
+        self.assertEqual(self.transitions.next_transition(), self.soon + BUSY_RETRY_DELAY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Unit tests for the user access page
+"""
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from app import app
+from database import db
+from models import Library, PlexUser, Share, ShareChange, User
+
+
+class TestUserDetails(unittest.TestCase):
+    """Test cases for rendering and saving a user's library access"""
+
+    def setUp(self):
+        """Create a moderator, a Plex user and three libraries"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        db.create_all()
+
+        moderator = User(username='moderator', role=User.ROLE_MODERATOR)
+        moderator.set_password('mod')
+        self.plex_user = PlexUser(plex_id='42', username='friend')
+        self.libraries = [Library(plex_key=str(key), title=title) for key, title in
+                          ((1, 'Movies'), (2, 'Shows'), (3, 'Music'))]
+        db.session.add_all([moderator, self.plex_user, *self.libraries])
+        db.session.commit()
+        db.session.add_all([
+            Share(plex_user_id=self.plex_user.id, library_id=self.libraries[0].id, is_active=True),
+            Share(plex_user_id=self.plex_user.id, library_id=self.libraries[1].id, is_active=True,
+                  expiration_date=datetime(2099, 1, 1)),
+        ])
+        db.session.commit()
+        self.client.post('/login', data={'username': 'moderator', 'password': 'mod'})
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def form(self, **overrides):
+        movies, shows, music = (lib.id for lib in self.libraries)
+        data = {
+            f'library_{movies}': 'on',
+            f'library_{shows}': 'on',
+            f'expiration_date_{shows}': '2099-01-01',
+        }
+        data.update(overrides)
+        return data
+
+    def test_renders_existing_shares(self):
+        """Test that stored shares are shown for their library"""
+        response = self.client.get(f'/user/{self.plex_user.id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'value="2099-01-01"', response.data)
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_save_writes_only_changed_shares(self, mock_update):
+        """Test that unchanged shares are left alone and new ones are inserted"""
+        music = self.libraries[2].id
+        with patch.object(db.session, 'execute', wraps=db.session.execute) as execute:
+            self.client.post(f'/user/{self.plex_user.id}', data=self.form(**{f'library_{music}': 'on'}))
+
+        statements = [str(call.args[0]).split()[:3] for call in execute.call_args_list
+                      if str(call.args[0]).split()[0] in ('INSERT', 'UPDATE')]
+        # The share insert, then the change log read by the scheduler's worker
+        self.assertEqual(statements, [['INSERT', 'INTO', 'share'], ['INSERT', 'INTO', 'share_change']])
+        self.assertEqual([change.plex_user_id for change in ShareChange.query], [self.plex_user.id])
+        shares = {share.library_id: share for share in Share.query.filter_by(plex_user_id=self.plex_user.id)}
+        self.assertEqual(len(shares), 3)
+        self.assertTrue(shares[music].is_active)
+        mock_update.assert_called_once_with('42', ['1', '2', '3'])
+
+    @patch('plex_service.update_user_access', return_value=(True, 'ok'))
+    def test_save_updates_changed_share(self, mock_update):
+        """Test that unchecking a library deactivates its share"""
+        shows = self.libraries[1].id
+        data = self.form()
+        del data[f'library_{shows}']
+
+        self.client.post(f'/user/{self.plex_user.id}', data=data)
+
+        share = Share.query.filter_by(plex_user_id=self.plex_user.id, library_id=shows).one()
+        self.assertFalse(share.is_active)
+        self.assertEqual(share.expiration_date, datetime(2099, 1, 1))
+        mock_update.assert_called_once_with('42', ['1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
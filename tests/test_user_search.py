@@ -0,0 +1,157 @@
+"""
+Unit tests for the paginated Plex user listing
+"""
+import unittest
+from app import app
+from database import db
+from migrations import create_plex_user_search
+from models import PlexUser, User
+from user_search import fts_query, search_plex_users, typeahead_plex_users
+
+
+class TestUserSearch(unittest.TestCase):
+    """Test cases for sorting, filtering and paging Plex users"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        names = ['bob', 'Alice', 'carol', 'dave_1', 'daveX1']
+        db.session.add_all([
+            PlexUser(plex_id=str(i), username=name, email=f'{name.lower()}@example.com')
+            for i, name in enumerate(names)
+        ])
+        auditor = User(username='auditor', role=User.ROLE_AUDITOR)
+        auditor.set_password('audit')
+        db.session.add(auditor)
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def usernames(self, pagination):
+        return [user.username for user in pagination.items]
+
+    def test_case_insensitive_sort_and_paging(self):
+        """Test that pages follow a stable, case-insensitive order"""
+        first = search_plex_users(page=1, per_page=2)
+        second = search_plex_users(page=2, per_page=2)
+
+        self.assertEqual(self.usernames(first), ['Alice', 'bob'])
+        self.assertEqual(self.usernames(second), ['carol', 'dave_1'])
+        self.assertEqual(first.total, 5)
+        self.assertEqual(first.pages, 3)
+
+    def test_descending_sort(self):
+        """Test sorting by email in descending order"""
+        pagination = search_plex_users(sort='email', order='desc', per_page=2)
+
+        self.assertEqual(self.usernames(pagination), ['daveX1', 'dave_1'])
+
+    def test_search_escapes_wildcards(self):
+        """Test that '_' in the search term is matched literally"""
+        self.assertEqual(self.usernames(search_plex_users(search='dave_')), ['dave_1'])
+        self.assertEqual(self.usernames(search_plex_users(search='ALICE')), ['Alice'])
+
+    def test_unknown_sort_and_page_out_of_range(self):
+        """Test that bad parameters fall back instead of failing"""
+        self.assertEqual(self.usernames(search_plex_users(sort='password', per_page=1)), ['Alice'])
+        self.assertEqual(search_plex_users(page=10).items, [])
+
+    def test_json_listing(self):
+        """Test the JSON variant used for incremental loading"""
+        self.client.post('/login', data={'username': 'auditor', 'password': 'audit'})
+
+        response = self.client.get('/api/plex_users?q=dave&per_page=1&page=2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([user['username'] for user in response.json['users']], ['daveX1'])
+        self.assertEqual(response.json['total'], 2)
+        self.assertFalse(response.json['has_next'])
+
+    def test_dashboard_renders_page(self):
+        """Test that the dashboard shows only the requested page"""
+        self.client.post('/login', data={'username': 'auditor', 'password': 'audit'})
+
+        response = self.client.get('/dashboard?per_page=2&page=3')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'daveX1', response.data)
+        self.assertNotIn(b'Alice', response.data)
+
+
+
+class TestTypeahead(unittest.TestCase):
+    """Test cases for full-text typeahead lookups"""
+
+    def setUp(self):
+        """Create users and the FTS index"""
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            PlexUser(plex_id='1', username='Alice', email='alice@example.com'),
+            PlexUser(plex_id='2', username='bob', email='robert@mail.org'),
+            PlexUser(plex_id='3', username='Álvaro', email=None),
+        ])
+        db.session.commit()
+        # Existing rows are indexed by the migration, later writes by the triggers
+        with db.engine.begin() as conn:
+            create_plex_user_search(conn)
+
+    def tearDown(self):
+        """Drop the FTS table along with the model tables"""
+        db.session.remove()
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP TABLE IF EXISTS plex_user_fts')
+        db.drop_all()
+        self.app_context.pop()
+
+    def usernames(self, term):
+        return [user.username for user in typeahead_plex_users(term)]
+
+    def test_prefix_match_on_username_and_email(self):
+        """Test that partial words match usernames and email parts"""
+        self.assertEqual(self.usernames('ali'), ['Alice'])
+        self.assertEqual(self.usernames('rob'), ['bob'])
+        self.assertEqual(self.usernames('mail.o'), ['bob'])
+
+    def test_diacritics_are_ignored(self):
+        """Test that 'alv' finds 'Álvaro'"""
+        self.assertEqual(self.usernames('alv'), ['Álvaro'])
+
+    def test_index_follows_writes(self):
+        """Test that inserts, updates and deletes reach the index"""
+        db.session.add(PlexUser(plex_id='4', username='carol'))
+        bob = PlexUser.query.filter_by(username='bob').one()
+        bob.username = 'bobby'
+        db.session.delete(PlexUser.query.filter_by(username='Alice').one())
+        db.session.commit()
+
+        self.assertEqual(self.usernames('car'), ['carol'])
+        self.assertEqual(self.usernames('bobb'), ['bobby'])
+        self.assertEqual(self.usernames('ali'), [])
+
+    def test_query_syntax_is_not_injected(self):
+        """Test that FTS operators in the input are treated as text"""
+        self.assertEqual(fts_query('a" OR *'), '"a"* "OR"*')
+        self.assertEqual(self.usernames('"'), [])
+
+    def test_like_fallback_without_index(self):
+        """Test that lookups still work when the FTS table is missing"""
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP TABLE plex_user_fts')
+
+        self.assertEqual(self.usernames('lic'), ['Alice'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+On-disk cache for Plex user avatars served through /thumb/<plex_user_id>.
+
+Avatars are downloaded once and stored (resized when Pillow is installed)
+next to a small JSON metadata file. Downloads use their own pooled session
+without rate limiting, so avatars never spend the plex.tv budget of access
+updates nor wait behind them. After THUMB_TTL seconds the remote image
+is revalidated with If-None-Match / If-Modified-Since, and the least recently
+served files are evicted once the cache grows beyond THUMB_CACHE_MAX_BYTES.
+"""
+from collections import defaultdict
+from plex_client import PLEX_POOL_SIZE, PLEX_TIMEOUT
+from requests.adapters import HTTPAdapter
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: avatars are stored as downloaded
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMB_TTL = int(os.environ.get('THUMB_TTL', 24 * 3600))
+THUMB_CACHE_MAX_BYTES = int(os.environ.get('THUMB_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+THUMB_SIZE = 96  # pixels, longest side
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def avatar_session():
+    """Keep-alive session for avatar downloads, created on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=PLEX_POOL_SIZE, pool_maxsize=PLEX_POOL_SIZE, max_retries=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def thumb_version(url):
+    """Short hash of the avatar URL, used to bust browser caches when it changes"""
+    return hashlib.sha1((url or '').encode('utf-8')).hexdigest()[:10]
+
+
+def resize_image(content):
+    """Shrink an image to THUMB_SIZE; returns (bytes, content_type) or None without Pillow"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+            output = io.BytesIO()
+            image.convert('RGBA').save(output, format='PNG', optimize=True)
+            return output.getvalue(), 'image/png'
+    except Exception as e:
+        logger.warning(f"Could not resize avatar, storing original: {str(e)}")
+        return None
+
+
+class ThumbnailCache:
+    """Avatar files keyed by PlexUser id with TTL revalidation and LRU eviction"""
+
+    def __init__(self, directory, ttl=THUMB_TTL, max_bytes=THUMB_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._locks = defaultdict(threading.Lock)
+        self._locks_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, str(key))
+        return f'{base}.img', f'{base}.json'
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks[key]
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data, mode='wb'):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _touch(self, path):
+        """Mark a file as recently served (its mtime is the LRU clock)"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _download(self, url, meta):
+        """GET the avatar, conditionally if meta is given; returns the response"""
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        response = avatar_session().get(url, headers=headers, timeout=PLEX_TIMEOUT)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def get(self, key, url):
+        """Return (image_path, metadata) for a user's avatar, or None if unavailable"""
+        if not url:
+            return None
+        image_path, meta_path = self._paths(key)
+        with self._lock(key):
+            meta = self._read_meta(meta_path) if os.path.exists(image_path) else None
+            if meta and meta.get('url') != url:
+                meta = None  # Avatar changed: download from scratch
+
+            if meta and time.time() - meta['fetched_at'] < self.ttl:
+                self._touch(image_path)
+                return image_path, meta
+
+            try:
+                response = self._download(url, meta)
+            except Exception as e:
+                logger.warning(f"Could not fetch avatar for user {key}: {str(e)}")
+                # Serve the stale copy rather than nothing
+                return (image_path, meta) if meta else None
+
+            if response.status_code == 304:
+                meta['fetched_at'] = time.time()
+            else:
+                content_type = response.headers.get('Content-Type', 'image/jpeg')
+                content = response.content
+                resized = resize_image(content)
+                if resized:
+                    content, content_type = resized
+                os.makedirs(self.directory, exist_ok=True)
+                self._write(image_path, content)
+                meta = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_type': content_type,
+                    # Validator for our own responses (mtime is the LRU clock)
+                    'digest': hashlib.sha1(content).hexdigest()[:16],
+                    'fetched_at': time.time(),
+                }
+            self._write(meta_path, json.dumps(meta), mode='w')
+            self._touch(image_path)
+
+        if response.status_code != 304:
+            self.evict()
+        return image_path, meta
+
+    def evict(self):
+        """Delete the least recently served avatars until the cache fits max_bytes"""
+        with self._evict_lock:
+            try:
+                entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.img')]
+            except FileNotFoundError:
+                return
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                for stale in (path, path[:-len('.img')] + '.json'):
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+                total -= size
@@ -0,0 +1,135 @@
+"""
+Per-call tracing of Plex HTTP traffic.
+
+RateLimitedSession reports every call (method, URL template, status, bytes,
+duration) to record_call. Calls are logged at DEBUG level with the job and
+user they were made for, and added to the Trace of the current run, if any.
+A Trace keeps totals per endpoint and per user instead of every call, so a
+reconciliation of thousands of users stays small, and its summary is logged
+and stored on the job result.
+
+The current trace and user live in context variables. Thread pools do not
+inherit them, so work submitted to one must be wrapped with in_context().
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Endpoints and users listed in a trace summary
+SUMMARY_ENDPOINTS = 10
+SUMMARY_SUBJECTS = 5
+
+current_trace = ContextVar('current_trace', default=None)
+current_subject = ContextVar('current_subject', default=None)
+
+
+class Trace:
+    """Aggregated Plex calls of one run (a job, a sync...)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.endpoints = {}
+        self.subjects = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, endpoint, status, size, seconds, subject=None):
+        error = status == 'error' or int(status) >= 400
+        with self._lock:
+            stats = self.endpoints.get((method, endpoint))
+            if stats is None:
+                stats = self.endpoints[(method, endpoint)] = {
+                    'method': method, 'endpoint': endpoint,
+                    'calls': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                }
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['bytes'] += size
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if subject is not None:
+                calls, total = self.subjects.get(subject, (0, 0.0))
+                self.subjects[subject] = (calls + 1, total + seconds)
+
+    def summary(self):
+        """Totals plus the slowest endpoints and users, JSON-friendly"""
+        with self._lock:
+            endpoints = [dict(stats) for stats in self.endpoints.values()]
+            subjects = list(self.subjects.items())
+        endpoints.sort(key=lambda stats: stats['seconds'], reverse=True)
+        subjects.sort(key=lambda item: item[1][1], reverse=True)
+        for stats in endpoints:
+            stats['seconds'] = round(stats['seconds'], 3)
+            stats['max_seconds'] = round(stats['max_seconds'], 3)
+        return {
+            'calls': sum(stats['calls'] for stats in endpoints),
+            'errors': sum(stats['errors'] for stats in endpoints),
+            'bytes': sum(stats['bytes'] for stats in endpoints),
+            'seconds': round(sum(stats['seconds'] for stats in endpoints), 3),
+            'endpoints': endpoints[:SUMMARY_ENDPOINTS],
+            'slowest_users': [
+                {'user': subject, 'calls': calls, 'seconds': round(seconds, 3)}
+                for subject, (calls, seconds) in subjects[:SUMMARY_SUBJECTS]
+            ],
+        }
+
+    def describe(self, summary=None):
+        """One log line: totals, then the endpoints that took the most time"""
+        summary = summary or self.summary()
+        parts = [f"{summary['calls']} calls, {summary['errors']} errors, "
+                 f"{summary['bytes'] / 1024:.0f} KiB, {summary['seconds']:.2f}s"]
+        parts += [
+            f"{stats['method']} {stats['endpoint']} x{stats['calls']} {stats['seconds']:.2f}s "
+            f"(max {stats['max_seconds']:.2f}s)"
+            for stats in summary['endpoints'][:3]
+        ]
+        if summary['slowest_users']:
+            slowest = summary['slowest_users'][0]
+            parts.append(f"slowest user {slowest['user']} {slowest['seconds']:.2f}s")
+        return f"Plex calls for {self.name}: " + '; '.join(parts)
+
+
+@contextmanager
+def trace_calls(name):
+    """Collect the Plex calls made inside the block into a new Trace"""
+    trace = Trace(name)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def trace_subject(subject):
+    """Attribute the Plex calls made inside the block to a user"""
+    token = current_subject.set(subject)
+    try:
+        yield
+    finally:
+        current_subject.reset(token)
+
+
+def in_context(func):
+    """Wrap func to run in (a copy of) the caller's context, e.g. on a thread pool"""
+    context = copy_context()
+
+    def run(*args, **kwargs):
+        # Each call gets its own copy: a Context cannot be entered by two threads
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+def record_call(method, endpoint, status, size, seconds):
+    """Called by the Plex session after every HTTP call"""
+    trace = current_trace.get()
+    subject = current_subject.get()
+    if logger.isEnabledFor(logging.DEBUG):
+        owner = ' '.join(filter(None, [trace.name if trace else None,
+                                       f'user {subject}' if subject else None]))
+        logger.debug(f"Plex {method} {endpoint} -> {status}, {size} bytes, {seconds * 1000:.0f}ms"
+                     + (f" [{owner}]" if owner else ''))
+    if trace is not None:
+        trace.record(method, endpoint, status, size, seconds, subject)
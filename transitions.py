@@ -0,0 +1,182 @@
+"""
+Event-driven share transitions.
+
+Instead of polling the whole Share table on a fixed interval, keep a priority
+queue of the upcoming start/expiration dates and register a one-shot
+APScheduler job for the earliest one. When it fires, only the users whose
+shares changed state are reconciled, then the next transition is scheduled.
+Shares edited in a worker that does not run the scheduler are logged as
+ShareChange rows, which the scheduler's worker picks up in refresh().
+The reconciliation goes through the job queue as a check_schedules job, so
+it never overlaps a scheduled or manual run.
+"""
+from database import db
+from datetime import datetime, timedelta
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Delay before users whose transition could not be pushed to Plex are retried
+RETRY_DELAY = timedelta(minutes=5)
+# Delay before due users are retried when another check_schedules job is active
+BUSY_RETRY_DELAY = timedelta(minutes=1)
+
+
+class TransitionScheduler:
+    """Priority queue of share transitions backed by one-shot scheduler jobs"""
+
+    JOB_ID = 'share_transition_job'
+
+    def __init__(self, scheduler, app, job_runner):
+        self.scheduler = scheduler
+        self.app = app
+        self.job_runner = job_runner
+        self.enabled = False
+        self._heap = []
+        self._queued = set()
+        self._change_cursor = 0
+        self._lock = threading.Lock()
+
+    def _push(self, transitions):
+        with self._lock:
+            for entry in transitions:
+                if entry not in self._queued:
+                    self._queued.add(entry)
+                    heapq.heappush(self._heap, entry)
+
+    def start(self):
+        """Load every upcoming transition and schedule the first one"""
+        from plex_service import clear_share_changes, latest_share_change, upcoming_transitions
+
+        with self.app.app_context():
+            # Changes logged so far are covered by the full load
+            self._change_cursor = latest_share_change()
+            clear_share_changes(self._change_cursor)
+            db.session.commit()
+            transitions = list(upcoming_transitions())
+        with self._lock:
+            self._heap = []
+            self._queued = set()
+        self._push(transitions)
+        self.enabled = True
+        logger.info(f"Event scheduler tracking {len(self._heap)} upcoming share transitions")
+        self._schedule_next()
+
+    def stop(self):
+        """Forget queued transitions and remove the pending job"""
+        self.enabled = False
+        with self._lock:
+            self._heap = []
+            self._queued = set()
+        if self.scheduler.get_job(self.JOB_ID):
+            self.scheduler.remove_job(self.JOB_ID)
+
+    def notify_user_changed(self, plex_user_id):
+        """Queue the future transitions of a user whose shares were just edited"""
+        self.notify_users_changed([plex_user_id])
+
+    def notify_users_changed(self, plex_user_ids):
+        """Queue the future transitions of several users with one query"""
+        if not plex_user_ids:
+            return
+        if not self.scheduler.running:
+            self._log_changes(plex_user_ids)
+            return
+        if not self.enabled:
+            return
+        from plex_service import upcoming_transitions
+
+        with self.app.app_context():
+            transitions = list(upcoming_transitions(user_ids=list(plex_user_ids)))
+        # Entries for dates that were edited away stay queued; reconciling
+        # an unchanged user is a no-op, so they are harmless
+        self._push(transitions)
+        self._schedule_next()
+
+    def _log_changes(self, plex_user_ids):
+        """Leave the changed users to the worker running the scheduler"""
+        from plex_service import record_share_changes
+
+        try:
+            with self.app.app_context():
+                record_share_changes(plex_user_ids)
+                db.session.commit()
+        except Exception as e:
+            logger.warning(f"Could not log share changes for the scheduler: {str(e)}")
+
+    def refresh(self):
+        """Queue transitions of users whose shares were edited by other worker processes"""
+        from plex_service import clear_share_changes, share_changes_after
+
+        with self.app.app_context():
+            last_id, plex_user_ids = share_changes_after(self._change_cursor)
+            if last_id == self._change_cursor:
+                return
+            clear_share_changes(last_id)
+            db.session.commit()
+        self._change_cursor = last_id
+        # Consumed even when not event-driven, so the log does not grow
+        if self.enabled:
+            logger.info(f"Shares of {len(plex_user_ids)} users changed in other workers")
+            self.notify_users_changed(plex_user_ids)
+
+    def next_transition(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _schedule_next(self):
+        when = self.next_transition()
+        if when is None:
+            if self.scheduler.get_job(self.JOB_ID):
+                self.scheduler.remove_job(self.JOB_ID)
+            return
+        self.scheduler.add_job(
+            func=self.run_due,
+            trigger='date',
+            run_date=when,
+            id=self.JOB_ID,
+            # Rebuilt from the share dates on every start, no need to persist
+            jobstore='memory',
+            replace_existing=True,
+            misfire_grace_time=None,
+        )
+
+    def run_due(self):
+        """Reconcile the users whose transitions are due, then schedule the next one"""
+        now = datetime.now()
+        due_users = set()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                self._queued.discard(entry)
+                due_users.add(entry[1])
+
+        if due_users:
+            logger.info(f"Share transitions due for {len(due_users)} users")
+            retry = None
+            try:
+                with self.app.app_context():
+                    job, created = self.job_runner.enqueue(
+                        'check_schedules', {'user_ids': sorted(due_users)}, created_by='scheduler'
+                    )
+                    job_id = job.id
+                if created:
+                    summary = self.job_runner.wait(job_id)
+                    if summary is None or summary['failed'] > 0:
+                        retry = RETRY_DELAY
+                else:
+                    # The active run may have read the shares before they changed
+                    logger.info(f"Reconciliation #{job_id} already active, retrying transitions later")
+                    retry = BUSY_RETRY_DELAY
+            except Exception as e:
+                logger.error(f"Transition reconciliation failed: {str(e)}")
+                retry = RETRY_DELAY
+            if retry:
+                # Users already in sync are skipped on retry, so requeue them all
+                retry_at = datetime.now() + retry
+                self._push((retry_at, plex_user_id) for plex_user_id in due_users)
+
+        if self.enabled:
+            self._schedule_next()
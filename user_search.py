@@ -0,0 +1,89 @@
+"""
+Paginated, sorted and filtered PlexUser listings for the dashboard.
+
+Pages are fetched with LIMIT/OFFSET over the NOCASE indexes on username and
+email, so rendering a page costs the same however many friends exist.
+Typeahead lookups use the plex_user_fts full-text index (migration 4) and
+fall back to LIKE when SQLite has no FTS5 support.
+"""
+from database import db
+from models import PlexUser
+from sqlalchemy import collate, or_, select, text
+import re
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+TYPEAHEAD_LIMIT = 10
+
+# Sort keys accepted from the query string
+SORT_COLUMNS = {
+    'username': collate(PlexUser.username, 'NOCASE'),
+    'email': collate(PlexUser.email, 'NOCASE'),
+    'id': PlexUser.id,
+}
+
+
+def escape_like(value):
+    """Escape LIKE wildcards in user input"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_plex_users(search=None, sort='username', order='asc', page=1, per_page=DEFAULT_PER_PAGE):
+    """Return a Flask-SQLAlchemy Pagination of PlexUsers matching search"""
+    column = SORT_COLUMNS.get(sort, SORT_COLUMNS['username'])
+    query = select(PlexUser)
+
+    search = (search or '').strip()
+    if search:
+        pattern = f'%{escape_like(search)}%'
+        query = query.where(or_(
+            PlexUser.username.ilike(pattern, escape='\\'),
+            PlexUser.email.ilike(pattern, escape='\\'),
+        ))
+
+    # Ties are broken by id so that rows never move between pages
+    if order == 'desc':
+        query = query.order_by(column.desc(), PlexUser.id.desc())
+    else:
+        query = query.order_by(column.asc(), PlexUser.id.asc())
+
+    return db.paginate(query, page=page, per_page=per_page, max_per_page=MAX_PER_PAGE, error_out=False)
+
+
+def plex_user_to_dict(user):
+    return {
+        'id': user.id,
+        'plex_id': user.plex_id,
+        'username': user.username,
+        'email': user.email,
+        'thumb': user.thumb,
+    }
+
+
+def fts_available():
+    """True if the plex_user_fts index exists"""
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plex_user_fts'")
+    ).first() is not None
+
+
+def fts_query(term):
+    """FTS5 query matching rows where every word of term starts a token"""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', term))
+
+
+def typeahead_plex_users(term, limit=TYPEAHEAD_LIMIT):
+    """Best matches for a partial username or email, most relevant first"""
+    query = fts_query(term or '')
+    if not query:
+        return []
+    if not fts_available():
+        return search_plex_users(search=term, per_page=limit).items
+
+    statement = text(
+        'SELECT plex_user.* FROM plex_user_fts JOIN plex_user ON plex_user.id = plex_user_fts.rowid '
+        'WHERE plex_user_fts MATCH :query ORDER BY plex_user_fts.rank, plex_user.id LIMIT :limit'
+    )
+    return db.session.scalars(
+        select(PlexUser).from_statement(statement), {'query': query, 'limit': limit}
+    ).all()
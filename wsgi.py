@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker process prepares the database (bootstrap is serialized by a file
+lock) and then competes for the scheduler lock, so requests are served by all
+workers while scheduled reconciliations run in exactly one of them.
+"""
+from app import app, bootstrap, metrics_store, scheduler_leader
+
+bootstrap()
+scheduler_leader.start()
+# Share this worker's metrics so that /metrics reports all of them
+metrics_store.start()